@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+extract_schema.py 离线基准测试
+
+用 SQLite 支撑的假驱动（psycopg2 / pymysql / dmPython / neo4j / pymilvus / elasticsearch）
+替代真实数据库，生成 10 ~ 50k 张表的合成 schema，逐个运行 extract_*_schema，
+统计往返次数、耗时、峰值内存，并校验提取结果。
+
+无需任何数据库或第三方驱动，可用于离线验证批量查询 / 流式输出等优化。
+
+用法:
+  python bench_extract_schema.py                          # 默认规模 10,1000,10000
+  python bench_extract_schema.py --sizes 10,50000 --only pg,mysql
+  python bench_extract_schema.py --format stream          # 同时计入输出写入成本
+  python bench_extract_schema.py --json bench.json        # 结果另存为 JSON
+  python bench_extract_schema.py --qps 10 --load 100      # 验证限流器在服务端繁忙时降速
+"""
+import re
+import sys
+import json
+import time
+import types
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import extract_schema  # noqa: E402
+
+SCHEMA = 'public'
+DM_OWNER = 'BENCH'
+COLUMN_TYPES = ['integer', 'bigint', 'character varying', 'text', 'timestamp', 'numeric', 'boolean', 'jsonb']
+
+
+# ========== 合成 catalog ==========
+
+class Catalog:
+    """SQLite 中的合成 catalog，所有假驱动共享；calls 记录往返次数"""
+
+    def __init__(self, tables: int, columns: int, latency: float = 0.0, load: int = 1):
+        self.tables = tables
+        self.columns = columns
+        self.latency = latency  # 模拟每次往返的网络 + 服务端耗时（秒）
+        self.load = load        # 负载探测返回的活跃会话数 / rejected 增量
+        self.calls = 0
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE t (name TEXT PRIMARY KEY);
+            CREATE TABLE c (table_name TEXT, ordinal INTEGER, name TEXT, type TEXT,
+                            nullable TEXT, dflt TEXT, comment TEXT,
+                            PRIMARY KEY (table_name, ordinal));
+        """)
+        names = [f"t_{i:05d}" for i in range(tables)]
+        self.db.executemany("INSERT INTO t VALUES (?)", ((n,) for n in names))
+        self.db.executemany(
+            "INSERT INTO c VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((n, j, 'id' if j == 0 else f"col_{j}", COLUMN_TYPES[j % len(COLUMN_TYPES)],
+              'NO' if j == 0 else 'YES', None, f"{n} 第 {j} 列")
+             for n in names for j in range(columns)))
+        self.db.commit()
+
+    def round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table_names(self):
+        self.round_trip()
+        return [r[0] for r in self.db.execute("SELECT name FROM t ORDER BY name")]
+
+    def column_rows(self, table):
+        self.round_trip()
+        return self.db.execute(
+            "SELECT name, type, nullable, dflt, comment FROM c WHERE table_name = ? ORDER BY ordinal",
+            (table,)).fetchall()
+
+
+# ========== 假驱动 ==========
+
+class _Cursor:
+    def __init__(self, catalog, dialect):
+        self.catalog = catalog
+        self.dialect = dialect
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        text = ' '.join(sql.split())
+        cat = self.catalog
+        if self.dialect == 'pg':
+            if 'information_schema.tables' in text:
+                self.rows = [(n,) for n in cat.table_names()]
+            elif 'information_schema.columns' in text:
+                self.rows = cat.column_rows(params[1])
+            elif 'pg_stat_activity' in text:
+                cat.round_trip()
+                self.rows = [(cat.load,)]
+            else:
+                cat.round_trip()
+                self.rows = []
+        elif self.dialect == 'mysql':
+            m = re.match(r"SHOW FULL COLUMNS FROM `(.+)`", text)
+            if text == 'SHOW TABLES':
+                self.rows = [(n,) for n in cat.table_names()]
+            elif m:
+                # Field, Type, Collation, Null, Key, Default, Extra, Privileges, Comment
+                self.rows = [(r[0], r[1], None, r[2], 'PRI' if r[0] == 'id' else '', r[3], '', 'select', r[4])
+                             for r in cat.column_rows(m.group(1))]
+            elif 'Threads_running' in text:
+                cat.round_trip()
+                self.rows = [('Threads_running', str(cat.load))]
+            else:
+                cat.round_trip()
+                self.rows = []
+        elif self.dialect == 'dm':
+            m = re.search(r"TABLE_NAME = '([^']+)'", text)
+            if 'FROM DBA_TABLES' in text:
+                self.rows = [(n,) for n in cat.table_names()]
+            elif 'DBA_TAB_COLUMNS' in text and m:
+                self.rows = cat.column_rows(m.group(1))
+            elif 'V$SESSIONS' in text:
+                cat.round_trip()
+                self.rows = [(cat.load,)]
+            else:
+                cat.round_trip()
+                self.rows = []
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, catalog, dialect):
+        self.catalog = catalog
+        self.dialect = dialect
+
+    def cursor(self):
+        return _Cursor(self.catalog, self.dialect)
+
+    def close(self):
+        pass
+
+
+def _sql_module(name, catalog, dialect):
+    mod = types.ModuleType(name)
+    mod.connect = lambda *a, **kw: _Connection(catalog, dialect)
+    return mod
+
+
+def _neo4j_module(catalog):
+    class _Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def data(self):
+            return self.rows
+
+    class _Session:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def run(self, query, **params):
+            catalog.round_trip()
+            n = catalog.tables
+            if 'db.labels' in query:
+                return _Result([{'label': f"Label{i}"} for i in range(n)])
+            if 'db.relationshipTypes' in query:
+                return _Result([{'relationshipType': f"REL_{i}"} for i in range(max(n // 2, 1))])
+            if 'db.propertyKeys' in query:
+                return _Result([{'propertyKey': f"prop_{i}"} for i in range(catalog.columns * 4)])
+            return _Result([])
+
+    class _Driver:
+        def session(self, **kw):
+            return _Session()
+
+        def close(self):
+            pass
+
+    mod = types.ModuleType('neo4j')
+    mod.GraphDatabase = types.SimpleNamespace(driver=lambda *a, **kw: _Driver())
+    return mod
+
+
+def _pymilvus_module(catalog):
+    class _Field:
+        def __init__(self, name, dtype, dim=None):
+            self.name, self.dtype = name, dtype
+            if dim is not None:
+                self.dim = dim
+
+    class Collection:
+        def __init__(self, name, **kw):
+            catalog.round_trip()
+            fields = [_Field('id', 'DataType.INT64'), _Field('embedding', 'DataType.FLOAT_VECTOR', 768)]
+            fields += [_Field(f"col_{j}", 'DataType.VARCHAR') for j in range(2, catalog.columns)]
+            self.schema = types.SimpleNamespace(fields=fields, description=f"{name} collection")
+
+    def list_collections(**kw):
+        catalog.round_trip()
+        return [f"c_{i:05d}" for i in range(catalog.tables)]
+
+    mod = types.ModuleType('pymilvus')
+    mod.connections = types.SimpleNamespace(connect=lambda *a, **kw: None, disconnect=lambda *a, **kw: None)
+    mod.utility = types.SimpleNamespace(list_collections=list_collections)
+    mod.Collection = Collection
+    return mod
+
+
+def _elasticsearch_module(catalog):
+    def _mapping(name):
+        props = {'id': {'type': 'keyword'}}
+        props.update({f"col_{j}": {'type': 'text', 'fields': {'raw': {'type': 'keyword'}}}
+                      for j in range(1, catalog.columns)})
+        return {'mappings': {'properties': props}}
+
+    class _Indices:
+        def get_alias(self, index='*', **kw):
+            catalog.round_trip()
+            names = [f"idx_{i:05d}" for i in range(catalog.tables)]
+            return {n: {'aliases': {}} for n in names + ['.kibana']}
+
+        def get_mapping(self, index='*', **kw):
+            catalog.round_trip()
+            if index in ('*', '_all'):
+                return {f"idx_{i:05d}": _mapping(i) for i in range(catalog.tables)}
+            return {index: _mapping(index)}
+
+    class _Nodes:
+        rejected = 0
+
+        def stats(self, metric=None, **kw):
+            catalog.round_trip()
+            self.rejected += catalog.load if catalog.load > extract_schema.BUSY_SESSIONS else 0
+            return {'nodes': {'n1': {'thread_pool': {'search': {'rejected': self.rejected}}}}}
+
+    class Elasticsearch:
+        def __init__(self, *a, **kw):
+            self.indices = _Indices()
+            self.nodes = _Nodes()
+
+    mod = types.ModuleType('elasticsearch')
+    mod.Elasticsearch = Elasticsearch
+    return mod
+
+
+def install_fakes(catalog):
+    """把假驱动注册进 sys.modules，extract_schema 里的 import 会拿到它们"""
+    sys.modules['psycopg2'] = _sql_module('psycopg2', catalog, 'pg')
+    sys.modules['pymysql'] = _sql_module('pymysql', catalog, 'mysql')
+    sys.modules['dmPython'] = _sql_module('dmPython', catalog, 'dm')
+    sys.modules['neo4j'] = _neo4j_module(catalog)
+    sys.modules['pymilvus'] = _pymilvus_module(catalog)
+    sys.modules['elasticsearch'] = _elasticsearch_module(catalog)
+
+
+# ========== 基准 ==========
+
+EXTRACTORS = {
+    'pg': lambda sink, n: extract_schema.extract_pg_schema('fake', 5432, 'bench', 'u', 'p', SCHEMA, sink=sink, max_tables=n),
+    'mysql': lambda sink, n: extract_schema.extract_mysql_schema('fake', 3306, 'bench', 'u', 'p', sink=sink, max_tables=n),
+    'dm': lambda sink, n: extract_schema.extract_dm_schema('fake', 5236, 'bench', DM_OWNER, 'p', DM_OWNER, sink=sink, max_tables=n),
+    'neo4j': lambda sink, n: extract_schema.extract_neo4j_schema('fake', 7687, 'u', 'p', sink=sink),
+    'milvus': lambda sink, n: extract_schema.extract_milvus_schema('fake', 19530, sink=sink),
+    'es': lambda sink, n: extract_schema.extract_es_schema('fake', 9200, sink=sink),
+}
+
+
+def _check(name, data, size, sink):
+    """校验提取结果：无错误，且数量与合成 catalog 一致"""
+    if 'error' in data:
+        return f"error: {data['error']}"
+    if sink is not None:
+        count = sink.count
+    elif name == 'neo4j':
+        count = len(data.get('labels', []))
+    else:
+        count = len(data.get('tables') or data.get('collections') or data.get('indices') or {})
+    expected = 1 if sink is not None and name == 'neo4j' else size
+    return 'ok' if count == expected else f"count {count} != {expected}"
+
+
+def _run_once(name, catalog, size, fmt, out_dir):
+    sink = extract_schema.StreamingSchemaWriter(out_dir, name) if fmt == 'stream' else None
+    data = EXTRACTORS[name](sink, size)
+    if sink is not None:
+        sink.close(data)
+    elif fmt == 'md':
+        extract_schema.generate_markdown(data, out_dir / f"{name}_schema.md")
+        with open(out_dir / f"{name}_schema.json", 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    return data, sink
+
+
+def bench(name, size, columns, fmt, qps=0, latency=0.0, load=1):
+    """单个 extractor 在单个规模下的基准：计时一次，再用 tracemalloc 测一次峰值内存"""
+    catalog = Catalog(size, columns, latency, load)
+    install_fakes(catalog)
+    limiter = extract_schema.configure_limiter(qps)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        data, sink = _run_once(name, catalog, size, fmt, Path(tmp))
+        wall = time.perf_counter() - start
+        round_trips = catalog.calls
+        status = _check(name, data, size, sink)
+        del data, sink
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog.latency = 0.0
+        extract_schema.configure_limiter(0)
+        tracemalloc.start()
+        _run_once(name, catalog, size, fmt, Path(tmp))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    catalog.db.close()
+    return {'extractor': name, 'tables': size, 'columns': columns, 'format': fmt,
+            'round_trips': round_trips, 'wall_s': round(wall, 4), 'peak_mb': round(peak / 1024 / 1024, 2),
+            'backoffs': limiter.backoffs, 'status': status}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extract_schema.py 离线基准测试")
+    parser.add_argument("--sizes", default="10,1000,10000", help="合成表数量，逗号分隔（最大建议 50000）")
+    parser.add_argument("--columns", type=int, default=8, help="每张表字段数")
+    parser.add_argument("--only", default=",".join(EXTRACTORS), help="只测指定 extractor，逗号分隔")
+    parser.add_argument("--format", "-f", default="none", choices=['none', 'md', 'stream'], help="是否计入输出写入")
+    parser.add_argument("--qps", type=float, default=0, help="限流 QPS（默认 0=不限速，只测纯开销）")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟每次往返耗时（毫秒）")
+    parser.add_argument("--load", type=int, default=1, help="负载探测返回的活跃会话数（大于 BUSY_SESSIONS 触发降速）")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    names = [n for n in args.only.split(',') if n]
+    unknown = set(names) - set(EXTRACTORS)
+    if unknown:
+        parser.error(f"未知 extractor: {', '.join(sorted(unknown))}")
+
+    print(f"{'extractor':<10} {'tables':>7} {'round_trips':>12} {'wall_s':>9} {'peak_mb':>9} {'backoffs':>9}  status")
+    print("-" * 72)
+    results = []
+    for size in sizes:
+        for name in names:
+            r = bench(name, size, args.columns, args.format, args.qps, args.latency / 1000, args.load)
+            results.append(r)
+            print(f"{r['extractor']:<10} {r['tables']:>7} {r['round_trips']:>12} {r['wall_s']:>9.3f} {r['peak_mb']:>9.2f} {r['backoffs']:>9}  {r['status']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"JSON: {args.json}")
+
+    if any(r['status'] != 'ok' for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@
 安全约束:
   - 只读操作，不执行任何写入
   - 单表最多获取 100 条样本数据
-  - 查询间隔 100ms，避免高频 IO
+  - 令牌桶限流（默认 10 QPS、单并发），慢查询或服务端繁忙时自动降速
   - 总表数限制 20，超过需手动指定
   - 连接超时 10s，查询超时 30s
   - 生产环境建议在从库执行
@@ -17,55 +17,240 @@
   python extract_schema.py --type mysql --host localhost --port 3306 --db mydb --user user --output ./schema/
   python extract_schema.py --type dm --host localhost --port 5236 --db mydb --user user --output ./schema/
   python extract_schema.py --type neo4j --host localhost --port 7687 --user neo4j --output ./schema/
+
+  # 大库：流式输出 NDJSON + 每表一个 Markdown（内存占用恒定）
+  python extract_schema.py --type pg --db mydb --user user --format stream --max-tables 5000 --output ./schema/
+
+  # 建立本地索引（SQLite FTS5），毫秒级查找表 / 字段 / 类型 / 注释
+  python extract_schema.py index ./schema/
+  python extract_schema.py search user_id
+  python extract_schema.py search --column created_at --source mysql
+
+  # 候选查询执行计划（只读 EXPLAIN，不加 ANALYZE），标记全表扫描 / 缺索引 / 行数膨胀
+  python extract_schema.py explain --type pg --db mydb --user user --queries candidates.sql
 """
 import sys
 import json
 import argparse
+import re
+import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
 # ========== 安全限制配置 ==========
 MAX_TABLES = 20           # 最大表数量，超过需手动指定表名
-QUERY_INTERVAL = 0.1      # 查询间隔（秒），避免高频 IO
+MAX_QPS = 10              # 每秒最多查询数（令牌桶速率上限，0=不限速）
+MIN_QPS = 1               # 降速下限
+SLOW_QUERY = 1.0          # 单次查询超过该耗时（秒）视为服务端吃紧，降速
+BUSY_SESSIONS = 32        # 活跃会话 / 运行线程数超过该值视为繁忙，降速
+PROBE_EVERY = 50          # 每 N 次查询探测一次服务端负载
+LARGE_TABLE_ROWS = 100_000  # explain: 全表扫描超过该行数视为大表
+ROW_BLOWUP = 10           # explain: 估算输出行数超过输入 N 倍视为行数膨胀
+DEFAULT_PORTS = {'pg': 5432, 'mysql': 3306, 'dm': 5236, 'neo4j': 7687, 'milvus': 19530, 'es': 9200}
 CONNECT_TIMEOUT = 10      # 连接超时（秒）
 QUERY_TIMEOUT = 30        # 查询超时（秒）
 MAX_SAMPLE_ROWS = 0       # 样本数据条数（0=不获取样本，保守策略）
 
+SQL_TYPES = ('postgresql', 'mysql', 'dameng')
+TYPE_NAMES = {'pg': 'postgresql', 'mysql': 'mysql', 'dm': 'dameng', 'neo4j': 'neo4j', 'milvus': 'milvus', 'es': 'elasticsearch'}
+INDEX_FILE = 'schema_index.db'  # 本地索引文件名（位于 schema 输出目录）
+
+
+class QueryLimiter:
+    """
+    查询限流：令牌桶控制 QPS，所有 extractor 共享
+
+    按 AIMD 自适应：查询慢或服务端繁忙时速率减半，正常时逐步恢复到上限。
+    服务端负载通过 probe 回调获取（返回 True 表示繁忙），探测失败自动停用。
+    不限并发：每个 extractor 在一个连接上顺序查询，同一时刻最多一个查询在执行。
+    """
+
+    def __init__(self, qps=MAX_QPS, slow_query=SLOW_QUERY):
+        self.max_qps = qps
+        self.rate = qps
+        self.slow_query = slow_query
+        self.probe = None
+        self.queries = 0
+        self.backoffs = 0
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take_token(self):
+        """取一个令牌，不足时等待（允许预支，保证先来先得）"""
+        if self.max_qps <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def _backoff(self):
+        self.rate = max(MIN_QPS, self.rate / 2)
+        self.backoffs += 1
+
+    @contextmanager
+    def query(self):
+        """包住一次数据库往返：限速，并记录耗时"""
+        self._take_token()
+        start = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - start)
+
+    def observe(self, latency: float):
+        """根据查询耗时调整速率，并按需探测服务端负载"""
+        if self.max_qps <= 0:
+            return
+        with self._lock:
+            self.queries += 1
+            if latency > self.slow_query:
+                self._backoff()
+            elif self.rate < self.max_qps:
+                self.rate = min(self.max_qps, self.rate + self.max_qps * 0.05)
+            probe_due = self.probe is not None and self.queries % PROBE_EVERY == 0
+        if probe_due:
+            self.check_server()
+
+    def check_server(self):
+        """调用 probe 获取服务端信号；繁忙则降速"""
+        probe = self.probe
+        if probe is None:
+            return
+        try:
+            busy = probe()
+        except Exception:
+            self.probe = None  # 无权限 / 不支持，退回仅按延迟调整
+            return
+        if busy:
+            with self._lock:
+                self._backoff()
+
+
+LIMITER = QueryLimiter()
+
+
+def configure_limiter(qps=MAX_QPS, slow_query=SLOW_QUERY):
+    """替换全局限流器（CLI 参数 / 基准测试使用）"""
+    global LIMITER
+    LIMITER = QueryLimiter(qps, slow_query)
+    return LIMITER
+
+
+def _query(cur, sql, params=None):
+    """经限流器执行一次查询并取回全部结果"""
+    with LIMITER.query():
+        if params is None:
+            cur.execute(sql)
+        else:
+            cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def _sessions_probe(cur, sql):
+    """SQL 类数据库的负载探测：查询返回的计数超过 BUSY_SESSIONS 即繁忙"""
+    def probe():
+        cur.execute(sql)
+        row = cur.fetchall()[0]
+        return int(row[-1]) > BUSY_SESSIONS
+    return probe
+
+
+def _es_rejected_probe(es):
+    """ES 负载探测：search 线程池 rejected 计数自上次探测后有增长即繁忙"""
+    last = [None]
+
+    def probe():
+        stats = es.nodes.stats(metric='thread_pool')
+        rejected = sum(node['thread_pool'].get('search', {}).get('rejected', 0) for node in stats['nodes'].values())
+        busy = last[0] is not None and rejected > last[0]
+        last[0] = rejected
+        return busy
+    return probe
+
+
+def _emit(result, key, name, info, sink=None):
+    """记录一张表：有 sink 时直接流式写出，不在内存中保留"""
+    if sink is None:
+        result[key][name] = info
+    else:
+        sink.write_table(name, info)
+
+
+# ========== 连接（extract / explain 共用） ==========
+
+def _connect_pg(host, port, db, user, password):
+    import psycopg2
+    conn = psycopg2.connect(
+        host=host, port=port, database=db, user=user, password=password,
+        connect_timeout=CONNECT_TIMEOUT
+    )
+    conn.autocommit = True  # 只读查询，避免探测失败让事务进入 aborted 状态
+    return conn
+
+
+def _connect_mysql(host, port, db, user, password):
+    import pymysql
+    return pymysql.connect(
+        host=host, port=int(port), database=db, user=user, password=password,
+        connect_timeout=CONNECT_TIMEOUT, read_timeout=QUERY_TIMEOUT
+    )
+
+
+def _connect_dm(host, port, user, password):
+    import dmPython
+    return dmPython.connect(host=host, port=int(port), user=user, password=password)
+
+
+def _connect_neo4j(host, port, user, password):
+    from neo4j import GraphDatabase
+    return GraphDatabase.driver(f"bolt://{host}:{port}", auth=(user, password))
+
 
-def extract_pg_schema(host, port, db, user, password, schema='public'):
+def _connect_es(host, port, user=None, password=None):
+    from elasticsearch import Elasticsearch
+    if user and password:
+        return Elasticsearch([f"http://{host}:{port}"], basic_auth=(user, password))
+    return Elasticsearch([f"http://{host}:{port}"])
+
+
+def extract_pg_schema(host, port, db, user, password, schema='public', sink=None, max_tables=MAX_TABLES):
     """PostgreSQL schema 提取"""
     try:
-        import psycopg2
-        conn = psycopg2.connect(
-            host=host, port=port, database=db, user=user, password=password,
-            connect_timeout=CONNECT_TIMEOUT
-        )
+        conn = _connect_pg(host, port, db, user, password)
         cur = conn.cursor()
+        LIMITER.probe = _sessions_probe(conn.cursor(), "SELECT count(*) FROM pg_stat_activity WHERE state = 'active'")
         
         # 获取所有表
-        cur.execute("""
+        tables = [row[0] for row in _query(cur, """
             SELECT table_name FROM information_schema.tables 
             WHERE table_schema = %s AND table_type = 'BASE TABLE'
-        """, (schema,))
-        tables = [row[0] for row in cur.fetchall()]
+        """, (schema,))]
         
         # 安全检查：表数量限制
-        if len(tables) > MAX_TABLES:
-            return {'error': f'表数量 {len(tables)} 超过限制 {MAX_TABLES}，请手动指定表名', 'tables_found': tables[:50]}
+        if len(tables) > max_tables:
+            return {'error': f'表数量 {len(tables)} 超过限制 {max_tables}，请手动指定表名', 'tables_found': tables[:50]}
         
         result = {'type': 'postgresql', 'database': db, 'schema': schema, 'tables': {}, 'table_count': len(tables)}
+        if sink is not None:
+            sink.begin(result)
         
         for table in tables:
-            cur.execute("""
-                SELECT column_name, data_type, is_nullable, column_default
+            rows = _query(cur, """
+                SELECT column_name, data_type, is_nullable, column_default,
+                       col_description(format('%%I.%%I', table_schema, table_name)::regclass, ordinal_position)
                 FROM information_schema.columns 
                 WHERE table_schema = %s AND table_name = %s
                 ORDER BY ordinal_position
             """, (schema, table))
-            columns = [{'name': r[0], 'type': r[1], 'nullable': r[2], 'default': r[3]} for r in cur.fetchall()]
-            result['tables'][table] = {'columns': columns}
-            time.sleep(QUERY_INTERVAL)  # 查询间隔，避免高频 IO
+            columns = [{'name': r[0], 'type': r[1], 'nullable': r[2], 'default': r[3], 'comment': r[4]} for r in rows]
+            _emit(result, 'tables', table, {'columns': columns}, sink)
         
         conn.close()
         return result
@@ -73,30 +258,29 @@ def extract_pg_schema(host, port, db, user, password, schema='public'):
         return {'error': str(e)}
 
 
-def extract_mysql_schema(host, port, db, user, password):
+def extract_mysql_schema(host, port, db, user, password, sink=None, max_tables=MAX_TABLES):
     """MySQL schema 提取"""
     try:
-        import pymysql
-        conn = pymysql.connect(
-            host=host, port=int(port), database=db, user=user, password=password,
-            connect_timeout=CONNECT_TIMEOUT, read_timeout=QUERY_TIMEOUT
-        )
+        conn = _connect_mysql(host, port, db, user, password)
         cur = conn.cursor()
+        LIMITER.probe = _sessions_probe(conn.cursor(), "SHOW GLOBAL STATUS LIKE 'Threads_running'")
         
-        cur.execute("SHOW TABLES")
-        tables = [row[0] for row in cur.fetchall()]
+        tables = [row[0] for row in _query(cur, "SHOW TABLES")]
         
         # 安全检查：表数量限制
-        if len(tables) > MAX_TABLES:
-            return {'error': f'表数量 {len(tables)} 超过限制 {MAX_TABLES}，请手动指定表名', 'tables_found': tables[:50]}
+        if len(tables) > max_tables:
+            return {'error': f'表数量 {len(tables)} 超过限制 {max_tables}，请手动指定表名', 'tables_found': tables[:50]}
         
         result = {'type': 'mysql', 'database': db, 'tables': {}, 'table_count': len(tables)}
+        if sink is not None:
+            sink.begin(result)
         
         for table in tables:
-            cur.execute(f"DESCRIBE `{table}`")
-            columns = [{'name': r[0], 'type': r[1], 'nullable': r[2], 'key': r[3], 'default': r[4]} for r in cur.fetchall()]
-            result['tables'][table] = {'columns': columns}
-            time.sleep(QUERY_INTERVAL)  # 查询间隔，避免高频 IO
+            # SHOW FULL COLUMNS: Field, Type, Collation, Null, Key, Default, Extra, Privileges, Comment
+            rows = _query(cur, f"SHOW FULL COLUMNS FROM `{table}`")
+            columns = [{'name': r[0], 'type': r[1], 'nullable': r[3], 'key': r[4], 'default': r[5], 'comment': r[8]}
+                       for r in rows]
+            _emit(result, 'tables', table, {'columns': columns}, sink)
         
         conn.close()
         return result
@@ -104,37 +288,39 @@ def extract_mysql_schema(host, port, db, user, password):
         return {'error': str(e)}
 
 
-def extract_dm_schema(host, port, db, user, password, schema=None):
+def extract_dm_schema(host, port, db, user, password, schema=None, sink=None, max_tables=MAX_TABLES):
     """达梦数据库 schema 提取"""
     try:
-        import dmPython
-        conn = dmPython.connect(host=host, port=int(port), user=user, password=password)
+        conn = _connect_dm(host, port, user, password)
         cur = conn.cursor()
         
         schema = schema or user.upper()
+        LIMITER.probe = _sessions_probe(conn.cursor(), "SELECT COUNT(*) FROM V$SESSIONS WHERE STATE = 'ACTIVE'")
         
         # 获取所有表
-        cur.execute(f"""
+        tables = [row[0] for row in _query(cur, f"""
             SELECT TABLE_NAME FROM DBA_TABLES WHERE OWNER = '{schema}'
-        """)
-        tables = [row[0] for row in cur.fetchall()]
+        """)]
         
         # 安全检查：表数量限制
-        if len(tables) > MAX_TABLES:
-            return {'error': f'表数量 {len(tables)} 超过限制 {MAX_TABLES}，请手动指定表名', 'tables_found': tables[:50]}
+        if len(tables) > max_tables:
+            return {'error': f'表数量 {len(tables)} 超过限制 {max_tables}，请手动指定表名', 'tables_found': tables[:50]}
         
         result = {'type': 'dameng', 'database': db, 'schema': schema, 'tables': {}, 'table_count': len(tables)}
+        if sink is not None:
+            sink.begin(result)
         
         for table in tables:
-            cur.execute(f"""
-                SELECT COLUMN_NAME, DATA_TYPE, NULLABLE, DATA_DEFAULT
-                FROM DBA_TAB_COLUMNS 
-                WHERE OWNER = '{schema}' AND TABLE_NAME = '{table}'
-                ORDER BY COLUMN_ID
+            rows = _query(cur, f"""
+                SELECT c.COLUMN_NAME, c.DATA_TYPE, c.NULLABLE, c.DATA_DEFAULT, m.COMMENTS
+                FROM DBA_TAB_COLUMNS c
+                LEFT JOIN DBA_COL_COMMENTS m
+                  ON m.OWNER = c.OWNER AND m.TABLE_NAME = c.TABLE_NAME AND m.COLUMN_NAME = c.COLUMN_NAME
+                WHERE c.OWNER = '{schema}' AND c.TABLE_NAME = '{table}'
+                ORDER BY c.COLUMN_ID
             """)
-            columns = [{'name': r[0], 'type': r[1], 'nullable': r[2], 'default': r[3]} for r in cur.fetchall()]
-            result['tables'][table] = {'columns': columns}
-            time.sleep(QUERY_INTERVAL)  # 查询间隔，避免高频 IO
+            columns = [{'name': r[0], 'type': r[1], 'nullable': r[2], 'default': r[3], 'comment': r[4]} for r in rows]
+            _emit(result, 'tables', table, {'columns': columns}, sink)
         
         conn.close()
         return result
@@ -144,48 +330,58 @@ def extract_dm_schema(host, port, db, user, password, schema=None):
         return {'error': str(e)}
 
 
-def extract_neo4j_schema(host, port, user, password):
+def extract_neo4j_schema(host, port, user, password, sink=None):
     """Neo4j schema 提取（节点标签和关系类型）"""
     try:
-        from neo4j import GraphDatabase
-        uri = f"bolt://{host}:{port}"
-        driver = GraphDatabase.driver(uri, auth=(user, password))
+        driver = _connect_neo4j(host, port, user, password)
+        LIMITER.probe = None  # Neo4j 只按查询延迟调整
         
         result = {'type': 'neo4j', 'labels': [], 'relationships': [], 'properties': {}}
         
         with driver.session() as session:
             # 获取所有标签
-            labels = session.run("CALL db.labels()").data()
+            with LIMITER.query():
+                labels = session.run("CALL db.labels()").data()
             result['labels'] = [l['label'] for l in labels]
             
             # 获取所有关系类型
-            rels = session.run("CALL db.relationshipTypes()").data()
+            with LIMITER.query():
+                rels = session.run("CALL db.relationshipTypes()").data()
             result['relationships'] = [r['relationshipType'] for r in rels]
             
             # 获取属性 keys
-            props = session.run("CALL db.propertyKeys()").data()
+            with LIMITER.query():
+                props = session.run("CALL db.propertyKeys()").data()
             result['property_keys'] = [p['propertyKey'] for p in props]
         
         driver.close()
+        if sink is not None:
+            sink.begin(result)
+            sink.write_table('graph', {k: result[k] for k in ('labels', 'relationships', 'property_keys')})
         return result
     except Exception as e:
         return {'error': str(e)}
 
 
-def extract_milvus_schema(host, port):
+def extract_milvus_schema(host, port, sink=None):
     """Milvus collection schema 提取"""
     try:
         from pymilvus import connections, utility, Collection
         connections.connect(host=host, port=port)
         
-        collections = utility.list_collections()
-        result = {'type': 'milvus', 'collections': {}}
+        LIMITER.probe = None  # Milvus 只按查询延迟调整
+        with LIMITER.query():
+            collections = utility.list_collections()
+        result = {'type': 'milvus', 'collections': {}, 'collection_count': len(collections)}
+        if sink is not None:
+            sink.begin(result)
         
         for coll_name in collections:
-            coll = Collection(coll_name)
+            with LIMITER.query():
+                coll = Collection(coll_name)
             schema = coll.schema
             fields = [{'name': f.name, 'type': str(f.dtype), 'dim': getattr(f, 'dim', None)} for f in schema.fields]
-            result['collections'][coll_name] = {'fields': fields, 'description': schema.description}
+            _emit(result, 'collections', coll_name, {'fields': fields, 'description': schema.description}, sink)
         
         connections.disconnect("default")
         return result
@@ -193,28 +389,55 @@ def extract_milvus_schema(host, port):
         return {'error': str(e)}
 
 
-def extract_es_schema(host, port, user=None, password=None):
+def extract_es_schema(host, port, user=None, password=None, sink=None):
     """Elasticsearch index mapping 提取"""
     try:
-        from elasticsearch import Elasticsearch
-        if user and password:
-            es = Elasticsearch([f"http://{host}:{port}"], basic_auth=(user, password))
-        else:
-            es = Elasticsearch([f"http://{host}:{port}"])
+        es = _connect_es(host, port, user, password)
         
-        indices = es.indices.get_alias(index="*")
+        LIMITER.probe = _es_rejected_probe(es)
+        LIMITER.check_server()  # 记录 rejected 基线
+        with LIMITER.query():
+            indices = es.indices.get_alias(index="*")
         result = {'type': 'elasticsearch', 'indices': {}}
+        if sink is not None:
+            sink.begin(result)
         
         for index_name in indices.keys():
             if not index_name.startswith('.'):
-                mapping = es.indices.get_mapping(index=index_name)
-                result['indices'][index_name] = mapping[index_name]['mappings']
+                with LIMITER.query():
+                    mapping = es.indices.get_mapping(index=index_name)
+                _emit(result, 'indices', index_name, mapping[index_name]['mappings'], sink)
         
         return result
     except Exception as e:
         return {'error': str(e)}
 
 
+def _render_entry_md(db_type: str, name: str, info: dict) -> str:
+    """渲染单张表 / collection / index 的 Markdown 段落"""
+    if db_type in SQL_TYPES:
+        lines = [f"## {name}\n\n", "| 字段 | 类型 | 可空 | 默认值 |\n", "|------|------|------|--------|\n"]
+        lines.extend(f"| {col['name']} | {col['type']} | {col.get('nullable', '')} | {col.get('default', '')} |\n"
+                     for col in info['columns'])
+        lines.append("\n")
+    elif db_type == 'neo4j':
+        lines = ["## 节点标签\n\n"]
+        lines.extend(f"- `:{label}`\n" for label in info.get('labels', []))
+        lines.append("\n## 关系类型\n\n")
+        lines.extend(f"- `[:{rel}]`\n" for rel in info.get('relationships', []))
+        lines.append("\n## 属性 Keys\n\n")
+        lines.extend(f"- `{prop}`\n" for prop in info.get('property_keys', []))
+    elif db_type == 'milvus':
+        lines = [f"## {name}\n\n", f"描述: {info.get('description', 'N/A')}\n\n", "| 字段 | 类型 | 维度 |\n", "|------|------|------|\n"]
+        lines.extend(f"| {field['name']} | {field['type']} | {field.get('dim', '-')} |\n" for field in info['fields'])
+        lines.append("\n")
+    elif db_type == 'elasticsearch':
+        lines = [f"## {name}\n\n", "```json\n", json.dumps(info, indent=2, ensure_ascii=False, default=str), "\n```\n\n"]
+    else:
+        lines = []
+    return ''.join(lines)
+
+
 def generate_markdown(schema_data: dict, output_path: Path):
     """生成 Markdown 格式的 schema 文档"""
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -229,91 +452,728 @@ def generate_markdown(schema_data: dict, output_path: Path):
             f.write(f"**错误**: {schema_data['error']}\n")
             return
         
-        if db_type in ('postgresql', 'mysql', 'dameng'):
+        if db_type in SQL_TYPES:
             f.write(f"数据库: `{schema_data.get('database', 'N/A')}`\n\n")
             for table, info in schema_data.get('tables', {}).items():
-                f.write(f"## {table}\n\n")
-                f.write("| 字段 | 类型 | 可空 | 默认值 |\n")
-                f.write("|------|------|------|--------|\n")
-                for col in info['columns']:
-                    f.write(f"| {col['name']} | {col['type']} | {col.get('nullable', '')} | {col.get('default', '')} |\n")
-                f.write("\n")
+                f.write(_render_entry_md(db_type, table, info))
         
         elif db_type == 'neo4j':
-            f.write("## 节点标签\n\n")
-            for label in schema_data.get('labels', []):
-                f.write(f"- `:{label}`\n")
-            f.write("\n## 关系类型\n\n")
-            for rel in schema_data.get('relationships', []):
-                f.write(f"- `[:{rel}]`\n")
-            f.write("\n## 属性 Keys\n\n")
-            for prop in schema_data.get('property_keys', []):
-                f.write(f"- `{prop}`\n")
+            f.write(_render_entry_md(db_type, 'graph', schema_data))
         
         elif db_type == 'milvus':
             for coll, info in schema_data.get('collections', {}).items():
-                f.write(f"## {coll}\n\n")
-                f.write(f"描述: {info.get('description', 'N/A')}\n\n")
-                f.write("| 字段 | 类型 | 维度 |\n")
-                f.write("|------|------|------|\n")
-                for field in info['fields']:
-                    f.write(f"| {field['name']} | {field['type']} | {field.get('dim', '-')} |\n")
-                f.write("\n")
+                f.write(_render_entry_md(db_type, coll, info))
         
         elif db_type == 'elasticsearch':
             for index, mapping in schema_data.get('indices', {}).items():
-                f.write(f"## {index}\n\n")
-                f.write("```json\n")
-                f.write(json.dumps(mapping, indent=2, ensure_ascii=False))
-                f.write("\n```\n\n")
+                f.write(_render_entry_md(db_type, index, mapping))
 
 
-def main():
-    parser = argparse.ArgumentParser(description="数据库 Schema 提取工具")
-    parser.add_argument("--type", "-t", required=True, choices=['pg', 'mysql', 'dm', 'neo4j', 'milvus', 'es'], help="数据库类型")
+class StreamingSchemaWriter:
+    """
+    流式 schema 输出，内存占用与表数量无关
+
+    - {type}_schema.ndjson: 每行一张表（带 type/database/schema），下游可按需加载
+    - {type}_schema/<表名>.md: 每张表 / collection / index 一个 Markdown 文件
+    - {type}_schema/INDEX.md: 轻量索引，表名 → 文件
+    """
+
+    def __init__(self, output_dir: Path, name: str):
+        self.output_dir = output_dir
+        self.name = name
+        self.md_dir = output_dir / f"{name}_schema"
+        self.ndjson_path = output_dir / f"{name}_schema.ndjson"
+        self.index_path = self.md_dir / "INDEX.md"
+        self.db_type = 'unknown'
+        self.meta = {}
+        self.count = 0
+        self._used_files = set()
+        self._ndjson = None
+        self._index = None
+
+    def begin(self, meta: dict):
+        """写入文件头，extractor 拿到库信息后调用"""
+        self.db_type = meta.get('type', 'unknown')
+        self.meta = {k: meta[k] for k in ('type', 'database', 'schema') if meta.get(k) is not None}
+        self.md_dir.mkdir(parents=True, exist_ok=True)
+        self._ndjson = open(self.ndjson_path, 'w', encoding='utf-8')
+        self._index = open(self.index_path, 'w', encoding='utf-8')
+        self._index.write(f"# {self.db_type.upper()} Schema 索引\n\n")
+        self._index.write(f"提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        if self.db_type in SQL_TYPES:
+            self._index.write(f"数据库: `{meta.get('database', 'N/A')}`\n\n")
+        self._index.write("| 名称 | 字段数 | 文件 |\n|------|--------|------|\n")
+
+    def _file_name(self, name: str) -> str:
+        """表名 → 安全文件名（大小写不敏感文件系统下也不冲突）"""
+        base = re.sub(r'[^\w.-]', '_', str(name)) or '_'
+        candidate, n = base, 1
+        while candidate.lower() in self._used_files:
+            n += 1
+            candidate = f"{base}_{n}"
+        self._used_files.add(candidate.lower())
+        return f"{candidate}.md"
+
+    def write_table(self, name: str, info: dict):
+        """写出一张表：NDJSON 一行 + 一个 Markdown 文件 + 索引一行"""
+        if self._ndjson is None:
+            self.begin({'type': self.db_type})
+        record = dict(self.meta, name=name)
+        record.update(info)
+        self._ndjson.write(json.dumps(record, ensure_ascii=False, default=str, separators=(',', ':')))
+        self._ndjson.write("\n")
+
+        file_name = self._file_name(name)
+        with open(self.md_dir / file_name, 'w', encoding='utf-8') as f:
+            f.write(f"# {self.db_type.upper()} · {name}\n\n")
+            f.write(_render_entry_md(self.db_type, name, info))
+
+        fields = info.get('columns') or info.get('fields') or info.get('properties') or ()
+        self._index.write(f"| {name} | {len(fields)} | [{file_name}]({file_name}) |\n")
+        self.count += 1
+
+    def close(self, schema_data: dict):
+        """写入文件尾并关闭；提取失败时把错误记录到索引"""
+        if self._index is None:
+            self.begin(schema_data)
+        if 'error' in schema_data:
+            self._index.write(f"\n**错误**: {schema_data['error']}\n")
+        else:
+            self._index.write(f"\n共 {self.count} 项\n")
+        self._ndjson.close()
+        self._index.close()
+
+
+# ========== 本地 Schema 索引 ==========
+
+_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL,
+    db_type TEXT NOT NULL,
+    database TEXT,
+    schema_name TEXT,
+    kind TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    column_name TEXT,
+    column_type TEXT,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_source ON entries(source_id);
+CREATE INDEX IF NOT EXISTS idx_entries_table ON entries(table_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_entries_column ON entries(column_name COLLATE NOCASE);
+"""
+
+_FTS_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    table_name, column_name, column_type, comment,
+    content='entries', content_rowid='id', tokenize='trigram'
+)
+"""
+
+
+def open_index(db_path: Path) -> sqlite3.Connection:
+    """打开（必要时创建）本地索引库。trigram 分词可直接匹配中文子串（如注释里的"编号"）"""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_INDEX_DDL)
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries_fts'").fetchone()
+    if row and 'trigram' not in row[0]:
+        # 旧版索引用 unicode61 分词：换成 trigram 后从 entries 重建
+        with conn:
+            conn.execute("DROP TABLE entries_fts")
+            conn.execute(_FTS_DDL)
+            conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+    conn.execute(_FTS_DDL)
+    return conn
+
+
+def _iter_schema_records(path: Path):
+    """读取 extractor 输出（*_schema.json 或 *_schema.ndjson），逐项产出 (meta, name, info)"""
+    if path.suffix == '.ndjson':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                meta = {k: record.pop(k, None) for k in ('type', 'database', 'schema')}
+                yield meta, record.pop('name', ''), record
+        return
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if 'error' in data:
+        return
+    meta = {k: data.get(k) for k in ('type', 'database', 'schema')}
+    if meta['type'] == 'neo4j':
+        yield meta, 'graph', data
+        return
+    for key in ('tables', 'collections', 'indices'):
+        for name, info in data.get(key, {}).items():
+            yield meta, name, info
+
+
+def _walk_es_properties(properties: dict, prefix: str = ''):
+    """展开 ES mapping 的嵌套 properties / multi-fields 为点分路径"""
+    for field, spec in properties.items():
+        path = f"{prefix}{field}"
+        yield path, spec.get('type', 'object')
+        if 'properties' in spec:
+            yield from _walk_es_properties(spec['properties'], f"{path}.")
+        for sub, sub_spec in spec.get('fields', {}).items():
+            yield f"{path}.{sub}", sub_spec.get('type')
+
+
+def _entries_for(meta: dict, name: str, info: dict):
+    """把一张表 / collection / index / 图谱展开成索引行"""
+    db_type = meta.get('type') or 'unknown'
+    base = (db_type, meta.get('database'), meta.get('schema'))
+
+    if db_type in SQL_TYPES:
+        for col in info.get('columns', []):
+            yield base + ('column', name, col['name'], col.get('type'), col.get('comment'))
+        if not info.get('columns'):
+            yield base + ('table', name, None, None, None)
+    elif db_type == 'milvus':
+        for field in info.get('fields', []):
+            yield base + ('field', name, field['name'], field.get('type'), info.get('description'))
+    elif db_type == 'elasticsearch':
+        properties = info.get('properties')
+        if properties is None:  # 旧版 ES 的 mappings 下还有一层 type
+            properties = next((v.get('properties', {}) for v in info.values() if isinstance(v, dict)), {})
+        for path, field_type in _walk_es_properties(properties):
+            yield base + ('field', name, path, field_type, None)
+    elif db_type == 'neo4j':
+        for label in info.get('labels', []):
+            yield base + ('label', f":{label}", None, None, None)
+        for rel in info.get('relationships', []):
+            yield base + ('relationship', f"[:{rel}]", None, None, None)
+        for prop in info.get('property_keys', []):
+            yield base + ('property', '*', prop, None, None)
+
+
+def build_index(paths, db_path: Path, batch_size: int = 5000) -> dict:
+    """把多个数据源的 extractor 输出增量导入本地索引（按 mtime/size 跳过未变更文件）"""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            # 同一数据源同时有 .json 和 .ndjson 时只取较新的一份，避免重复
+            latest = {}
+            for f in sorted(p.glob('*_schema.json')) + sorted(p.glob('*_schema.ndjson')):
+                if f.stem not in latest or f.stat().st_mtime > latest[f.stem].stat().st_mtime:
+                    latest[f.stem] = f
+            files.extend(latest.values())
+        elif p.exists():
+            files.append(p)
+
+    conn = open_index(db_path)
+    stats = {'files': len(files), 'skipped': 0, 'loaded': 0, 'entries': 0, 'removed': 0}
+    with conn:
+        # 本次文件集合之外的数据源（已删除的文件、被较新的同名 .json/.ndjson 取代的文件）整体移除
+        current = {str(path.resolve()) for path in files}
+        for source_id, key in conn.execute("SELECT id, path FROM sources").fetchall():
+            if key not in current:
+                conn.execute("DELETE FROM entries WHERE source_id = ?", (source_id,))
+                conn.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+                stats['removed'] += 1
+        for path in files:
+            st = path.stat()
+            key = str(path.resolve())
+            row = conn.execute("SELECT id, mtime, size FROM sources WHERE path = ?", (key,)).fetchone()
+            if row and row[1] == st.st_mtime and row[2] == st.st_size:
+                stats['skipped'] += 1
+                continue
+            if row:
+                source_id = row[0]
+                conn.execute("DELETE FROM entries WHERE source_id = ?", (source_id,))
+                conn.execute("UPDATE sources SET mtime = ?, size = ? WHERE id = ?", (st.st_mtime, st.st_size, source_id))
+            else:
+                source_id = conn.execute("INSERT INTO sources (path, mtime, size) VALUES (?, ?, ?)",
+                                         (key, st.st_mtime, st.st_size)).lastrowid
+
+            batch = []
+            for meta, name, info in _iter_schema_records(path):
+                batch.extend((source_id,) + e for e in _entries_for(meta, name, info))
+                if len(batch) >= batch_size:
+                    _insert_entries(conn, batch)
+                    stats['entries'] += len(batch)
+                    batch = []
+            _insert_entries(conn, batch)
+            stats['entries'] += len(batch)
+            stats['loaded'] += 1
+        if stats['loaded'] or stats['removed']:
+            conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+    conn.close()
+    return stats
+
+
+def _insert_entries(conn, rows):
+    conn.executemany("""
+        INSERT INTO entries (source_id, db_type, database, schema_name, kind, table_name, column_name, column_type, comment)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def _query_terms(text: str) -> tuple:
+    """用户输入 → (FTS5 子串查询, 短词列表)
+
+    trigram 索引至少需要 3 个字符，更短的词（如"编号"、"id"）交给 LIKE 过滤。
+    """
+    terms = [t for t in re.split(r'[\s.]+', text) if t]
+    fts = ' '.join('"' + t.replace('"', '""') + '"' for t in terms if len(t) >= 3)
+    return fts, [t for t in terms if len(t) < 3]
+
+
+def search_index(db_path: Path, query: str = None, table: str = None, column: str = None,
+                 column_type: str = None, source: str = None, limit: int = 20) -> list:
+    """在本地索引中查找：全文（表/字段/类型/注释）+ 精确条件"""
+    conn = open_index(db_path)
+    sql = ["SELECT e.db_type, e.database, e.schema_name, e.kind, e.table_name, e.column_name, e.column_type, e.comment FROM entries e"]
+    where, params = [], []
+    fts, short_terms = _query_terms(query) if query else ('', [])
+    if fts:
+        sql.append("JOIN entries_fts f ON f.rowid = e.id")
+        where.append("entries_fts MATCH ?")
+        params.append(fts)
+    for term in short_terms:
+        where.append("(e.table_name LIKE ? OR e.column_name LIKE ? OR e.column_type LIKE ? OR e.comment LIKE ?)")
+        params.extend([f"%{term}%"] * 4)
+    if table:
+        where.append("e.table_name = ? COLLATE NOCASE")
+        params.append(table)
+    if column:
+        where.append("e.column_name = ? COLLATE NOCASE")
+        params.append(column)
+    if column_type:
+        where.append("e.column_type LIKE ?")
+        params.append(f"%{column_type}%")
+    if source:
+        where.append("e.db_type = ?")
+        params.append(TYPE_NAMES.get(source, source))
+    if where:
+        sql.append("WHERE " + " AND ".join(where))
+    sql.append("ORDER BY bm25(entries_fts)" if fts else "ORDER BY e.table_name, e.id")
+    sql.append("LIMIT ?")
+    params.append(limit)
+    rows = conn.execute(" ".join(sql), params).fetchall()
+    conn.close()
+    return rows
+
+
+def index_main(argv):
+    """index 子命令：导入 extractor 输出"""
+    parser = argparse.ArgumentParser(prog="extract_schema.py index", description="把 schema 输出导入本地 SQLite 索引")
+    parser.add_argument("paths", nargs="*", default=["./schema"], help="schema 输出目录或 *_schema.json / *.ndjson 文件（索引只保留这些来源）")
+    parser.add_argument("--index", "-i", help=f"索引文件（默认 <第一个目录>/{INDEX_FILE}）")
+    args = parser.parse_args(argv)
+
+    first = Path(args.paths[0])
+    db_path = Path(args.index) if args.index else (first if first.is_dir() else first.parent) / INDEX_FILE
+    start = time.perf_counter()
+    stats = build_index(args.paths, db_path)
+    elapsed = time.perf_counter() - start
+    print(f"索引: {db_path}")
+    print(f"文件 {stats['files']}（导入 {stats['loaded']}，未变更跳过 {stats['skipped']}，移除旧数据源 {stats['removed']}），"
+          f"写入 {stats['entries']} 条，耗时 {elapsed:.2f}s")
+
+
+def search_main(argv):
+    """search 子命令：查询本地索引"""
+    parser = argparse.ArgumentParser(prog="extract_schema.py search", description="在本地 schema 索引中查找表 / 字段")
+    parser.add_argument("query", nargs="?", help="全文关键词（匹配表名、字段名、类型、注释，子串匹配，中文可用）")
+    parser.add_argument("--table", help="表名精确匹配（不区分大小写）")
+    parser.add_argument("--column", help="字段名精确匹配（不区分大小写）")
+    parser.add_argument("--type", dest="column_type", help="字段类型包含")
+    parser.add_argument("--source", "-t", help="数据源类型（pg/mysql/dm/neo4j/milvus/es）")
+    parser.add_argument("--limit", "-n", type=int, default=20, help="最多返回条数")
+    parser.add_argument("--index", "-i", default=f"./schema/{INDEX_FILE}", help="索引文件")
+    args = parser.parse_args(argv)
+
+    if not (args.query or args.table or args.column or args.column_type):
+        parser.error("至少提供 query / --table / --column / --type 之一")
+    db_path = Path(args.index)
+    if not db_path.exists():
+        print(f"索引不存在: {db_path}，请先运行 index")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    rows = search_index(db_path, args.query, args.table, args.column, args.column_type, args.source, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for db_type, database, schema, kind, table, column, column_type, comment in rows:
+        location = '.'.join(str(x) for x in (database, schema, table) if x)
+        target = f"{location}.{column}" if column else location
+        line = f"[{db_type}] {target}"
+        if column_type:
+            line += f"  {column_type}"
+        if comment:
+            line += f"  -- {comment}"
+        print(line)
+    print(f"({len(rows)} 条，{elapsed:.1f}ms)")
+
+
+# ========== 执行计划采集 ==========
+
+_SQL_READONLY_RE = re.compile(r'^\s*(select|with|table|values)\b', re.I)
+_SQL_WRITE_RE = re.compile(r'\b(insert|update|delete|merge|drop|alter|create|truncate|grant|revoke|call|copy|lock)\b', re.I)
+_CYPHER_WRITE_RE = re.compile(r'\b(create|merge|delete|detach|set|remove|drop|load\s+csv)\b', re.I)
+
+
+def load_queries(path: Path, db_type: str) -> list:
+    """读取候选查询：SQL/Cypher 以行尾 `;` 分隔；ES 为 JSONL，每行 {"index": ..., "query": {...}}"""
+    text = Path(path).read_text(encoding='utf-8')
+    if db_type == 'es':
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    queries = []
+    for chunk in re.split(r';[ \t]*(?:\n|$)', text):
+        body = '\n'.join(l for l in chunk.splitlines() if not l.strip().startswith('--') and not l.strip().startswith('//'))
+        if body.strip():
+            queries.append(body.strip())
+    return queries
+
+
+def _readonly_error(db_type: str, query) -> str:
+    """只允许只读语句；返回拒绝原因，None 表示通过"""
+    if db_type == 'es':
+        return None if isinstance(query, dict) and 'query' in query else '需要 {"index": ..., "query": {...}}'
+    if db_type == 'neo4j':
+        return '包含写操作' if _CYPHER_WRITE_RE.search(query) else None
+    if not _SQL_READONLY_RE.match(query) or _SQL_WRITE_RE.search(query):
+        return '只允许 SELECT / WITH 查询'
+    return None
+
+
+def _finding(kind: str, message: str) -> dict:
+    return {'kind': kind, 'message': message}
+
+
+def analyze_pg_plan(plan: dict, table_rows) -> list:
+    """PG EXPLAIN (FORMAT JSON) 分析；table_rows(name) 返回表的估算行数"""
+    findings = []
+
+    def walk(node):
+        children = node.get('Plans', [])
+        rows = node.get('Plan Rows', 0)
+        relation = node.get('Relation Name')
+        if node.get('Node Type') == 'Seq Scan' and relation:
+            total = table_rows(relation)
+            if total >= LARGE_TABLE_ROWS:
+                if node.get('Filter'):
+                    findings.append(_finding('missing_index', f"{relation}（约 {total} 行）按 {node['Filter']} 过滤但走全表扫描"))
+                else:
+                    findings.append(_finding('seq_scan', f"{relation}（约 {total} 行）全表扫描"))
+        child_rows = max((c.get('Plan Rows', 0) for c in children), default=0)
+        if len(children) > 1 and rows >= 1000 and rows > child_rows * ROW_BLOWUP:
+            findings.append(_finding('row_blowup', f"{node.get('Node Type')} 估算 {rows} 行，输入最大 {child_rows} 行"))
+        for child in children:
+            walk(child)
+
+    walk(plan[0]['Plan'] if isinstance(plan, list) else plan.get('Plan', plan))
+    return findings
+
+
+def analyze_mysql_plan(plan: dict) -> list:
+    """MySQL EXPLAIN FORMAT=JSON 分析"""
+    findings = []
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        table = node.get('table')
+        if isinstance(table, dict):
+            name = table.get('table_name', '?')
+            examined = int(table.get('rows_examined_per_scan', 0) or 0)
+            produced = int(table.get('rows_produced_per_join', 0) or 0)
+            if table.get('access_type') == 'ALL' and examined >= LARGE_TABLE_ROWS:
+                if table.get('attached_condition') and not table.get('key'):
+                    findings.append(_finding('missing_index', f"{name}（约 {examined} 行）按 {table['attached_condition']} 过滤但无可用索引"))
+                else:
+                    findings.append(_finding('seq_scan', f"{name}（约 {examined} 行）全表扫描"))
+            if produced >= 1000 and examined and produced > examined * ROW_BLOWUP:
+                findings.append(_finding('row_blowup', f"{name} 连接后估算 {produced} 行，单次扫描 {examined} 行"))
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                walk(value)
+
+    walk(plan)
+    return findings
+
+
+def analyze_neo4j_plan(plan: dict) -> list:
+    """Neo4j EXPLAIN 计划分析（operatorType / args.EstimatedRows / children）"""
+    findings = []
+
+    def walk(node):
+        op = node.get('operatorType', '').split('@')[0]
+        rows = int(node.get('args', {}).get('EstimatedRows', 0) or 0)
+        children = node.get('children', [])
+        if op == 'AllNodesScan' and rows >= LARGE_TABLE_ROWS:
+            findings.append(_finding('seq_scan', f"AllNodesScan 估算 {rows} 行，未按标签/索引定位"))
+        elif op == 'NodeByLabelScan' and rows >= LARGE_TABLE_ROWS:
+            findings.append(_finding('missing_index', f"NodeByLabelScan 估算 {rows} 行，属性过滤未命中索引"))
+        if op == 'CartesianProduct':
+            findings.append(_finding('row_blowup', f"CartesianProduct 估算 {rows} 行"))
+        else:
+            child_rows = max((int(c.get('args', {}).get('EstimatedRows', 0) or 0) for c in children), default=0)
+            if children and rows >= 1000 and rows > child_rows * ROW_BLOWUP:
+                findings.append(_finding('row_blowup', f"{op} 估算 {rows} 行，输入 {child_rows} 行"))
+        for child in children:
+            walk(child)
+
+    walk(plan)
+    return findings
+
+
+def analyze_es_explain(resp: dict) -> list:
+    """ES _validate/query?explain 分析"""
+    if not resp.get('valid', False):
+        errors = [e.get('error', '') for e in resp.get('explanations', []) if e.get('error')]
+        return [_finding('invalid', '; '.join(errors) or resp.get('error', '查询无效'))]
+    findings = []
+    for e in resp.get('explanations', []):
+        text = e.get('explanation', '')
+        if 'MatchAllDocsQuery' in text or text.strip() == '*:*':
+            findings.append(_finding('seq_scan', f"{e.get('index', '')} 匹配全部文档"))
+        if re.search(r':\*|WildcardQuery|RegexpQuery', text):
+            findings.append(_finding('missing_index', f"{e.get('index', '')} 前缀通配 / 正则查询无法利用倒排索引: {text[:120]}"))
+    return findings
+
+
+def analyze_dm_plan(lines: list) -> list:
+    """达梦 EXPLAIN 文本计划分析（CSCN = 聚集索引全扫描）"""
+    return [_finding('seq_scan', line.strip()) for line in lines if 'CSCN' in line]
+
+
+def explain_queries(db_type, host, port, db, user, password, queries, analyze=False) -> list:
+    """逐条只读 EXPLAIN 候选查询，返回 [{query, plan, findings, error}]"""
+    results = []
+    if db_type in ('pg', 'mysql', 'dm'):
+        if db_type == 'pg':
+            conn = _connect_pg(host, port, db, user, password)
+        elif db_type == 'mysql':
+            conn = _connect_mysql(host, port, db, user, password)
+        else:
+            conn = _connect_dm(host, port, user, password)
+        cur = conn.cursor()
+        if db_type == 'pg':
+            cur.execute("SET default_transaction_read_only = on")
+            cur.execute(f"SET statement_timeout = {QUERY_TIMEOUT * 1000}")
+        elif db_type == 'mysql':
+            cur.execute("SET SESSION TRANSACTION READ ONLY")
+            cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {QUERY_TIMEOUT * 1000}")
+        sizes = {}
+
+        def pg_table_rows(name):
+            if name not in sizes:
+                rows = _query(cur, "SELECT COALESCE(MAX(reltuples), 0)::bigint FROM pg_class WHERE relname = %s", (name,))
+                sizes[name] = int(rows[0][0]) if rows else 0
+            return sizes[name]
+
+        for q in queries:
+            item = {'query': q, 'plan': None, 'findings': [], 'error': _readonly_error(db_type, q)}
+            if item['error'] is None:
+                try:
+                    if db_type == 'pg':
+                        options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+                        plan = _query(cur, f"EXPLAIN ({options}) {q}")[0][0]
+                        item['plan'] = json.loads(plan) if isinstance(plan, str) else plan
+                        item['findings'] = analyze_pg_plan(item['plan'], pg_table_rows)
+                    elif db_type == 'mysql':
+                        item['plan'] = json.loads(_query(cur, f"EXPLAIN FORMAT=JSON {q}")[0][0])
+                        item['findings'] = analyze_mysql_plan(item['plan'])
+                    else:
+                        item['plan'] = [str(r[0]) for r in _query(cur, f"EXPLAIN {q}")]
+                        item['findings'] = analyze_dm_plan(item['plan'])
+                except Exception as e:
+                    item['error'] = str(e)
+            results.append(item)
+        conn.close()
+
+    elif db_type == 'neo4j':
+        driver = _connect_neo4j(host, port, user, password)
+        with driver.session() as session:
+            for q in queries:
+                item = {'query': q, 'plan': None, 'findings': [], 'error': _readonly_error(db_type, q)}
+                if item['error'] is None:
+                    try:
+                        with LIMITER.query():
+                            summary = session.run(f"EXPLAIN {q}").consume()
+                        item['plan'] = summary.plan
+                        item['findings'] = analyze_neo4j_plan(summary.plan or {})
+                    except Exception as e:
+                        item['error'] = str(e)
+                results.append(item)
+        driver.close()
+
+    elif db_type == 'es':
+        es = _connect_es(host, port, user, password)
+        for q in queries:
+            item = {'query': q, 'plan': None, 'findings': [], 'error': _readonly_error(db_type, q)}
+            if item['error'] is None:
+                try:
+                    with LIMITER.query():
+                        resp = es.indices.validate_query(index=q.get('index', '_all'), query=q['query'], explain=True)
+                    item['plan'] = dict(resp)
+                    item['findings'] = analyze_es_explain(item['plan'])
+                except Exception as e:
+                    item['error'] = str(e)
+            results.append(item)
+
+    else:
+        raise ValueError(f"{db_type} 不支持 explain")
+    return results
+
+
+def write_explain_report(results: list, db_type: str, output_dir: Path) -> Path:
+    """生成 Markdown 汇总报告 + 原始计划 JSON"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    md_path = output_dir / f"{db_type}_explain.md"
+    with open(output_dir / f"{db_type}_explain.json", 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+
+    counts = {}
+    for r in results:
+        for finding in r['findings']:
+            counts[finding['kind']] = counts.get(finding['kind'], 0) + 1
+    labels = {'seq_scan': '大表全扫描', 'missing_index': '疑似缺索引', 'row_blowup': '行数膨胀', 'invalid': '查询无效'}
+
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(f"# {db_type.upper()} 执行计划报告\n\n")
+        f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write(f"查询 {len(results)} 条，有问题 {sum(1 for r in results if r['findings'])} 条，"
+                f"失败 {sum(1 for r in results if r['error'])} 条\n\n")
+        if counts:
+            f.write("| 问题 | 次数 |\n|------|------|\n")
+            f.writelines(f"| {labels.get(k, k)} | {v} |\n" for k, v in counts.items())
+            f.write("\n")
+        for i, r in enumerate(results, 1):
+            query = r['query'] if isinstance(r['query'], str) else json.dumps(r['query'], ensure_ascii=False)
+            status = '❌' if r['error'] else ('⚠️' if r['findings'] else '✅')
+            f.write(f"## {status} 查询 {i}\n\n```\n{query}\n```\n\n")
+            if r['error']:
+                f.write(f"**错误**: {r['error']}\n\n")
+            f.writelines(f"- **{labels.get(x['kind'], x['kind'])}**: {x['message']}\n" for x in r['findings'])
+            if r['findings']:
+                f.write("\n")
+    return md_path
+
+
+def _add_connection_args(parser, types):
+    parser.add_argument("--type", "-t", required=True, choices=types, help="数据库类型")
     parser.add_argument("--host", "-H", default="localhost", help="主机地址")
     parser.add_argument("--port", "-p", type=int, help="端口")
     parser.add_argument("--db", "-d", help="数据库名")
     parser.add_argument("--user", "-u", help="用户名")
     parser.add_argument("--password", "-P", default="", help="密码")
+
+
+def explain_main(argv):
+    """explain 子命令：候选查询执行计划采集"""
+    parser = argparse.ArgumentParser(prog="extract_schema.py explain", description="只读采集候选查询的执行计划并汇总问题")
+    _add_connection_args(parser, ['pg', 'mysql', 'dm', 'neo4j', 'es'])
+    parser.add_argument("--queries", "-q", required=True, help="候选查询文件（SQL/Cypher 以 ; 分隔，ES 为 JSONL）")
+    parser.add_argument("--analyze", action="store_true", help="PG 使用 EXPLAIN ANALYZE（会真正执行查询，仅限从库）")
+    parser.add_argument("--output", "-o", default="./schema", help="报告输出目录")
+    parser.add_argument("--qps", type=float, default=MAX_QPS, help=f"每秒最多查询数（默认 {MAX_QPS}）")
+    args = parser.parse_args(argv)
+
+    port = args.port or DEFAULT_PORTS.get(args.type)
+    configure_limiter(args.qps)
+    queries = load_queries(Path(args.queries), args.type)
+    print(f"=== EXPLAIN {args.type.upper()} ({len(queries)} 条) ===")
+    print(f"连接: {args.host}:{port}")
+    try:
+        results = explain_queries(args.type, args.host, port, args.db, args.user, args.password, queries, args.analyze)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    report = write_explain_report(results, args.type, Path(args.output))
+    for i, r in enumerate(results, 1):
+        for finding in r['findings']:
+            print(f"  [{i}] {finding['kind']}: {finding['message']}")
+        if r['error']:
+            print(f"  [{i}] error: {r['error']}")
+    print(f"报告: {report}")
+    print("=== 完成 ===")
+
+
+def main():
+    commands = {'index': index_main, 'search': search_main, 'explain': explain_main}
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        commands[sys.argv[1]](sys.argv[2:])
+        return
+    
+    parser = argparse.ArgumentParser(description="数据库 Schema 提取工具",
+                                     epilog="子命令: index（建立本地索引）、search（查找表/字段）、explain（执行计划采集）")
+    _add_connection_args(parser, ['pg', 'mysql', 'dm', 'neo4j', 'milvus', 'es'])
     parser.add_argument("--schema", "-s", help="Schema 名 (PG/DM)")
     parser.add_argument("--output", "-o", default="./schema", help="输出目录")
+    parser.add_argument("--format", "-f", default="md", choices=['md', 'stream'],
+                        help="输出格式: md=单个 Markdown + JSON；stream=NDJSON + 每表一个 Markdown（大库推荐）")
+    parser.add_argument("--max-tables", type=int, default=MAX_TABLES, help=f"最大表数量（默认 {MAX_TABLES}）")
+    parser.add_argument("--qps", type=float, default=MAX_QPS, help=f"每秒最多查询数，慢查询/繁忙时自动降速（默认 {MAX_QPS}）")
     
     args = parser.parse_args()
     
     # 默认端口
-    default_ports = {'pg': 5432, 'mysql': 3306, 'dm': 5236, 'neo4j': 7687, 'milvus': 19530, 'es': 9200}
-    port = args.port or default_ports.get(args.type)
+    port = args.port or DEFAULT_PORTS.get(args.type)
     
     print(f"=== 提取 {args.type.upper()} Schema ===")
     print(f"连接: {args.host}:{port}")
     
+    limiter = configure_limiter(args.qps)
+    output_dir = Path(args.output)
+    sink = StreamingSchemaWriter(output_dir, args.type) if args.format == 'stream' else None
+    
     # 提取 schema
     if args.type == 'pg':
-        schema_data = extract_pg_schema(args.host, port, args.db, args.user, args.password, args.schema or 'public')
+        schema_data = extract_pg_schema(args.host, port, args.db, args.user, args.password, args.schema or 'public',
+                                        sink=sink, max_tables=args.max_tables)
     elif args.type == 'mysql':
-        schema_data = extract_mysql_schema(args.host, port, args.db, args.user, args.password)
+        schema_data = extract_mysql_schema(args.host, port, args.db, args.user, args.password,
+                                           sink=sink, max_tables=args.max_tables)
     elif args.type == 'dm':
-        schema_data = extract_dm_schema(args.host, port, args.db, args.user, args.password, args.schema)
+        schema_data = extract_dm_schema(args.host, port, args.db, args.user, args.password, args.schema,
+                                        sink=sink, max_tables=args.max_tables)
     elif args.type == 'neo4j':
-        schema_data = extract_neo4j_schema(args.host, port, args.user, args.password)
+        schema_data = extract_neo4j_schema(args.host, port, args.user, args.password, sink=sink)
     elif args.type == 'milvus':
-        schema_data = extract_milvus_schema(args.host, port)
+        schema_data = extract_milvus_schema(args.host, port, sink=sink)
     elif args.type == 'es':
-        schema_data = extract_es_schema(args.host, port, args.user, args.password)
+        schema_data = extract_es_schema(args.host, port, args.user, args.password, sink=sink)
     
     # 输出
-    output_dir = Path(args.output)
-    output_file = output_dir / f"{args.type}_schema.md"
-    
-    generate_markdown(schema_data, output_file)
-    print(f"输出: {output_file}")
+    if sink is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        sink.close(schema_data)
+        print(f"输出: {sink.index_path}（{sink.count} 项）")
+        print(f"NDJSON: {sink.ndjson_path}")
+    else:
+        output_file = output_dir / f"{args.type}_schema.md"
+        
+        generate_markdown(schema_data, output_file)
+        print(f"输出: {output_file}")
+        
+        # 同时输出 JSON
+        json_file = output_dir / f"{args.type}_schema.json"
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(schema_data, f, indent=2, ensure_ascii=False, default=str)
+        print(f"JSON: {json_file}")
     
-    # 同时输出 JSON
-    json_file = output_dir / f"{args.type}_schema.json"
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(schema_data, f, indent=2, ensure_ascii=False, default=str)
-    print(f"JSON: {json_file}")
+    if limiter.backoffs:
+        print(f"限流: 降速 {limiter.backoffs} 次，结束时 {limiter.rate:.1f} QPS")
     
     if 'error' in schema_data:
         print(f"错误: {schema_data['error']}")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+gemini.py 离线基准 / 压力测试
+
+用 fake_gemini.py 替代真实 gemini CLI（放进临时 PATH），逐个场景运行 gemini.py，
+统计包装开销、流式吞吐、超时终止、并发调用下的延迟分布，并校验输出完整、无残留进程。
+无需网络和 Gemini 账号；依赖 POSIX（shell 包装脚本、信号）。
+
+用法:
+  python bench_gemini.py                                # 全部场景
+  python bench_gemini.py --only overhead,throughput     # 只跑指定场景
+  python bench_gemini.py --runs 20 --concurrency 64 --mb 256
+  python bench_gemini.py --json bench.json              # 结果另存为 JSON
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import fake_gemini  # noqa: E402
+
+GEMINI_PY = Path(__file__).resolve().parent / 'gemini.py'
+FAKE_GEMINI = Path(__file__).resolve().parent / 'fake_gemini.py'
+GUARD_TIMEOUT = 120  # 秒，单次调用的兜底超时：超过视为卡死（管道死锁等）
+FORCE_KILL_DELAY = 5  # 与 gemini.py 一致
+
+
+# ========== 环境 ==========
+
+class Sandbox:
+    """临时目录：bin/gemini 指向 fake_gemini.py，外加干净的环境变量"""
+
+    def __init__(self):
+        self.root = Path(tempfile.mkdtemp(prefix='bench-gemini-'))
+        bin_dir = self.root / 'bin'
+        bin_dir.mkdir()
+        shim = bin_dir / 'gemini'
+        shim.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_GEMINI}" "$@"\n')
+        shim.chmod(0o755)
+        self.pidfile = self.root / 'pids'
+        self.base_env = {k: v for k, v in os.environ.items()
+                         if not k.startswith(('GEMINI_', 'FAKE_GEMINI_'))}
+        self.base_env.update(
+            PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            GEMINI_MODEL='bench-model',
+            GEMINI_DAEMON='0',
+            GEMINI_DAEMON_SOCKET=str(self.root / 'daemon.sock'),
+            GEMINI_CACHE_DIR=str(self.root / 'cache'),
+            FAKE_GEMINI_PIDFILE=str(self.pidfile),
+            FAKE_GEMINI_STATE=str(self.root / 'fail-state'),
+        )
+
+    def env(self, **fake) -> dict:
+        env = dict(self.base_env)
+        env.update({k if k.startswith('GEMINI_') else f"FAKE_GEMINI_{k}": str(v) for k, v in fake.items()})
+        return env
+
+    def leftover_pids(self) -> list:
+        """pidfile 中仍然存活的 fake gemini 进程"""
+        alive = []
+        if self.pidfile.exists():
+            for pid in map(int, self.pidfile.read_text().split()):
+                try:
+                    os.kill(pid, 0)
+                    alive.append(pid)
+                except ProcessLookupError:
+                    pass
+        return alive
+
+    def cleanup(self):
+        for pid in self.leftover_pids():
+            os.kill(pid, 9)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def run(cmd: list, env: dict, stdin=None) -> dict:
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(cmd, env=env, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=GUARD_TIMEOUT)
+        code, out, err = proc.returncode, proc.stdout, proc.stderr
+    except subprocess.TimeoutExpired as e:
+        code, out, err = 'hung', e.stdout or b'', e.stderr or b''
+    return {'wall': time.perf_counter() - started, 'code': code, 'stdout': out, 'stderr': err}
+
+
+def wrapper(*args) -> list:
+    return [sys.executable, str(GEMINI_PY), *args]
+
+
+def direct(prompt: str = 'bench') -> list:
+    return ['gemini', '-m', 'bench-model', '-p', prompt]
+
+
+def _pct(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def result(scenario: str, runs: int, wall: float, metric: str, problems: list, **extra) -> dict:
+    return {'scenario': scenario, 'runs': runs, 'wall_s': round(wall, 3), 'metric': metric,
+            'status': 'ok' if not problems else '; '.join(problems), **extra}
+
+
+# ========== 场景 ==========
+
+def bench_overhead(box: Sandbox, opts) -> dict:
+    """gemini.py 相对直接运行 gemini 的额外耗时（进程启动 + 转发）"""
+    env = box.env(STDOUT_BYTES=1024)
+    direct_ms, wrapped_ms, problems = [], [], []
+    started = time.perf_counter()
+    for _ in range(opts.runs):
+        a = run(direct(), env)
+        b = run(wrapper('bench'), env)
+        direct_ms.append(a['wall'] * 1000)
+        wrapped_ms.append(b['wall'] * 1000)
+        if b['code'] != 0 or b['stdout'] != a['stdout']:
+            problems.append(f"wrapped run differs (exit {b['code']})")
+            break
+    d, w = statistics.median(direct_ms), statistics.median(wrapped_ms)
+    return result('overhead', opts.runs, time.perf_counter() - started,
+                  f"p50 direct {d:.1f}ms, wrapped {w:.1f}ms, overhead {w - d:.1f}ms", problems,
+                  direct_p50_ms=round(d, 1), wrapped_p50_ms=round(w, 1), overhead_ms=round(w - d, 1))
+
+
+def bench_throughput(box: Sandbox, opts) -> dict:
+    """大体积 stdout 经 gemini.py 转发的吞吐，校验内容逐字节一致"""
+    nbytes = opts.mb * 1024 * 1024
+    env = box.env(STDOUT_BYTES=nbytes, CHUNK=256 * 1024)
+    a = run(direct(), env)
+    b = run(wrapper('bench'), env)
+    problems = []
+    if b['code'] != 0:
+        problems.append(f"exit {b['code']}")
+    if _sha(b['stdout']) != _sha(fake_gemini.generate(nbytes)):
+        problems.append(f"stdout corrupted ({len(b['stdout'])}/{nbytes} bytes)")
+    direct_mbs, wrapped_mbs = opts.mb / a['wall'], opts.mb / b['wall']
+    return result('throughput', 1, a['wall'] + b['wall'],
+                  f"{opts.mb} MiB: direct {direct_mbs:.0f} MB/s, wrapped {wrapped_mbs:.0f} MB/s", problems,
+                  direct_mb_s=round(direct_mbs, 1), wrapped_mb_s=round(wrapped_mbs, 1))
+
+
+def bench_flood(box: Sandbox, opts) -> dict:
+    """stdout 与 stderr 同时大量输出（小块交替），检测管道死锁并校验两路都完整"""
+    nbytes = 16 * 1024 * 1024
+    env = box.env(STDOUT_BYTES=nbytes, STDERR_BYTES=nbytes, CHUNK=4096)
+    r = run(wrapper('bench'), env)
+    problems = []
+    if r['code'] == 'hung':
+        problems.append(f"hung > {GUARD_TIMEOUT}s (pipe deadlock?)")
+    elif r['code'] != 0:
+        problems.append(f"exit {r['code']}")
+    if r['stdout'] != fake_gemini.generate(nbytes):
+        problems.append('stdout corrupted')
+    flood = r['stderr'].count(b'E' * 4095 + b'\n')
+    if flood != nbytes // 4096:
+        problems.append(f"stderr lost ({flood}/{nbytes // 4096} chunks)")
+    return result('flood', 1, r['wall'], f"16+16 MiB interleaved in {r['wall']:.2f}s", problems)
+
+
+def bench_timeout(box: Sandbox, opts) -> dict:
+    """超时终止：挂起的 gemini 在截止时间收到 SIGTERM；忽略 SIGTERM 的在 FORCE_KILL_DELAY 后被 SIGKILL"""
+    problems, timings = [], {}
+    tasks = json.dumps({'id': 'hang', 'prompt': 'bench', 'timeout': 1}).encode() + b'\n'
+    for hang, budget in (('1', 1), ('term', 1 + FORCE_KILL_DELAY)):
+        box.pidfile.unlink(missing_ok=True)
+        r = run(wrapper('--batch', '-', '--retries', '0'), box.env(HANG=hang, STDOUT_BYTES=100), stdin=tasks)
+        timings[hang] = r['wall']
+        record = json.loads(r['stdout'].splitlines()[0]) if r['stdout'] else {}
+        if record.get('exit_code') != 124:
+            problems.append(f"hang={hang}: exit {record.get('exit_code')} (expected 124)")
+        if not budget <= r['wall'] < budget + 2:
+            problems.append(f"hang={hang}: took {r['wall']:.2f}s (expected ~{budget}s)")
+        if box.leftover_pids():
+            problems.append(f"hang={hang}: leftover gemini processes {box.leftover_pids()}")
+    return result('timeout', 2, sum(timings.values()),
+                  f"SIGTERM {timings['1']:.2f}s, SIGKILL {timings['term']:.2f}s", problems)
+
+
+def bench_concurrency(box: Sandbox, opts) -> dict:
+    """大量并发的单 prompt 调用：输出互不干扰、全部成功、无残留进程"""
+    nbytes = 256 * 1024
+    env = box.env(STDOUT_BYTES=nbytes, STDERR_BYTES=16 * 1024, DELAY=0.05, CHUNK=8192)
+    expected = _sha(fake_gemini.generate(nbytes))
+    box.pidfile.unlink(missing_ok=True)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=opts.concurrency) as pool:
+        runs = list(pool.map(lambda _: run(wrapper('bench'), env), range(opts.concurrency)))
+    wall = time.perf_counter() - started
+    problems = []
+    bad = [r for r in runs if r['code'] != 0 or _sha(r['stdout']) != expected]
+    if bad:
+        problems.append(f"{len(bad)}/{len(runs)} runs failed or corrupted")
+    if box.leftover_pids():
+        problems.append(f"leftover gemini processes {box.leftover_pids()}")
+    lat = [r['wall'] * 1000 for r in runs]
+    return result('concurrency', len(runs), wall,
+                  f"{len(runs)} parallel: p50 {_pct(lat, 50):.0f}ms p95 {_pct(lat, 95):.0f}ms max {max(lat):.0f}ms",
+                  problems, p50_ms=round(_pct(lat, 50)), p95_ms=round(_pct(lat, 95)), max_ms=round(max(lat)))
+
+
+def bench_batch(box: Sandbox, opts) -> dict:
+    """--batch 有界并发：N 个 100ms 任务在 --jobs J 下的总耗时与理想值比较"""
+    count, jobs, delay = opts.concurrency * 2, max(1, opts.concurrency // 2), 0.1
+    tasks = b''.join(json.dumps({'id': f"t{i}", 'prompt': f"bench {i}"}).encode() + b'\n' for i in range(count))
+    r = run(wrapper('--batch', '-', '--jobs', str(jobs)), box.env(DELAY=delay, STDOUT_BYTES=4096), stdin=tasks)
+    records = [json.loads(line) for line in r['stdout'].splitlines()]
+    problems = []
+    ok = sum(1 for rec in records if rec['exit_code'] == 0 and rec['output'] == fake_gemini.generate(4096).decode())
+    if r['code'] != 0 or ok != count:
+        problems.append(f"{ok}/{count} tasks ok (exit {r['code']})")
+    ideal = count / jobs * delay
+    return result('batch', count, r['wall'], f"{count} tasks / {jobs} jobs in {r['wall']:.2f}s (ideal {ideal:.2f}s)",
+                  problems)
+
+
+def bench_retry(box: Sandbox, opts) -> dict:
+    """限流重试：前两次 429，随后成功；stdout 只有一份完整输出"""
+    (box.root / 'fail-state').unlink(missing_ok=True)
+    env = box.env(FAIL_TIMES=2, ERROR='Error: [429 Too Many Requests]', STDOUT_BYTES=4096,
+                  GEMINI_BACKOFF_BASE=0.05, GEMINI_MAX_RETRIES=3)
+    r = run(wrapper('bench'), env)
+    problems = []
+    retries = r['stderr'].count(b'rate_limit')
+    if r['code'] != 0 or r['stdout'] != fake_gemini.generate(4096):
+        problems.append(f"exit {r['code']}, {len(r['stdout'])} stdout bytes")
+    if retries != 2:
+        problems.append(f"{retries} rate_limit retries (expected 2)")
+    return result('retry', 1, r['wall'], f"{retries} retries, recovered in {r['wall']:.2f}s", problems)
+
+
+def bench_large_prompt(box: Sandbox, opts) -> dict:
+    """大 prompt（--prompt-file）经 stdin 传递：内容一致，不出现在命令行"""
+    prompt = fake_gemini.generate(4 * 1024 * 1024)
+    path = box.root / 'prompt.txt'
+    path.write_bytes(prompt)
+    r = run(wrapper('--prompt-file', str(path)), box.env(ECHO=1))
+    problems = []
+    expected = f"prompt bytes={len(prompt)} sha256={_sha(prompt)}".encode()
+    if r['code'] != 0 or expected not in r['stdout']:
+        problems.append(f"prompt not delivered intact (exit {r['code']})")
+    if b'sent via stdin' not in r['stderr']:
+        problems.append('prompt was not sent via stdin')
+    return result('large_prompt', 1, r['wall'], f"4 MiB prompt delivered in {r['wall']:.2f}s", problems)
+
+
+def bench_daemon(box: Sandbox, opts) -> dict:
+    """daemon 模式：gemini 启动耗 300ms 时，冷启动与预热进程的延迟对比"""
+    env = box.env(STARTUP=0.3, STDOUT_BYTES=1024, GEMINI_DAEMON='1')
+    daemon = subprocess.Popen(wrapper('--daemon', '--idle-timeout', '30'), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    problems, cold, warm = [], [], []
+    try:
+        sock = Path(env['GEMINI_DAEMON_SOCKET'])
+        for _ in range(50):
+            if sock.exists():
+                break
+            time.sleep(0.1)
+        for _ in range(opts.runs):
+            cold.append(run(wrapper('bench'), dict(env, GEMINI_DAEMON='0'))['wall'] * 1000)
+        run(wrapper('bench'), env)  # 第一次请求之后才会为该工作目录预热
+        for _ in range(opts.runs):
+            time.sleep(0.4)  # 等待替换的预热进程就绪
+            r = run(wrapper('bench'), env)
+            warm.append(r['wall'] * 1000)
+            if r['code'] != 0 or r['stdout'] != fake_gemini.generate(1024):
+                problems.append(f"daemon run failed (exit {r['code']})")
+                break
+    finally:
+        daemon.terminate()
+        daemon.wait(10)
+    if sock.exists():
+        problems.append('socket not removed on shutdown')
+    c, w = statistics.median(cold), statistics.median(warm) if warm else float('nan')
+    return result('daemon', len(cold) + len(warm), (sum(cold) + sum(warm)) / 1000,
+                  f"p50 cold {c:.0f}ms, via daemon {w:.0f}ms", problems, cold_p50_ms=round(c), warm_p50_ms=round(w))
+
+
+SCENARIOS = {
+    'overhead': bench_overhead,
+    'throughput': bench_throughput,
+    'flood': bench_flood,
+    'timeout': bench_timeout,
+    'concurrency': bench_concurrency,
+    'batch': bench_batch,
+    'retry': bench_retry,
+    'large_prompt': bench_large_prompt,
+    'daemon': bench_daemon,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gemini.py 离线基准 / 压力测试")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="只跑指定场景，逗号分隔")
+    parser.add_argument("--runs", type=int, default=10, help="overhead / daemon 场景的重复次数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发调用数（batch 场景任务数为其 2 倍）")
+    parser.add_argument("--mb", type=int, default=64, help="throughput 场景的 stdout 体积（MiB）")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    names = [n for n in args.only.split(',') if n]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    print(f"{'scenario':<13} {'runs':>5} {'wall_s':>8}  {'metric':<58} status")
+    print("-" * 96)
+    results = []
+    box = Sandbox()
+    try:
+        for name in names:
+            r = SCENARIOS[name](box, args)
+            results.append(r)
+            print(f"{r['scenario']:<13} {r['runs']:>5} {r['wall_s']:>8.2f}  {r['metric']:<58} {r['status']}")
+    finally:
+        box.cleanup()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"JSON: {args.json}")
+
+    if any(r['status'] != 'ok' for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
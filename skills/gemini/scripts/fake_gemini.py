@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+离线替身 gemini 可执行文件（基准 / 压力测试用）
+
+命令行与 gemini CLI 一致（gemini -m <model> [-p <prompt>]，没有 -p 时从 stdin 读取 prompt），
+行为通过环境变量控制：
+
+  FAKE_GEMINI_STARTUP=0.5        启动耗时（秒，读取 prompt 之前）
+  FAKE_GEMINI_DELAY=1.0          首字节前的"模型"耗时（秒）
+  FAKE_GEMINI_STDOUT_BYTES=1e6   stdout 输出字节数（确定性内容，见 generate()）
+  FAKE_GEMINI_STDERR_BYTES=1e6   stderr 输出字节数（与 stdout 交替写入，用来制造管道写满）
+  FAKE_GEMINI_CHUNK=65536        每次写入的字节数
+  FAKE_GEMINI_CHUNK_DELAY=0.01   每次写入后的间隔（秒，模拟流式输出）
+  FAKE_GEMINI_EXIT=0             退出码
+  FAKE_GEMINI_ERROR=...          失败时写到 stderr 的消息（如 "429 Too Many Requests"）
+  FAKE_GEMINI_FAIL_TIMES=2       前 N 次调用按 FAKE_GEMINI_ERROR 失败（退出码 1），之后正常；计数存于 FAKE_GEMINI_STATE
+  FAKE_GEMINI_HANG=1             输出后挂起不退出；=term 时还忽略 SIGTERM（只能被 SIGKILL）
+  FAKE_GEMINI_PIDFILE=path       启动时追加写入自身 pid（检查是否有残留进程）
+  FAKE_GEMINI_ECHO=1             stdout 末尾追加一行 prompt 的字节数和 sha256
+
+用法:
+  ln -s fake_gemini.py /tmp/fakebin/gemini && PATH=/tmp/fakebin:$PATH python3 gemini.py "hi"
+"""
+import hashlib
+import os
+import signal
+import sys
+import time
+
+LINE = 64  # generate() 每行字节数（含换行）
+
+
+def _env(name: str, default: float = 0) -> float:
+    return float(os.environ.get(f'FAKE_GEMINI_{name}', default))
+
+
+def generate(nbytes: int, offset: int = 0) -> bytes:
+    """确定性输出：每行 '<8 位行号> ' + 填充 + '\\n'，同样的 nbytes 总是得到同样的内容"""
+    first, last = offset // LINE, (offset + nbytes + LINE - 1) // LINE
+    lines = b''.join(f"{i:08d} ".encode() + b'.' * (LINE - 10) + b'\n' for i in range(first, last))
+    start = offset - first * LINE
+    return lines[start:start + nbytes]
+
+
+def _should_fail() -> bool:
+    times = int(_env('FAIL_TIMES'))
+    if not times:
+        return False
+    state = os.environ.get('FAKE_GEMINI_STATE', '/tmp/fake_gemini.state')
+    try:
+        with open(state) as f:
+            count = int(f.read() or 0)
+    except (OSError, ValueError):
+        count = 0
+    with open(state, 'w') as f:
+        f.write(str(count + 1))
+    return count < times
+
+
+def main():
+    if os.environ.get('FAKE_GEMINI_PIDFILE'):
+        with open(os.environ['FAKE_GEMINI_PIDFILE'], 'a') as f:
+            f.write(f"{os.getpid()}\n")
+    if os.environ.get('FAKE_GEMINI_HANG') == 'term':
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(_env('STARTUP'))
+
+    argv = sys.argv[1:]
+    prompt = argv[argv.index('-p') + 1].encode() if '-p' in argv else sys.stdin.buffer.read()
+    time.sleep(_env('DELAY'))
+
+    if _should_fail():
+        sys.stderr.write(os.environ.get('FAKE_GEMINI_ERROR', 'Error: 429 Too Many Requests') + '\n')
+        sys.exit(1)
+
+    out, err = sys.stdout.buffer, sys.stderr.buffer
+    remaining_out, remaining_err = int(_env('STDOUT_BYTES')), int(_env('STDERR_BYTES'))
+    chunk, chunk_delay = int(_env('CHUNK', 65536)), _env('CHUNK_DELAY')
+    written = 0
+    while remaining_out or remaining_err:
+        if remaining_out:
+            size = min(chunk, remaining_out)
+            out.write(generate(size, written))
+            out.flush()
+            written += size
+            remaining_out -= size
+        if remaining_err:
+            size = min(chunk, remaining_err)
+            err.write(b'E' * (size - 1) + b'\n')
+            err.flush()
+            remaining_err -= size
+        if chunk_delay:
+            time.sleep(chunk_delay)
+
+    if os.environ.get('FAKE_GEMINI_ECHO'):
+        out.write(f"prompt bytes={len(prompt)} sha256={hashlib.sha256(prompt).hexdigest()}\n".encode())
+        out.flush()
+    if os.environ.get('FAKE_GEMINI_HANG'):
+        while True:
+            time.sleep(3600)
+
+    code = int(_env('EXIT'))
+    if code:
+        sys.stderr.write(os.environ.get('FAKE_GEMINI_ERROR', f'Error: exit {code}') + '\n')
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
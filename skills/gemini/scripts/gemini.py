@@ -10,16 +10,90 @@ Usage:
     uv run gemini.py "<prompt>" [workdir]
     python3 gemini.py "<prompt>"
     ./gemini.py "your prompt"
+    python3 gemini.py --prompt-file prompt.md [workdir]  # 从文件读取 prompt
+    git diff | python3 gemini.py - [workdir]             # 从 stdin 读取 prompt
+    python3 gemini.py --include 'src/*.py' --max-bytes 200000 "<prompt>" [workdir]  # 打包工作目录文件作为上下文
+    python3 gemini.py --batch tasks.jsonl --jobs 4     # 批量模式，每行 {"id", "prompt", "workdir"}
+    GEMINI_CACHE=1 python3 gemini.py "<prompt>"        # 启用本地响应缓存
+    python3 gemini.py --metrics "<prompt>"             # 运行结束后向 stderr 输出一行 METRICS: {json}
+    python3 gemini.py --daemon --workers 4 &           # 常驻进程，之后的调用自动经 Unix socket 提交（POSIX）
+    python3 gemini.py --buffer-output "<prompt>"       # 只输出最终成功那次尝试的 stdout（重试时不重复输出）
 """
 import subprocess
+import threading
+import argparse
+import fnmatch
+import hashlib
+import io
+import json
+import mmap
+import random
+import re
+import signal
+import socket
+import socketserver
+import struct
+import tempfile
+import zlib
+import time
 import sys
 import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 DEFAULT_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-3-pro-preview')
+FALLBACK_MODELS = [m.strip() for m in os.environ.get('GEMINI_FALLBACK_MODELS', '').split(',') if m.strip()]
 DEFAULT_WORKDIR = '.'
 TIMEOUT_MS = 7_200_000  # 固定 2 小时，毫秒
 DEFAULT_TIMEOUT = TIMEOUT_MS // 1000
 FORCE_KILL_DELAY = 5
+PIPE_CHUNK = 64 * 1024  # 每次从子进程管道读取的最大字节数
+PROMPT_INLINE_MAX = 8 * 1024  # 不超过该字节数的 prompt 走 -p 参数，更大的经 stdin 管道传给 gemini
+DEFAULT_JOBS = 4
+STDERR_TAIL = 8 * 1024  # 每次尝试保留的 stderr 尾部字节数（失败分类、批量结果）
+
+# 失败重试：限流 / 临时网络错误按指数退避重试，限流重试用尽或配额耗尽时切换到 GEMINI_FALLBACK_MODELS
+MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', 3))
+BACKOFF_BASE = float(os.environ.get('GEMINI_BACKOFF_BASE', 2))  # 秒，第 n 次重试前退避 BACKOFF_BASE * 2^n（带抖动）
+BACKOFF_MAX = float(os.environ.get('GEMINI_BACKOFF_MAX', 60))
+# 按顺序匹配 stderr 尾部，先匹配到的类别生效。只认 CLI 错误行里的状态码 / 错误名，
+# 不看 stdout（模型回答里出现 "network"、"503" 之类的词不代表调用失败）
+FAILURE_PATTERNS = [
+    ('quota', re.compile(rb'(?i:exceeded your current quota|quota exceeded|daily limit exceeded)')),
+    ('rate_limit', re.compile(rb'(?i:\b(?:status|code)"?\s*[:=]?\s*429\b|\b429 too many requests|too many requests)'
+                              rb'|\bRESOURCE_EXHAUSTED\b')),
+    ('transient', re.compile(rb'(?i:\b(?:status|code)"?\s*[:=]?\s*50[0234]\b'
+                             rb'|\b50[0234] (?:internal server error|bad gateway|service unavailable|gateway timeout)'
+                             rb'|model is overloaded|socket hang up|fetch failed)'
+                             rb'|\b(?:UNAVAILABLE|DEADLINE_EXCEEDED|ECONNRESET|ECONNREFUSED|ETIMEDOUT|EAI_AGAIN|ENOTFOUND)\b')),
+]
+RETRYABLE = {'rate_limit', 'transient'}
+OUTPUT = {'buffer': False}  # --buffer-output：缓冲每次尝试的 stdout，只输出成功的那次
+
+# 响应缓存（默认关闭，GEMINI_CACHE=1 启用）
+CACHE_ENABLED = os.environ.get('GEMINI_CACHE', '').lower() in ('1', 'true', 'yes', 'on')
+CACHE_DIR = os.path.expanduser(os.environ.get('GEMINI_CACHE_DIR', '~/.cache/gemini-skill'))
+CACHE_TTL = int(os.environ.get('GEMINI_CACHE_TTL', 7 * 24 * 3600))  # 秒，自写入起计算
+CACHE_MAX_BYTES = int(os.environ.get('GEMINI_CACHE_MAX_MB', 256)) * 1024 * 1024
+CACHE_HEADER = struct.Struct('>d')  # 条目文件头：写入时间戳，其后为 zlib 压缩的输出
+
+# 上下文打包（--include / --max-bytes）
+CONTEXT_MAX_BYTES = 512 * 1024
+CONTEXT_DIGESTS = os.path.join(CACHE_DIR, 'context-digests.json')  # 文件摘要缓存：按 mtime / size 复用
+BINARY_SNIFF = 8192  # 前 N 字节出现 NUL 视为二进制文件
+
+# 运行指标：--metrics 输出到 stderr，GEMINI_METRICS_FILE 追加 JSONL
+METRICS = {'stderr': False, 'file': os.environ.get('GEMINI_METRICS_FILE')}
+_METRICS_LOCK = threading.Lock()
+
+# daemon 模式：Unix socket 服务 + 每个工作目录一个预热的 gemini 进程
+DAEMON_SOCKET = os.path.expanduser(os.environ.get('GEMINI_DAEMON_SOCKET', '~/.cache/gemini-skill/daemon.sock'))
+DAEMON_ENABLED = os.environ.get('GEMINI_DAEMON', '1') != '0'  # 客户端是否使用已运行的 daemon
+DAEMON_WORKERS = 4          # 同时运行的 gemini 进程上限，多余请求排队
+DAEMON_IDLE_TIMEOUT = 600   # 秒，无请求时自动退出
+DAEMON_WARM_DIRS = 4        # 保留预热进程的最近工作目录数
+FRAME = struct.Struct('>cI')  # daemon 响应帧：通道（o=stdout, e=stderr, x=结束）+ 长度
 
 
 def log_error(message: str):
@@ -37,33 +111,1103 @@ def log_info(message: str):
     sys.stderr.write(f"INFO: {message}\n")
 
 
-def parse_args():
-    """解析位置参数"""
-    if len(sys.argv) < 2:
+def parse_args(argv: list) -> dict:
+    """解析命令行：[选项...] <prompt> | -（stdin） [workdir]
+
+    选项只在 prompt 之前识别：--prompt-file PATH（代替 prompt）、--include GLOB（可重复）、--max-bytes N、
+    --metrics、--buffer-output。之后的参数一律是位置参数，恰好和选项同名的 prompt / workdir 也不会被吞掉。
+    """
+    argv, includes, max_bytes, prompt_file = list(argv), [], None, None
+    while argv and argv[0] in ('--prompt-file', '--include', '--max-bytes', '--metrics', '--buffer-output'):
+        arg = argv.pop(0)
+        if arg == '--metrics':
+            METRICS['stderr'] = True
+            continue
+        if arg == '--buffer-output':
+            OUTPUT['buffer'] = True
+            continue
+        if not argv:
+            log_error(f'{arg} requires a value')
+            sys.exit(1)
+        value = argv.pop(0)
+        if arg == '--prompt-file':
+            prompt_file = value
+        elif arg == '--include':
+            includes.append(value)
+        elif value.isdigit():
+            max_bytes = int(value)
+        else:
+            log_error(f'--max-bytes expects a byte count: {value}')
+            sys.exit(1)
+
+    if prompt_file is not None:
+        args = {'prompt': None, 'prompt_file': prompt_file}
+    elif argv:
+        args = {'prompt': None, 'prompt_file': '-'} if argv[0] == '-' else {'prompt': argv[0]}
+        argv = argv[1:]
+    else:
         log_error('Prompt required')
         sys.exit(1)
 
-    return {
-        'prompt': sys.argv[1],
-        'workdir': sys.argv[2] if len(sys.argv) > 2 else DEFAULT_WORKDIR
-    }
+    args['workdir'] = argv[0] if argv else DEFAULT_WORKDIR
+    if includes:
+        args.update(include=includes, max_bytes=max_bytes)
+    return args
+
+
+def prepare_prompt(args: dict) -> dict:
+    """决定 prompt 的传递方式
+
+    不超过 PROMPT_INLINE_MAX 字节的 prompt 放在 args['prompt'] 里走 -p 参数；更大的 prompt 以可 seek 的
+    二进制流放在 args['prompt_stream'] 里，运行时分块写入子进程 stdin，既不受 ARG_MAX / Windows 命令行
+    长度限制，也不会出现在 ps 中。stdin 输入先写入 SpooledTemporaryFile（大输入落盘，不在内存中整份保留）。
+    """
+    source = args.pop('prompt_file', None)
+    includes = args.pop('include', None)
+    max_bytes = args.pop('max_bytes', None)
+    if source is None and not includes:
+        data = args['prompt'].encode('utf-8')
+        args['prompt_size'] = len(data)
+        if len(data) > PROMPT_INLINE_MAX:
+            args['prompt'], args['prompt_stream'] = None, io.BytesIO(data)
+        return args
 
+    if includes:
+        # 上下文块在前，prompt 在后
+        stream = tempfile.SpooledTemporaryFile(max_size=PROMPT_INLINE_MAX)
+        pack_context(args['workdir'], includes, max_bytes or CONTEXT_MAX_BYTES, stream)
+        if source is None:
+            stream.write(args['prompt'].encode('utf-8'))
+        else:
+            with (sys.stdin.buffer if source == '-' else open(source, 'rb')) as src:
+                for chunk in iter(lambda: src.read(PIPE_CHUNK), b''):
+                    stream.write(chunk)
+    elif source == '-':
+        stream = tempfile.SpooledTemporaryFile(max_size=PROMPT_INLINE_MAX)
+        for chunk in iter(lambda: sys.stdin.buffer.read(PIPE_CHUNK), b''):
+            stream.write(chunk)
+    else:
+        stream = open(source, 'rb')
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    args['prompt_size'] = size
+    if size > PROMPT_INLINE_MAX:
+        args['prompt_stream'] = stream
+    else:
+        with stream:
+            args['prompt'] = stream.read().decode('utf-8', errors='replace')
+    return args
 
-def build_gemini_args(args) -> list:
-    """构建 gemini CLI 参数"""
+
+def build_gemini_args(args, model: str = DEFAULT_MODEL) -> list:
+    """构建 gemini CLI 参数（prompt 经 stdin 传递时不带 -p，gemini 从 stdin 读取）"""
+    if args.get('prompt_stream') is not None:
+        return ['gemini', '-m', model]
     return [
         'gemini',
-        '-m', DEFAULT_MODEL,
+        '-m', model,
         '-p', args['prompt']
     ]
 
 
-def main():
-    log_info('Script started')
-    args = parse_args()
-    log_info(f"Prompt length: {len(args['prompt'])}")
-    log_info(f"Working dir: {args['workdir']}")
-    gemini_args = build_gemini_args(args)
+def classify_failure(returncode: int, stderr: bytes) -> str:
+    """根据退出码和 stderr 尾部判断失败类别：
+    ok / timeout / quota / rate_limit / transient / fatal"""
+    if returncode == 0:
+        return 'ok'
+    if returncode == 124:
+        return 'timeout'
+    if returncode != 127:
+        for kind, pattern in FAILURE_PATTERNS:
+            if pattern.search(stderr):
+                return kind
+    return 'fatal'
+
+
+def backoff_delay(retry: int) -> float:
+    """第 retry 次重试（从 0 开始）前的退避时间：指数增长、封顶，一半固定一半随机抖动"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def run_with_retries(run_once, retries: int = MAX_RETRIES, retry_on=RETRYABLE, sleep=time.sleep,
+                     deadline: float = None) -> tuple:
+    """按失败类别重试 run_once(model, attempt) -> (returncode, stderr 尾部)，返回 (returncode, 类别, model, 尝试次数)
+
+    retry_on 中的类别在同一模型上退避重试 retries 次；quota 立即、rate_limit 重试用尽后切换到下一个备用模型；
+    其他失败直接返回。sleep 用于退避等待（批量模式传入可被中断的等待）。
+    deadline（time.monotonic() 时刻）是所有尝试共用的截止时间：退避会越过它时不再重试，到期后返回 124。
+    """
+    models = [DEFAULT_MODEL] + [m for m in FALLBACK_MODELS if m != DEFAULT_MODEL]
+    attempt = 0
+    for index, model in enumerate(models):
+        for retry in range(retries + 1):
+            if deadline is not None and time.monotonic() >= deadline:
+                return 124, 'timeout', model, attempt
+            attempt += 1
+            code, stderr = run_once(model, attempt)
+            kind = classify_failure(code, stderr)
+            if kind == 'quota' or kind not in retry_on:
+                break
+            if retry < retries:
+                delay = backoff_delay(retry)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    log_warn(f"Gemini failed ({kind}, exit {code}) with model {model}; no time left to retry")
+                    return code, kind, model, attempt
+                log_warn(f"Gemini failed ({kind}, exit {code}) with model {model}; "
+                         f"retry {retry + 1}/{retries} in {delay:.1f}s")
+                sleep(delay)
+        if kind not in ('quota', 'rate_limit') or index + 1 == len(models):
+            return code, kind, model, attempt
+        log_warn(f"Gemini failed ({kind}) with model {model}; falling back to {models[index + 1]}")
+    return code, kind, model, attempt
+
+
+def prompt_digest(args: dict) -> bytes:
+    """prompt 内容的 sha256（流式读取，不复制整个 prompt）"""
+    stream = args.get('prompt_stream')
+    if stream is None:
+        return hashlib.sha256(args['prompt'].encode('utf-8')).digest()
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(PIPE_CHUNK), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.digest()
+
+
+def _forward(stream):
+    """返回把字节块写到 stream 并立即 flush 的函数"""
+    target = getattr(stream, 'buffer', stream)
+
+    def write(chunk: bytes):
+        target.write(chunk)
+        target.flush()
+    return write
+
+
+def _pump(pipe, sink):
+    """持续读取子进程管道，按块交给 sink，直到 EOF"""
+    try:
+        for chunk in iter(lambda: pipe.read1(PIPE_CHUNK), b''):
+            sink(chunk)
+    except (OSError, ValueError):
+        pass  # 管道被关闭（进程已被终止）
+    finally:
+        pipe.close()
+
+
+def _feed(pipe, stream):
+    """把 prompt 流从头分块写入子进程 stdin，写完关闭管道（子进程提前退出时忽略 BrokenPipe）"""
+    try:
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(PIPE_CHUNK), b''):
+            pipe.write(chunk)
+    except (OSError, ValueError):
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+class _StreamMeter:
+    """包装输出 sink，统计字节数、行数和首字节时间"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.first_byte = None
+        self.bytes = self.lines = 0
+        self.last = b'\n'
+
+    def __call__(self, chunk: bytes):
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+        self.bytes += len(chunk)
+        self.lines += chunk.count(b'\n')
+        self.last = chunk[-1:]
+        self.sink(chunk)
+
+    def total_lines(self) -> int:
+        return self.lines + (self.last != b'\n')  # 末尾没有换行的最后一行也计入
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def new_metrics(args: dict, workdir: str, **extra) -> dict:
+    """一次运行的指标记录，run_gemini 和调用方逐步填充"""
+    record = {
+        'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'model': DEFAULT_MODEL,
+        'workdir': workdir,
+        'prompt_bytes': args.get('prompt_size'),
+        'transport': 'stdin' if args.get('prompt_stream') is not None else 'argv',
+        'cached': False,
+        'spawn_ms': None,
+        'ttfb_ms': None,
+        'duration_ms': None,
+        'stdout_bytes': 0,
+        'stdout_lines': 0,
+        'stderr_bytes': 0,
+        'exit_code': None,
+    }
+    record.update(extra)
+    return record
+
+
+def emit_metrics(record: dict):
+    """按配置输出指标记录：stderr 的 METRICS 行和 / 或追加到 GEMINI_METRICS_FILE"""
+    if not (METRICS['stderr'] or METRICS['file']):
+        return
+    line = json.dumps(record, ensure_ascii=False)
+    with _METRICS_LOCK:
+        if METRICS['stderr']:
+            sys.stderr.write(f"METRICS: {line}\n")
+        if METRICS['file']:
+            try:
+                with open(METRICS['file'], 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                log_warn(f"Cannot write metrics file: {e}")
+
+
+def terminate_process(process):
+    """先 SIGTERM，FORCE_KILL_DELAY 秒内未退出再 SIGKILL"""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=FORCE_KILL_DELAY)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def spawn_gemini(gemini_args: list, cwd=None, stdin_pipe: bool = False):
+    return subprocess.Popen(
+        gemini_args,
+        stdin=subprocess.PIPE if stdin_pipe else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+    )
+
+
+def run_gemini(gemini_args: list, timeout_sec: float, cwd=None, on_stdout=None, on_stderr=None,
+               stdin_stream=None, metrics=None, process=None, spawn=spawn_gemini) -> int:
+    """运行 gemini 并实时转发 stdout / stderr，返回退出码
+
+    两个管道各由一个线程并发读取，任何一方写满管道缓冲区都不会卡住子进程；
+    timeout_sec 是整次运行的截止时间（包括输出仍在流式返回的阶段），超时终止子进程并抛出 subprocess.TimeoutExpired。
+    stdin_stream（可 seek 的二进制流）由单独的线程写入子进程 stdin。
+    传入 metrics（new_metrics 的记录）时填充 spawn / 首字节 / 总耗时、输出字节数和行数、退出码。
+    process 是已经启动、正在等待 stdin 的 gemini 进程（daemon 预热），此时不再启动新进程；
+    spawn 是启动子进程的函数（批量模式用 BatchChildren.spawn 登记子进程）。
+    """
+    started = time.monotonic()
+    deadline = started + timeout_sec
+    if process is None:
+        process = spawn(gemini_args, cwd=cwd, stdin_pipe=stdin_stream is not None)
+    stdout_meter = _StreamMeter(on_stdout or _forward(sys.stdout))
+    stderr_meter = _StreamMeter(on_stderr or _forward(sys.stderr))
+    if metrics is not None:
+        metrics['spawn_ms'] = _ms(time.monotonic() - started)
+    try:
+        returncode = _wait_gemini(process, deadline, stdout_meter, stderr_meter, stdin_stream)
+    finally:
+        if metrics is not None:
+            metrics.update(
+                duration_ms=_ms(time.monotonic() - started),
+                ttfb_ms=_ms(stdout_meter.first_byte - started) if stdout_meter.first_byte else None,
+                stdout_bytes=stdout_meter.bytes,
+                stdout_lines=stdout_meter.total_lines(),
+                stderr_bytes=stderr_meter.bytes,
+                exit_code=process.returncode,
+            )
+    return returncode
+
+
+def _wait_gemini(process, deadline: float, on_stdout, on_stderr, stdin_stream) -> int:
+    pumps = [
+        threading.Thread(target=_pump, args=(process.stdout, on_stdout), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, on_stderr), daemon=True),
+    ]
+    if stdin_stream is not None:
+        pumps.append(threading.Thread(target=_feed, args=(process.stdin, stdin_stream), daemon=True))
+    for pump in pumps:
+        pump.start()
+
+    try:
+        returncode = process.wait(timeout=max(0.0, deadline - time.monotonic()))
+    except BaseException:
+        # 超时或 Ctrl-C：终止子进程，管道随之关闭，读取线程自然退出
+        terminate_process(process)
+        for pump in pumps:
+            pump.join(FORCE_KILL_DELAY)
+        raise
+
+    # 子进程已退出：读完管道里剩余的输出（孙进程占着管道时最多再等 FORCE_KILL_DELAY 秒）
+    for pump in pumps:
+        pump.join(max(0.0, min(FORCE_KILL_DELAY, deadline - time.monotonic())))
+    return returncode
+
+
+def _git(workdir: str, *args):
+    result = subprocess.run(['git', *args], cwd=workdir, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, timeout=30)
+    return result.stdout if result.returncode == 0 else None
+
+
+def workdir_fingerprint(workdir: str):
+    """工作目录指纹：git HEAD + 未提交文件（含未跟踪）的内容哈希；非 git 目录返回 None（不缓存）"""
+    try:
+        head = _git(workdir, 'rev-parse', 'HEAD', '--show-toplevel')
+        status = head and _git(workdir, 'status', '--porcelain=v1', '-z', '--untracked-files=all')
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if status is None:
+        return None
+
+    digest = hashlib.sha256(head)
+    digest.update(os.path.realpath(workdir).encode())
+    toplevel = head.decode().splitlines()[-1]
+    entries = iter(status.split(b'\0'))
+    for entry in entries:
+        if not entry:
+            continue
+        digest.update(entry + b'\0')
+        if entry[:1] in (b'R', b'C'):
+            next(entries, None)  # 重命名 / 复制条目后跟原路径
+        path = os.path.join(toplevel, os.fsdecode(entry[3:]))
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(PIPE_CHUNK), b''):
+                    digest.update(chunk)
+        except (IsADirectoryError, FileNotFoundError, PermissionError):
+            continue
+    return digest.hexdigest()
+
+
+def _gitignore_patterns(root: str) -> list:
+    try:
+        with open(os.path.join(root, '.gitignore'), encoding='utf-8', errors='replace') as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith(('#', '!'))]
+
+
+def _ignored(rel: str, is_dir: bool, patterns: list) -> bool:
+    """简化的 .gitignore 匹配（仅根目录的 .gitignore，不支持 ! 取反）"""
+    name = rel.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith('/'):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip('/')
+        if '/' in pattern.lstrip('/'):
+            if fnmatch.fnmatch(rel, pattern.lstrip('/')):
+                return True
+        elif fnmatch.fnmatch(name, pattern.lstrip('/')):
+            return True
+    return False
+
+
+def list_workdir_files(root: str) -> list:
+    """列出工作目录下的文件（相对路径，/ 分隔），遵循 .gitignore
+
+    git 仓库内直接用 git ls-files（已跟踪 + 未被忽略的未跟踪文件）；否则遍历目录并按根目录 .gitignore 过滤。
+    """
+    try:
+        listed = _git(root, 'ls-files', '-co', '--exclude-standard', '-z')
+    except (OSError, subprocess.TimeoutExpired):
+        listed = None
+    if listed is not None:
+        return [os.fsdecode(path) for path in listed.split(b'\0') if path]
+
+    patterns, files = _gitignore_patterns(root), []
+    for dirpath, dirnames, filenames in os.walk(root):
+        base = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        base = '' if base == '.' else base + '/'
+        dirnames[:] = sorted(d for d in dirnames if d != '.git' and not _ignored(base + d, True, patterns))
+        files.extend(base + name for name in sorted(filenames) if not _ignored(base + name, False, patterns))
+    return files
+
+
+def _load_digests(root: str) -> dict:
+    try:
+        with open(CONTEXT_DIGESTS, encoding='utf-8') as f:
+            return json.load(f).get(root, {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_digests(root: str, digests: dict):
+    """只保留本次遍历到的文件，写回摘要缓存（临时文件 + rename）"""
+    try:
+        with open(CONTEXT_DIGESTS, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[root] = digests
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{CONTEXT_DIGESTS}.{os.getpid()}.{threading.get_ident()}.tmp"  # 批量任务可能在多个线程同时写
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, CONTEXT_DIGESTS)
+    except OSError as e:
+        log_warn(f"Cannot write context digest cache: {e}")
+
+
+def _digest_file(path: str):
+    """mmap 读取文件，返回 (sha256, 是否二进制)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest(), False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).hexdigest(), data.find(b'\0', 0, BINARY_SNIFF) != -1
+
+
+def pack_context(workdir: str, includes: list, max_bytes: int, out) -> dict:
+    """把工作目录中匹配 --include 的文件打包成上下文块写入 out，返回统计
+
+    优先级：先按 --include 的先后顺序，同一模式内最近修改的文件在前；内容相同的文件只收录第一份，
+    二进制文件跳过，放不进 max_bytes 预算的文件跳过（继续尝试后面更小的文件）。
+    文件摘要按 (mtime, size) 缓存在 CONTEXT_DIGESTS，未变化的文件不必重新读取就能去重和识别二进制。
+    """
+    started = time.monotonic()
+    root = os.path.realpath(workdir)
+    cached, digests = _load_digests(root), {}
+    stats = {'files': 0, 'bytes': 0, 'duplicates': 0, 'binary': 0, 'over_budget': 0}
+
+    candidates = []
+    for rel in list_workdir_files(root):
+        rank = next((i for i, pattern in enumerate(includes) if fnmatch.fnmatch(rel, pattern)), None)
+        if rank is None:
+            continue
+        path = os.path.join(root, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if not os.path.isfile(path):
+            continue
+        entry = cached.get(rel)
+        if not entry or entry[:2] != [st.st_mtime_ns, st.st_size]:
+            try:
+                entry = [st.st_mtime_ns, st.st_size, *_digest_file(path)]
+            except (OSError, ValueError):
+                continue
+        digests[rel] = entry
+        candidates.append((rank, -st.st_mtime_ns, rel))
+    _save_digests(root, digests)
+
+    out.write(b'<context>\n')
+    budget, seen, omitted = max_bytes, {}, []
+    for _, _, rel in sorted(candidates):
+        size, digest, binary = digests[rel][1:]
+        if binary:
+            stats['binary'] += 1
+            continue
+        if digest in seen:
+            stats['duplicates'] += 1
+            note = f'<file path="{rel}" same-as="{seen[digest]}"/>\n'.encode()
+            if len(note) <= budget:
+                out.write(note)
+                budget -= len(note)
+            continue
+        head, tail = f'<file path="{rel}">\n'.encode(), b'\n</file>\n'
+        if len(head) + size + len(tail) > budget:
+            stats['over_budget'] += 1
+            omitted.append(rel)
+            continue
+        out.write(head)
+        with open(os.path.join(root, rel), 'rb') as f:
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    out.write(data)
+                    if data[-1:] == b'\n':
+                        tail = tail[1:]
+        out.write(tail)
+        seen[digest] = rel
+        budget -= len(head) + size + len(tail)
+        stats['files'] += 1
+        stats['bytes'] += size
+    if omitted:
+        out.write(f"<omitted reason=\"size budget\">{' '.join(omitted[:50])}</omitted>\n".encode())
+    out.write(b'</context>\n\n')
+
+    stats['ms'] = _ms(time.monotonic() - started)
+    log_info(f"Context: {stats['files']} files, {stats['bytes']} bytes from {len(candidates)} matches "
+             f"({stats['duplicates']} duplicates, {stats['binary']} binary, {stats['over_budget']} over budget) "
+             f"in {stats['ms']}ms")
+    return stats
+
+
+class ResponseCache:
+    """本地响应缓存：key = (prompt, 模型, 工作目录指纹)，条目 zlib 压缩，按 TTL 过期、按总大小 LRU 淘汰
+
+    条目文件的 mtime 记录最近一次访问时间（命中时更新），作为 LRU 顺序。
+    查找总是用主模型的 key，所以只缓存主模型的回答，备用模型的回答不写入。
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, args: dict, workdir: str, model: str = DEFAULT_MODEL):
+        fingerprint = workdir_fingerprint(workdir)
+        if fingerprint is None:
+            return None
+        digest = hashlib.sha256(json.dumps([model, fingerprint]).encode())
+        digest.update(prompt_digest(args))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.zz")
+
+    def get(self, key: str):
+        """返回缓存的输出 bytes；未命中或已过期返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                created, = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                data = f.read()
+            if time.time() - created > self.ttl:
+                os.remove(path)
+                output = None
+            else:
+                output = zlib.decompress(data)
+                os.utime(path)
+        except (OSError, struct.error, zlib.error):
+            output = None
+        with self.lock:
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return output
+
+    def put(self, key: str, output: bytes):
+        data = CACHE_HEADER.pack(time.time()) + zlib.compress(output, 6)
+        if len(data) > self.max_bytes:
+            return
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """删除过期条目，再按最近访问时间从旧到新淘汰，直到总大小不超过上限"""
+        entries, total, now = [], 0, time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.zz'):
+                    continue
+                try:
+                    st = entry.stat()
+                    with open(entry.path, 'rb') as f:
+                        created, = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                except (OSError, struct.error):
+                    continue
+                if now - created > self.ttl:
+                    self._remove(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        rate = f"{self.hits / lookups:.0%}" if lookups else 'n/a'
+        return f"Cache stats: hits={self.hits} misses={self.misses} hit rate={rate}"
+
+
+class WarmPool:
+    """daemon 的预热进程池：每个最近使用的工作目录保留一个已启动、阻塞在 stdin 上的 gemini 进程
+
+    gemini 在 stdin 不是终端时读完 stdin 再作为 prompt 处理，所以可以提前启动（加载 Node 运行时、
+    配置和认证），请求到达时只需写入 prompt。预热进程存活超过 max_age 后丢弃重建。
+    """
+
+    def __init__(self, max_dirs: int = DAEMON_WARM_DIRS, max_age: float = DAEMON_IDLE_TIMEOUT):
+        self.max_dirs = max_dirs
+        self.max_age = max_age
+        self.spares = OrderedDict()  # workdir -> (spawn 时间, Popen)
+        self.lock = threading.Lock()
+
+    def take(self, workdir: str):
+        with self.lock:
+            spawned, process = self.spares.pop(workdir, (0, None))
+        if process is not None and (process.poll() is not None or time.monotonic() - spawned > self.max_age):
+            terminate_process(process)
+            process = None
+        return process
+
+    def refill(self, workdir: str):
+        try:
+            process = spawn_gemini(['gemini', '-m', DEFAULT_MODEL], cwd=workdir, stdin_pipe=True)
+        except OSError:
+            return
+        stale = []
+        with self.lock:
+            if workdir in self.spares:
+                stale.append(self.spares.pop(workdir)[1])
+            self.spares[workdir] = (time.monotonic(), process)
+            while len(self.spares) > self.max_dirs:
+                stale.append(self.spares.popitem(last=False)[1][1])
+        for process in stale:
+            terminate_process(process)
+
+    def close(self):
+        with self.lock:
+            spares, self.spares = list(self.spares.values()), OrderedDict()
+        for _, process in spares:
+            terminate_process(process)
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    """一个连接一个请求：头部一行 JSON {"workdir", "timeout", "prompt_bytes"}，随后是 prompt 字节；
+    响应是 FRAME 帧序列，最后一帧 x 携带 {"exit_code", "error", "metrics"}"""
+
+    def handle(self):
+        server = self.server
+        try:
+            header = json.loads(self.rfile.readline())
+            stream = tempfile.SpooledTemporaryFile(max_size=PROMPT_INLINE_MAX)
+            remaining = int(header['prompt_bytes'])
+            while remaining:
+                chunk = self.rfile.read(min(remaining, PIPE_CHUNK))
+                if not chunk:
+                    return  # 客户端提前断开
+                stream.write(chunk)
+                remaining -= len(chunk)
+            workdir, timeout_sec = header['workdir'], float(header.get('timeout') or DEFAULT_TIMEOUT)
+            model = header.get('model') or DEFAULT_MODEL
+        except (ValueError, KeyError, OSError) as e:
+            log_warn(f"Daemon: bad request ({e})")
+            return
+
+        write_lock = threading.Lock()
+
+        def send(channel: bytes, data: bytes):
+            with write_lock:
+                self.wfile.write(FRAME.pack(channel, len(data)) + data)
+                self.wfile.flush()
+
+        if not os.path.isdir(workdir):
+            stream.close()
+            send(b'x', json.dumps({'exit_code': 1, 'error': f"Working directory not found: {workdir}",
+                                   'metrics': {}}).encode())
+            return
+
+        with server.slots:
+            server.begin_request()
+            try:
+                args = {'prompt_size': int(header['prompt_bytes']), 'prompt_stream': stream}
+                metrics = new_metrics(args, workdir, model=model)
+                # 预热进程都是默认模型，备用模型的请求直接启动新进程
+                process = server.pool.take(workdir) if model == DEFAULT_MODEL else None
+                metrics['warm'] = process is not None
+                error = None
+                try:
+                    code = run_gemini(build_gemini_args(args, model), timeout_sec, cwd=workdir,
+                                      on_stdout=lambda chunk: send(b'o', chunk),
+                                      on_stderr=lambda chunk: send(b'e', chunk),
+                                      stdin_stream=stream, metrics=metrics, process=process)
+                except subprocess.TimeoutExpired:
+                    code, error = 124, 'timeout'
+                except FileNotFoundError:
+                    code, error = 127, 'not_found'
+                metrics['exit_code'] = code
+                if code != 127 and model == DEFAULT_MODEL:
+                    threading.Thread(target=server.pool.refill, args=(workdir,), daemon=True).start()
+                try:
+                    send(b'x', json.dumps({'exit_code': code, 'error': error, 'metrics': metrics}).encode())
+                except OSError:
+                    pass
+            finally:
+                stream.close()
+                server.end_request()
+
+
+class GeminiDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, workers: int, idle_timeout: float):
+        self.slots = threading.BoundedSemaphore(max(1, workers))
+        self.pool = WarmPool()
+        self.idle_timeout = idle_timeout
+        self.active = 0
+        self.last_activity = time.monotonic()
+        self.state_lock = threading.Lock()
+        super().__init__(path, _DaemonHandler)
+
+    def begin_request(self):
+        with self.state_lock:
+            self.active += 1
+
+    def end_request(self):
+        with self.state_lock:
+            self.active -= 1
+            self.last_activity = time.monotonic()
+
+    def watch_idle(self):
+        """空闲超过 idle_timeout 且没有进行中的请求时关闭服务"""
+        while True:
+            time.sleep(1)
+            with self.state_lock:
+                idle = self.active == 0 and time.monotonic() - self.last_activity > self.idle_timeout
+            if idle:
+                log_info(f"Daemon idle for {self.idle_timeout:g}s, shutting down")
+                self.shutdown()
+                return
+
+
+def connect_daemon():
+    """连接正在运行的 daemon；未启用、不支持或未运行时返回 None"""
+    if not (DAEMON_ENABLED and hasattr(socket, 'AF_UNIX') and os.path.exists(DAEMON_SOCKET)):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(DAEMON_SOCKET)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def run_via_daemon(sock, args: dict, timeout_sec: float, on_stdout=None, on_stderr=None, metrics=None,
+                   model: str = DEFAULT_MODEL) -> int:
+    """把 prompt 提交给 daemon 并转发流回的 stdout / stderr，接口和异常与 run_gemini 一致"""
+    on_stdout = on_stdout or _forward(sys.stdout)
+    on_stderr = on_stderr or _forward(sys.stderr)
+    sinks = {b'o': on_stdout, b'e': on_stderr}
+    stream = args.get('prompt_stream')
+    with sock, sock.makefile('rb') as reader:
+        sock.settimeout(timeout_sec + 2 * FORCE_KILL_DELAY)
+        header = {'workdir': os.getcwd(), 'timeout': timeout_sec, 'prompt_bytes': args['prompt_size'], 'model': model}
+        sock.sendall(json.dumps(header).encode() + b'\n')
+        if stream is None:
+            sock.sendall(args['prompt'].encode('utf-8'))
+        else:
+            stream.seek(0)
+            for chunk in iter(lambda: stream.read(PIPE_CHUNK), b''):
+                sock.sendall(chunk)
+        while True:
+            head = reader.read(FRAME.size)
+            if len(head) < FRAME.size:
+                raise ConnectionError('daemon closed the connection')
+            channel, size = FRAME.unpack(head)
+            payload = reader.read(size)
+            if channel != b'x':
+                sinks[channel](payload)
+                continue
+            result = json.loads(payload)
+            if metrics is not None:
+                metrics.update(result['metrics'], daemon=True)
+            if result['error'] == 'timeout':
+                raise subprocess.TimeoutExpired('gemini', timeout_sec)
+            if result['error'] == 'not_found':
+                raise FileNotFoundError(2, 'gemini command not found', 'gemini')
+            if result['error']:
+                log_error(result['error'])
+            return result['exit_code']
+
+
+def run_daemon(argv: list) -> int:
+    """--daemon 模式：在 Unix socket 上接收请求，并发数有上限，空闲超时后退出"""
+    parser = argparse.ArgumentParser(prog='gemini.py --daemon', description='Serve Gemini prompts over a Unix socket')
+    parser.add_argument('--workers', type=int, default=DAEMON_WORKERS, help=f'max concurrent gemini runs (default {DAEMON_WORKERS})')
+    parser.add_argument('--idle-timeout', type=float, default=DAEMON_IDLE_TIMEOUT, help=f'exit after this many idle seconds (default {DAEMON_IDLE_TIMEOUT})')
+    parser.add_argument('--socket', default=DAEMON_SOCKET, help=f'socket path (default {DAEMON_SOCKET})')
+    opts = parser.parse_args(argv)
+    if not hasattr(socket, 'AF_UNIX'):
+        log_error('Daemon mode requires Unix domain sockets')
+        return 1
+
+    os.makedirs(os.path.dirname(opts.socket), mode=0o700, exist_ok=True)
+    if os.path.exists(opts.socket):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(opts.socket)
+            log_error(f"Daemon already running on {opts.socket}")
+            return 1
+        except OSError:
+            os.unlink(opts.socket)  # 上次异常退出遗留的 socket
+        finally:
+            probe.close()
+
+    server = GeminiDaemon(opts.socket, opts.workers, opts.idle_timeout)
+    os.chmod(opts.socket, 0o600)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    log_info(f"Daemon listening on {opts.socket} (workers={opts.workers}, idle timeout={opts.idle_timeout:g}s)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.close()
+        try:
+            os.unlink(opts.socket)
+        except FileNotFoundError:
+            pass
+    log_info('Daemon stopped')
+    return 0
+
+
+def load_batch_tasks(source: str) -> list:
+    """读取批量任务：JSONL 文件或 '-'（stdin），每行 {"id"?, "prompt"（或 "task" / "prompt_file"）, "workdir"?, "timeout"?,
+    "include"?（glob 或列表）, "max_bytes"?}"""
+    stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    tasks, seen = [], set()
+    with stream:
+        for lineno, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                spec = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {lineno}: invalid JSON ({e})")
+            prompt = spec.get('prompt') or spec.get('task')
+            if not prompt and not spec.get('prompt_file'):
+                raise ValueError(f"line {lineno}: prompt is required")
+            include = spec.get('include')
+            task_id = re.sub(r'[^\w.-]+', '_', str(spec.get('id') or f"task-{lineno}"))
+            if task_id in seen:
+                raise ValueError(f"line {lineno}: duplicate task id '{task_id}'")
+            seen.add(task_id)
+            tasks.append({
+                'id': task_id,
+                'prompt': prompt,
+                'prompt_file': None if prompt else spec['prompt_file'],
+                'workdir': spec.get('workdir') or DEFAULT_WORKDIR,
+                'timeout': spec.get('timeout'),
+                'include': [include] if isinstance(include, str) else include,
+                'max_bytes': spec.get('max_bytes'),
+            })
+    return tasks
+
+
+class BatchChildren:
+    """批量模式正在运行的 gemini 子进程：Ctrl-C 后 stop() 终止它们，之后不再启动新进程"""
+
+    def __init__(self):
+        self.running = set()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def spawn(self, gemini_args: list, cwd=None, stdin_pipe: bool = False):
+        with self.lock:
+            if self.stopped.is_set():
+                raise KeyboardInterrupt
+            process = spawn_gemini(gemini_args, cwd=cwd, stdin_pipe=stdin_pipe)
+            self.running = {p for p in self.running if p.poll() is None}
+            self.running.add(process)
+        return process
+
+    def stop(self):
+        with self.lock:
+            self.stopped.set()
+            running = list(self.running)
+        for process in running:
+            if process.poll() is None:
+                process.terminate()
+        for process in running:
+            terminate_process(process)
+
+
+def run_batch_task(task: dict, timeout_sec: float, retries: int, cache=None, children=None) -> dict:
+    """执行单个批量任务（失败 / 超时时重试），返回结果记录"""
+    result = {'id': task['id'], 'workdir': task['workdir'], 'exit_code': None, 'attempts': 0,
+              'latency': 0.0, 'output': '', 'error': '', 'stderr': '', 'cached': False}
+    if not os.path.isdir(task['workdir']):
+        result.update(exit_code=1, error=f"Working directory not found: {task['workdir']}")
+        return result
+    try:
+        task = prepare_prompt(dict(task))
+    except OSError as e:
+        result.update(exit_code=1, error=f"Cannot read prompt file: {e}")
+        return result
+    try:
+        return _run_batch_attempts(task, result, timeout_sec, retries, cache, children or BatchChildren())
+    finally:
+        if task.get('prompt_stream') is not None:
+            task['prompt_stream'].close()
+
+
+def _run_batch_attempts(task: dict, result: dict, timeout_sec: float, retries: int, cache, children) -> dict:
+    start = time.monotonic()
+    cache_key = cache and cache.key(task, task['workdir'])
+    cached = cache_key and cache.get(cache_key)
+    if cached is not None:
+        result.update(exit_code=0, cached=True, output=cached.decode('utf-8', errors='replace'),
+                      latency=round(time.monotonic() - start, 3))
+        emit_metrics(new_metrics(task, task['workdir'], id=task['id'], cached=True, exit_code=0,
+                                 duration_ms=_ms(time.monotonic() - start), stdout_bytes=len(cached),
+                                 stdout_lines=cached.count(b'\n')))
+        return result
+    timeout_sec = task['timeout'] or timeout_sec
+    output = bytearray()
+
+    def run_once(model: str, attempt: int) -> tuple:
+        # 每次尝试重新收集输出，结果只保留最后一次尝试的
+        output.clear()
+        stderr_tail = bytearray()
+
+        def keep_tail(chunk: bytes):
+            stderr_tail.extend(chunk)
+            del stderr_tail[:-STDERR_TAIL]
+
+        metrics = new_metrics(task, task['workdir'], id=task['id'], attempt=attempt, model=model)
+        try:
+            code = run_gemini(build_gemini_args(task, model), timeout_sec, cwd=task['workdir'],
+                              on_stdout=output.extend, on_stderr=keep_tail,
+                              stdin_stream=task.get('prompt_stream'), metrics=metrics, spawn=children.spawn)
+            error = f'Gemini exited with status {code}' if code else ''
+        except subprocess.TimeoutExpired:
+            code, error = 124, f'Gemini execution timeout ({timeout_sec}s)'
+        except FileNotFoundError:
+            code, error = 127, 'gemini command not found in PATH'
+        metrics['exit_code'] = code
+        emit_metrics(metrics)
+        result.update(exit_code=code, error=error, stderr=stderr_tail.decode('utf-8', errors='replace'))
+        return code, bytes(stderr_tail)
+
+    code, kind, model, attempts = run_with_retries(run_once, retries, RETRYABLE | {'timeout'},
+                                                   sleep=children.stopped.wait)
+    result.update(output=output.decode('utf-8', errors='replace'), attempts=attempts, model=model,
+                  failure=None if kind == 'ok' else kind)
+    if code == 0 and cache_key and model == DEFAULT_MODEL:
+        cache.put(cache_key, bytes(output))
+    result['latency'] = round(time.monotonic() - start, 3)
+    return result
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def batch_summary(results: list, elapsed: float) -> str:
+    """批量执行汇总：成功 / 失败数、每个任务的状态和耗时、耗时分位数"""
+    ok = [r for r in results if r['exit_code'] == 0]
+    lines = ['=== Batch Execution Summary ===',
+             f"Total: {len(results)} | Success: {len(ok)} | Failed: {len(results) - len(ok)} | Wall time: {elapsed:.1f}s"]
+    latencies = [r['latency'] for r in results if r['attempts'] or r.get('cached')]
+    if latencies:
+        lines.append(f"Latency: p50 {_percentile(latencies, 50):.1f}s | p95 {_percentile(latencies, 95):.1f}s"
+                     f" | max {max(latencies):.1f}s")
+    lines.append('')
+    for r in results:
+        status = 'SUCCESS' if r['exit_code'] == 0 else f"FAILED (exit code {r['exit_code']})"
+        if r.get('cached'):
+            status += ' (cached)'
+        if r.get('failure'):
+            status += f" [{r['failure']}]"
+        lines.append(f"{r['id']:<24} {status:<36} attempts={r['attempts']} latency={r['latency']:.1f}s"
+                     + (f"  {r['error']}" if r['error'] and r['exit_code'] else ''))
+    return '\n'.join(lines) + '\n'
+
+
+def run_batch(argv: list) -> int:
+    """--batch 模式：有界线程池并发执行多个 gemini 进程
+
+    每个任务的结果写成一行 JSONL（默认 stdout），或用 --output-dir 每个任务一个 <id>.txt 文件
+    （另附 results.jsonl）；汇总输出到 stderr。
+    """
+    parser = argparse.ArgumentParser(prog='gemini.py --batch', description='Run many Gemini prompts in parallel')
+    parser.add_argument('source', nargs='?', default='-', help="JSONL task file, or '-' for stdin")
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS, help=f'parallel gemini processes (default {DEFAULT_JOBS})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'per-task timeout in seconds (default {DEFAULT_TIMEOUT})')
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES,
+                        help=f'retries per model for rate-limited, transient or timed-out tasks (default {MAX_RETRIES})')
+    parser.add_argument('-o', '--output-dir', help='write each task output to <dir>/<id>.txt and records to <dir>/results.jsonl')
+    parser.add_argument('--metrics', action='store_true', help='print a METRICS: {json} line on stderr after each gemini run')
+    opts = parser.parse_args(argv)
+    if opts.metrics:
+        METRICS['stderr'] = True
+
+    try:
+        tasks = load_batch_tasks(opts.source)
+    except (OSError, ValueError) as e:
+        log_error(str(e))
+        return 1
+    if not tasks:
+        log_error('No tasks in batch input')
+        return 1
+    log_info(f"Batch: {len(tasks)} tasks, jobs={opts.jobs}, timeout={opts.timeout:g}s, retries={opts.retries}")
+
+    records = sys.stdout
+    if opts.output_dir:
+        os.makedirs(opts.output_dir, exist_ok=True)
+        records = open(os.path.join(opts.output_dir, 'results.jsonl'), 'w', encoding='utf-8')
+    cache = ResponseCache() if CACHE_ENABLED else None
+    lock = threading.Lock()
+    results = {}
+    children = BatchChildren()
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, opts.jobs)) as pool:
+            futures = {pool.submit(run_batch_task, task, opts.timeout, opts.retries, cache, children): task
+                       for task in tasks}
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result['id']] = result
+                    if opts.output_dir:
+                        path = os.path.join(opts.output_dir, f"{result['id']}.txt")
+                        with open(path, 'w', encoding='utf-8') as f:
+                            f.write(result['output'])
+                        result = dict(result, output_file=path, output=None)
+                    with lock:
+                        records.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        records.flush()
+                    log_info(f"Task {result['id']} finished: exit={result['exit_code']} "
+                             f"attempts={result['attempts']} latency={result['latency']:.1f}s")
+            except KeyboardInterrupt:
+                # 排队中的任务不再启动，正在运行的 gemini 进程终止后工作线程很快退出（with 退出时等待它们）
+                for future in futures:
+                    future.cancel()
+                children.stop()
+                log_error('Batch interrupted')
+                return 130
+    finally:
+        if records is not sys.stdout:
+            records.close()
+
+    ordered = [results[t['id']] for t in tasks]
+    sys.stderr.write(batch_summary(ordered, time.monotonic() - start))
+    if cache:
+        log_info(cache.stats())
+    failed = [r['exit_code'] for r in ordered if r['exit_code'] != 0]
+    return failed[-1] if failed else 0
+
+
+def run_single(args: dict, metrics: dict) -> int:
+    """单 prompt 模式，返回退出码"""
     timeout_sec = DEFAULT_TIMEOUT
     log_info(f"Timeout: {timeout_sec}s")
 
@@ -73,67 +1217,121 @@ def main():
             os.chdir(args['workdir'])
         except FileNotFoundError:
             log_error(f"Working directory not found: {args['workdir']}")
-            sys.exit(1)
+            return 1
         except PermissionError:
             log_error(f"Permission denied: {args['workdir']}")
-            sys.exit(1)
+            return 1
         log_info('Changed working directory')
 
-    try:
-        log_info(f"Starting gemini with model {DEFAULT_MODEL}")
-        process = None
-        # 启动 gemini 子进程，直接透传 stdout 和 stderr
-        process = subprocess.Popen(
-            gemini_args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1  # 行缓冲
-        )
+    started = time.monotonic()
+    cache = ResponseCache() if CACHE_ENABLED else None
+    cache_key = cache and cache.key(args, '.')
+    if cache and not cache_key:
+        log_info('Cache skipped: working dir is not a git repository')
+    cached = cache_key and cache.get(cache_key)
+    if cached is not None:
+        log_info(f"Cache hit ({len(cached)} bytes)")
+        log_info(cache.stats())
+        _forward(sys.stdout)(cached)
+        metrics.update(cached=True, duration_ms=_ms(time.monotonic() - started),
+                       stdout_bytes=len(cached), stdout_lines=cached.count(b'\n'))
+        return 0
+
+    # stdout 默认实时透传；--buffer-output 时缓冲到尝试成功再输出。每次尝试都收集 stdout（缓存、失败分类用）
+    output = bytearray()
+    write_stdout = _forward(sys.stdout)
+    write_stderr = _forward(sys.stderr)
+    deadline = started + timeout_sec  # 所有尝试（含重试、备用模型）共用的截止时间
 
-        # 实时输出 stdout
-        for line in process.stdout:
-            sys.stdout.write(line)
-            sys.stdout.flush()
+    def run_once(model: str, attempt: int) -> tuple:
+        if output and not OUTPUT['buffer']:
+            # 上一次尝试已经输出了部分内容：在 stdout 上明确标记重新开始
+            write_stdout(f"\n[gemini.py] --- attempt {attempt} (model {model}): previous output is incomplete, "
+                         f"restarting ---\n".encode())
+        output.clear()
+        stderr_tail = bytearray()
 
-        # 等待进程结束
-        returncode = process.wait(timeout=timeout_sec)
+        def on_stdout(chunk: bytes):
+            if not OUTPUT['buffer']:
+                write_stdout(chunk)
+            output.extend(chunk)
 
-        # 读取 stderr
-        stderr_output = process.stderr.read()
-        if stderr_output:
-            sys.stderr.write(stderr_output)
+        def on_stderr(chunk: bytes):
+            write_stderr(chunk)
+            stderr_tail.extend(chunk)
+            del stderr_tail[:-STDERR_TAIL]
+
+        log_info(f"Starting gemini with model {model}" + (f" (attempt {attempt})" if attempt > 1 else ''))
+        metrics.update(model=model, attempts=attempt)
+        remaining = max(0.0, deadline - time.monotonic())
+        try:
+            daemon = connect_daemon()
+            if daemon:
+                log_info(f"Submitting to daemon at {DAEMON_SOCKET}")
+                code = run_via_daemon(daemon, args, remaining, on_stdout=on_stdout, on_stderr=on_stderr,
+                                      metrics=metrics, model=model)
+            else:
+                code = run_gemini(build_gemini_args(args, model), remaining, on_stdout=on_stdout,
+                                  on_stderr=on_stderr, stdin_stream=args.get('prompt_stream'), metrics=metrics)
+        except subprocess.TimeoutExpired:
+            code = 124
+        except FileNotFoundError:
+            code = 127
+        return code, bytes(stderr_tail)
+
+    try:
+        returncode, kind, model, _ = run_with_retries(run_once, deadline=deadline)
+        metrics['failure'] = None if kind == 'ok' else kind
+        if OUTPUT['buffer'] and returncode == 0:
+            write_stdout(bytes(output))
 
         # 检查退出码
+        if returncode == 124:
+            log_error(f'Gemini execution timeout ({timeout_sec}s)')
+            return 124
+        if returncode == 127:
+            log_error("gemini command not found in PATH")
+            log_error("Please install Gemini CLI: https://github.com/google/generative-ai-python")
+            return 127
         if returncode != 0:
-            log_error(f'Gemini exited with status {returncode}')
-            sys.exit(returncode)
+            log_error(f'Gemini exited with status {returncode} ({kind})')
+            return returncode
 
-        sys.exit(0)
+        if cache_key and model == DEFAULT_MODEL:
+            cache.put(cache_key, bytes(output))
+            log_info(cache.stats())
+        return 0
 
-    except subprocess.TimeoutExpired:
-        log_error(f'Gemini execution timeout ({timeout_sec}s)')
-        if process is not None:
-            process.kill()
-            try:
-                process.wait(timeout=FORCE_KILL_DELAY)
-            except subprocess.TimeoutExpired:
-                pass
-        sys.exit(124)
-
-    except FileNotFoundError:
-        log_error("gemini command not found in PATH")
-        log_error("Please install Gemini CLI: https://github.com/google/generative-ai-python")
-        sys.exit(127)
+    except (ConnectionError, socket.timeout) as e:
+        log_error(f"Daemon connection failed: {e}")
+        return 1
 
     except KeyboardInterrupt:
-        if process is not None:
-            process.terminate()
-            try:
-                process.wait(timeout=FORCE_KILL_DELAY)
-            except subprocess.TimeoutExpired:
-                process.kill()
-        sys.exit(130)
+        return 130
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        sys.exit(run_batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--daemon':
+        sys.exit(run_daemon(sys.argv[2:]))
+
+    log_info('Script started')
+    args = parse_args(sys.argv[1:])
+    try:
+        prepare_prompt(args)
+    except OSError as e:
+        log_error(f"Cannot read prompt file: {e}")
+        sys.exit(1)
+    log_info(f"Prompt length: {args['prompt_size']} bytes"
+             + (' (sent via stdin)' if args.get('prompt_stream') is not None else ''))
+    log_info(f"Working dir: {args['workdir']}")
+
+    metrics = new_metrics(args, args['workdir'])
+    returncode = run_single(args, metrics)
+    metrics['exit_code'] = returncode
+    emit_metrics(metrics)
+    sys.exit(returncode)
 
 
 if __name__ == '__main__':
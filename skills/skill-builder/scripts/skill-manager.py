@@ -8,21 +8,102 @@ Skill Manager - 管理 Claude Code Skills 的命令行工具
 - create: 创建新 Skill
 - history: 查看版本历史
 - rollback: 回滚到指定版本
-- diff: 对比两个版本
+- diff: 对比两个版本 / 一段版本区间（完整、统计、单词级）
+- prune / gc: 按保留策略清理版本、回收无引用的对象
+- search: 全文搜索所有 Skills 及其历史版本（SQLite FTS5 索引，增量刷新）
+- analyze: 统计每个 Skill 的字节数 / 估算 token 数，标出过大或重复的段落
+- watch: 监听所有 Skill 根目录（inotify，不可用时轮询），变化稳定后自动保存版本
+- pack / unpack: 把选定的 Skills（可含版本历史）打成一个带 hash 清单的压缩包 / 校验后增量解包
+- serve: 从 stdin 逐行读取命令，在同一个进程里执行，每条命令输出一行 JSON
+
+所有命令都支持 --json 输出机器可读结果；save / history 支持多个 Skill 或 --all。
+
+Skill 查找顺序（同名时前者优先）：
+1. 项目：从当前目录向上最近的 .claude/skills
+2. 用户：~/.claude/skills（create 默认创建在这里）
+3. 共享：$SKILL_MANAGER_SHARED_DIRS（按 os.pathsep 分隔）和本仓库的 skills/
+
+版本存储（~/.claude/.skill-versions/）：
+- .objects/ab/cdef...: 按 sha256 命名的 zlib 压缩对象，相同内容只存一份，可存为相对上一版本的 delta
+- .roots/<根目录 hash>/<skill>/log.jsonl: 每个 Skill 的版本日志（追加写），每行一个版本（时间、消息、大小、hash）；
+  按 Skill 所在根目录区分，不同根目录下的同名 Skill 各有各的历史
+- .roots/<根目录 hash>/<skill>/HEAD.json: 版本数和最新版本摘要，list / show 无需读取整个日志
+- 每个版本是整个 Skill 目录（SKILL.md + scripts/ + references/ ...）的快照：
+  tree 对象记录 路径 → 内容 hash，未变化的文件跨版本只存一份
+- .diffs/ab/<hash1>-<hash2>.<mode>: 按内容 hash 缓存的文件级 diff 结果
 """
 
 import os
+import re
 import sys
 import json
+import zlib
 import shutil
+import tarfile
+import struct
+import sqlite3
+import difflib
+import hashlib
+import shlex
+import select
+import signal
 import argparse
+import contextlib
+import io
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import time
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 
 # 配置
 GLOBAL_SKILLS_DIR = Path.home() / ".claude" / "skills"
+REPO_SKILLS_DIR = Path(__file__).resolve().parents[2]  # skills/<skill>/scripts/skill-manager.py
 VERSION_DIR = Path.home() / ".claude" / ".skill-versions"
+INDEX_FILE = Path.home() / ".claude" / ".skill-index.json"
+INDEX_FORMAT = 2
+FRONTMATTER_MAX_BYTES = 64 * 1024  # frontmatter 最多读取的字节数
+SEARCH_DB = Path.home() / ".claude" / ".skill-search.db"
+SEARCH_MAX_FILE_BYTES = 512 * 1024  # 超过此大小的文件不建全文索引
+ANALYZE_CACHE = Path.home() / ".claude" / ".skill-analyze.json"
+ANALYZE_FORMAT = 1
+DESCRIPTION_MAX_CHARS = 1024   # description 常驻上下文，超过此长度告警
+BODY_MAX_TOKENS = 5000         # SKILL.md 正文告警阈值（估算 token）
+SECTION_MAX_TOKENS = 1500      # 单个段落告警阈值
+REFERENCE_MAX_TOKENS = 10000   # 单个 reference 文件告警阈值
+DUPLICATE_MIN_BYTES = 200      # 短于此长度的段落不做重复检测
+OBJECTS_DIR = VERSION_DIR / ".objects"
+DIFFS_DIR = VERSION_DIR / ".diffs"
+MAX_DELTA_CHAIN = 16      # delta 链最大深度，超过后存完整快照
+DEFAULT_KEEP = 20         # prune 默认保留的版本数
+SNAPSHOT_IGNORE = {"__pycache__", ".git", ".DS_Store"}  # 快照时跳过的文件 / 目录
+DIFF_CONTEXT = 3          # diff 上下文行数
+DIFF_MODES = ("full", "stat", "word")
+WATCH_MESSAGE = "自动保存 (watch)"
+WATCH_DEBOUNCE = 2.0      # 最后一次改动后静默多少秒再保存
+WATCH_MAX_DELAY = 30.0    # 持续改动时最多延迟多少秒保存一次
+WATCH_COALESCE = 600      # 同一串自动版本从第一次保存起不足此秒数时合并为一个版本
+WATCH_POLL_INTERVAL = 2.0 # 轮询模式的扫描间隔（扫描耗时超过间隔 10% 时自动放宽）
+WATCH_MAX_DIRS = 8192     # inotify 最多监听的目录数，超过后改用轮询
+WATCH_IGNORE_SUFFIXES = (".swp", ".swx", ".tmp", "~", ".pyc")
+PACK_FORMAT = 1
+PACK_JOBS = min(8, os.cpu_count() or 1)  # unpack 并行写文件的线程数
+
+OUTPUT = {"json": False}  # --json / serve 模式下不打印人类可读文本，由 main 输出命令返回值
+_VERSION_STORE = {"migrated": False}  # 进程内只检查一次旧的按名字存放的版本目录
+
+
+class SkillError(Exception):
+    """命令失败（Skill 不存在、版本号无效等）；CLI 打印为 ❌ 消息，--json 模式下输出 error 字段"""
+
+
+def say(*args, **kwargs):
+    """人类可读输出，--json / serve 模式下静默"""
+    if not OUTPUT["json"]:
+        print(*args, **kwargs)
 
 
 def ensure_version_dir():
@@ -30,88 +111,273 @@ def ensure_version_dir():
     VERSION_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def _root_version_dir(root: Path) -> Path:
+    """Skill 根目录 → 版本库中对应的目录（按规范化路径的 hash 命名）"""
+    return VERSION_DIR / ".roots" / hashlib.sha256(str(root.resolve()).encode("utf-8")).hexdigest()[:16]
+
+
+def _migrate_name_keyed_versions():
+    """旧版本库按 Skill 名存放（VERSION_DIR/<name>），一次性移到用户根目录名下"""
+    if _VERSION_STORE["migrated"]:
+        return
+    _VERSION_STORE["migrated"] = True
+    if not VERSION_DIR.is_dir():
+        return
+    user_dir = _root_version_dir(GLOBAL_SKILLS_DIR)
+    for path in VERSION_DIR.iterdir():
+        if path.is_dir() and not path.name.startswith(".") and not (user_dir / path.name).exists():
+            user_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(path, user_dir / path.name)
+
+
 def get_skill_version_dir(skill_name: str) -> Path:
-    """获取 Skill 的版本目录"""
-    return VERSION_DIR / skill_name
+    """获取 Skill 的版本目录：按生效目录所在的根目录区分，同名 Skill 在不同根目录下不共用历史
+
+    Skill 已不存在时沿用已有的历史（按根目录优先级，其次任一根目录），都没有时归到用户根目录。
+    """
+    _migrate_name_keyed_versions()
+    skill_dir = resolve_skill(skill_name)
+    if skill_dir is not None:
+        return _root_version_dir(skill_dir.parent) / skill_name
+    candidates = [_root_version_dir(root) / skill_name for _, root in skill_roots()]
+    candidates += sorted(p / skill_name for p in (VERSION_DIR / ".roots").glob("*"))
+    for candidate in candidates:
+        if candidate.is_dir():
+            return candidate
+    return _root_version_dir(GLOBAL_SKILLS_DIR) / skill_name
+
+
+_ROOTS = []  # 进程内缓存：[(类别, 目录)]
+
+
+def skill_roots() -> list:
+    """按优先级返回 Skill 根目录 [(project|user|shared, Path)]，只包含存在的目录，同一目录只出现一次"""
+    if _ROOTS:
+        return _ROOTS
+    candidates = []
+    cwd = Path.cwd()
+    for parent in (cwd, *cwd.parents):
+        project = parent / ".claude" / "skills"
+        if project.is_dir() and project != GLOBAL_SKILLS_DIR:
+            candidates.append(("project", project))
+            break
+    candidates.append(("user", GLOBAL_SKILLS_DIR))
+    shared = os.environ.get("SKILL_MANAGER_SHARED_DIRS", "")
+    candidates.extend(("shared", Path(p).expanduser()) for p in shared.split(os.pathsep) if p)
+    candidates.append(("shared", REPO_SKILLS_DIR))
+    
+    seen = set()
+    for kind, root in candidates:
+        try:
+            real = root.resolve()
+        except OSError:
+            continue
+        if real in seen or not root.is_dir():
+            continue
+        seen.add(real)
+        _ROOTS.append((kind, root))
+    return _ROOTS
+
+
+def resolve_skill(skill_name: str) -> Optional[Path]:
+    """Skill 名 → 生效的目录；每个根目录只探测一次 <root>/<name>/SKILL.md，不扫描目录"""
+    if not skill_name or "/" in skill_name or skill_name.startswith("."):
+        return None
+    for _, root in skill_roots():
+        if (root / skill_name / "SKILL.md").is_file():
+            return root / skill_name
+    return None
+
+
+def skill_dir_of(skill_name: str) -> Path:
+    """生效的 Skill 目录，不存在时抛 SkillError"""
+    skill_dir = resolve_skill(skill_name)
+    if skill_dir is None:
+        raise SkillError(f"Skill 不存在: {skill_name}")
+    return skill_dir
+
+
+def load_index() -> dict:
+    """读取持久化的 Skill 元数据索引"""
+    try:
+        data = json.loads(INDEX_FILE.read_text(encoding="utf-8"))
+        if data.get("format") == INDEX_FORMAT:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"format": INDEX_FORMAT, "roots": {}, "skills": {}}
+
+
+def save_index(index: dict):
+    """原子写入索引（先写临时文件再替换）"""
+    INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, INDEX_FILE)
+
+
+def _count_versions(skill_name: str, cached: dict) -> tuple:
+    """版本数，按版本日志 mtime 缓存；返回 (count, log_mtime)"""
+    log_file = get_skill_version_dir(skill_name) / "log.jsonl"
+    try:
+        mtime = log_file.stat().st_mtime
+    except OSError:
+        # 尚未迁移的旧版本目录：按 <timestamp>.md 文件计数
+        return len(_legacy_version_files(skill_name)), None
+    if cached.get("versions_mtime") == mtime:
+        return cached.get("versions", 0), mtime
+    return read_head(skill_name)["count"], mtime
+
+
+def _root_listing(root: Path, cached: dict) -> list:
+    """根目录下的子目录名；根目录 mtime 未变时直接用缓存，不重新列目录"""
+    mtime = root.stat().st_mtime
+    if cached.get("mtime") == mtime:
+        return cached["names"]
+    with os.scandir(root) as it:
+        names = sorted(e.name for e in it if e.is_dir() and not e.name.startswith("."))
+    cached.update(mtime=mtime, names=names)
+    return names
+
+
+def refresh_index() -> dict:
+    """增量刷新合并视图，返回 {Skill 名: 元数据}（按根目录优先级，同名只保留优先级最高的）
+
+    根目录 mtime 未变时不重新列目录；只重新解析 mtime/size 变化的 SKILL.md。
+    每项带 dir（生效目录）、root（来源类别），被覆盖的同名 Skill 记在 shadows 里。
+    """
+    index = load_index()
+    cached_roots, cached = index["roots"], index["skills"]
+    roots, fresh, merged = {}, {}, {}
+
+    for kind, root in skill_roots():
+        listing = dict(cached_roots.get(str(root), {}))
+        try:
+            names = _root_listing(root, listing)
+        except OSError:
+            continue
+        roots[str(root)] = listing
+        for name in names:
+            skill_dir = os.path.join(root, name)
+            try:
+                st = os.stat(os.path.join(skill_dir, "SKILL.md"))
+            except OSError:
+                continue
+            old = cached.get(skill_dir, {})
+            if old.get("mtime") == st.st_mtime and old.get("size") == st.st_size:
+                info = dict(old)
+            else:
+                meta = parse_skill_metadata(Path(skill_dir) / "SKILL.md")
+                tags = meta.get("tags", [])
+                info = {
+                    "mtime": st.st_mtime,
+                    "size": st.st_size,
+                    "name": meta.get("name") or name,
+                    "description": meta.get("description") or "无描述",
+                    "tags": tags if isinstance(tags, list) else [tags] if tags else [],
+                }
+            fresh[skill_dir] = info
+            if name in merged:
+                merged[name]["shadows"].append(skill_dir)
+                continue
+            info = dict(info, dir=skill_dir, root=kind, shadows=[])
+            info["versions"], fresh[skill_dir]["versions_mtime"] = _count_versions(name, old)
+            fresh[skill_dir]["versions"] = info["versions"]
+            merged[name] = info
+
+    if fresh != cached or roots != cached_roots:
+        index["roots"], index["skills"] = roots, fresh
+        save_index(index)
+    return dict(sorted(merged.items()))
 
 
 def list_skills(verbose: bool = False):
     """列出所有 Skills"""
-    print("\n📦 全局 Skills (~/.claude/skills/)")
-    print("-" * 50)
-    
-    if not GLOBAL_SKILLS_DIR.exists():
-        print("  (空)")
-        return
-    
-    skills = []
-    for item in GLOBAL_SKILLS_DIR.iterdir():
-        if item.is_dir() and not item.name.startswith('.'):
-            skill_file = item / "SKILL.md"
-            if skill_file.exists():
-                info = parse_skill_metadata(skill_file)
-                skills.append({
-                    "path": item,
-                    "name": info.get("name", item.name),
-                    "description": info.get("description", "无描述")
-                })
+    skills = refresh_index()
+    say("\n📦 Skills（" + " > ".join(f"{kind}: {root}" for kind, root in skill_roots()) + "）")
+    say("-" * 50)
     
     if not skills:
-        print("  (空)")
-        return
+        say("  (空)")
+        return []
     
-    for i, skill in enumerate(skills, 1):
-        print(f"  {i}. {skill['name']}")
-        print(f"     📝 {skill['description']}")
+    for i, skill in enumerate(skills.values(), 1):
+        origin = "" if skill["root"] == "user" else f"  [{skill['root']}]"
+        say(f"  {i}. {skill['name']}{origin}")
+        say(f"     📝 {skill['description']}")
         if verbose:
-            version_dir = get_skill_version_dir(skill['name'])
-            if version_dir.exists():
-                versions = list(version_dir.iterdir())
-                print(f"     📚 版本数: {len(versions)}")
-        print()
+            if skill["tags"]:
+                say(f"     🏷️  {', '.join(skill['tags'])}")
+            if skill["versions"]:
+                say(f"     📚 版本数: {skill['versions']}")
+            say(f"     📁 {skill['dir']}")
+            for path in skill["shadows"]:
+                say(f"     ↪️  覆盖: {path}")
+        say()
+    
+    return [{"skill": key, "name": info["name"], "description": info["description"], "tags": info["tags"],
+             "versions": info["versions"], "dir": info["dir"], "root": info["root"], "shadows": info["shadows"]}
+            for key, info in skills.items()]
+
+
+def read_frontmatter(skill_file: Path) -> str:
+    """只读取 SKILL.md 开头的 YAML 头，不读正文"""
+    lines = []
+    with open(skill_file, encoding="utf-8", errors="replace") as f:
+        if f.readline().strip() != "---":
+            return ""
+        read = 0
+        for line in f:
+            if line.strip() == "---":
+                return "".join(lines)
+            read += len(line)
+            if read > FRONTMATTER_MAX_BYTES:
+                break
+            lines.append(line)
+    return ""
 
 
 def parse_skill_metadata(skill_file: Path) -> dict:
-    """解析 SKILL.md 的 YAML 头"""
-    content = skill_file.read_text()
+    """解析 SKILL.md 的 YAML 头（支持 `key: value` 和 `- item` 列表）"""
     metadata = {}
+    key = None
     
-    if content.startswith("---"):
-        parts = content.split("---", 2)
-        if len(parts) >= 3:
-            yaml_content = parts[1].strip()
-            for line in yaml_content.split("\n"):
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    metadata[key.strip()] = value.strip()
+    for line in read_frontmatter(skill_file).split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("- ") and key and isinstance(metadata.get(key), list):
+            metadata[key].append(stripped[2:].strip())
+        elif ":" in line and not line.startswith((" ", "\t")):
+            key, value = line.split(":", 1)
+            key, value = key.strip(), value.strip()
+            if value.startswith("[") and value.endswith("]"):
+                metadata[key] = [v.strip() for v in value[1:-1].split(",") if v.strip()]
+            else:
+                metadata[key] = value if value else []
     
-    return metadata
+    return {k: v for k, v in metadata.items() if v != [] or k == "tags"}
 
 
 def show_skill(skill_name: str):
     """查看 Skill 详情"""
-    skill_dir = GLOBAL_SKILLS_DIR / skill_name
+    skill_dir = skill_dir_of(skill_name)
     skill_file = skill_dir / "SKILL.md"
     
-    if not skill_file.exists():
-        print(f"❌ Skill 不存在: {skill_name}")
-        return
-    
-    print(f"\n📄 Skill: {skill_name}")
-    print("=" * 50)
-    print(skill_file.read_text())
+    content = skill_file.read_text()
+    say(f"\n📄 Skill: {skill_name}  ({skill_dir})")
+    say("=" * 50)
+    say(content)
     
     # 显示版本信息
-    version_dir = get_skill_version_dir(skill_name)
-    if version_dir.exists():
-        versions = sorted(version_dir.iterdir(), reverse=True)
-        if versions:
-            print("\n📚 版本历史")
-            print("-" * 50)
-            for v in versions[:5]:  # 只显示最近 5 个
-                print(f"  - {v.name}")
-            if len(versions) > 5:
-                print(f"  ... 还有 {len(versions) - 5} 个版本")
+    count = read_head(skill_name)["count"]
+    recent = list(iter_history(skill_name, limit=5))  # 只显示最近 5 个
+    if count:
+        say("\n📚 版本历史")
+        say("-" * 50)
+        for v in recent:
+            say(f"  - {v['id']}  {v['message']}")
+        if count > 5:
+            say(f"  ... 还有 {count - 5} 个版本")
+    return {"name": skill_name, "dir": str(skill_dir), "content": content, "versions": count, "recent": recent}
 
 
 def create_skill(skill_name: str, description: str = ""):
@@ -119,11 +385,14 @@ def create_skill(skill_name: str, description: str = ""):
     skill_dir = GLOBAL_SKILLS_DIR / skill_name
     
     if skill_dir.exists():
-        print(f"❌ Skill 已存在: {skill_name}")
-        return
+        raise SkillError(f"Skill 已存在: {skill_name}")
+    existing = resolve_skill(skill_name)
+    if existing is not None:
+        say(f"⚠️  同名 Skill 已存在于 {existing}，按查找顺序{'新建的会覆盖它' if existing.parent != skill_roots()[0][1] else '它仍然优先'}")
     
-    # 创建目录结构
+    # 创建目录结构；全局根目录可能刚被创建，重新计算根目录
     skill_dir.mkdir(parents=True)
+    _ROOTS.clear()
     (skill_dir / "scripts").mkdir()
     (skill_dir / "references").mkdir()
     
@@ -158,156 +427,1503 @@ description: {description or '待补充描述'}
     
     (skill_dir / "SKILL.md").write_text(template)
     
-    print(f"✅ 创建成功: {skill_dir}")
-    print(f"   - SKILL.md")
-    print(f"   - scripts/")
-    print(f"   - references/")
+    say(f"✅ 创建成功: {skill_dir}")
+    say(f"   - SKILL.md")
+    say(f"   - scripts/")
+    say(f"   - references/")
     
     # 保存初始版本
-    save_version(skill_name, "初始创建")
+    return {"name": skill_name, "path": str(skill_dir), "version": save_version(skill_name, "初始创建")}
 
 
-def save_version(skill_name: str, message: str = ""):
-    """保存当前版本"""
-    ensure_version_dir()
+# ---------- 对象存储 ----------
+
+def _object_path(digest: str) -> Path:
+    return OBJECTS_DIR / digest[:2] / digest[2:]
+
+
+def _write_atomic(path: Path, data: bytes):
+    """先写临时文件再替换，避免中途失败留下半个文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _make_delta(base: bytes, data: bytes) -> bytes:
+    """行级 delta：C<起始行><行数> 复制 base 的行，I<长度><字节> 插入新内容"""
+    base_lines = base.splitlines(keepends=True)
+    new_lines = data.splitlines(keepends=True)
+    out = []
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            out.append(struct.pack(">cII", b"C", i1, i2 - i1))
+        elif j2 > j1:
+            chunk = b"".join(new_lines[j1:j2])
+            out.append(struct.pack(">cI", b"I", len(chunk)) + chunk)
+    return b"".join(out)
+
+
+def _apply_delta(base: bytes, delta: bytes) -> bytes:
+    base_lines = base.splitlines(keepends=True)
+    out, pos = [], 0
+    while pos < len(delta):
+        if delta[pos:pos + 1] == b"C":
+            start, count = struct.unpack_from(">II", delta, pos + 1)
+            out.extend(base_lines[start:start + count])
+            pos += 9
+        else:
+            (length,) = struct.unpack_from(">I", delta, pos + 1)
+            out.append(delta[pos + 5:pos + 5 + length])
+            pos += 5 + length
+    return b"".join(out)
+
+
+def _read_object(digest: str) -> tuple:
+    """读取对象，返回 (kind, base, depth, payload)；kind 为 full 或 delta"""
+    raw = zlib.decompress(_object_path(digest).read_bytes())
+    header, payload = raw.split(b"\n", 1)
+    parts = header.decode().split()
+    if parts[0] == "delta":
+        return "delta", parts[1], int(parts[2]), payload
+    return "full", None, 0, payload
+
+
+def read_blob(digest: str) -> bytes:
+    """按 hash 读取内容（自动展开 delta 链）"""
+    kind, base, _, payload = _read_object(digest)
+    return payload if kind == "full" else _apply_delta(read_blob(base), payload)
+
+
+def store_blob(data: bytes, base: Optional[str] = None) -> str:
+    """写入内容并返回 hash；已存在则直接复用。有 base 且 delta 明显更小时存 delta"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _object_path(digest)
+    if path.exists():
+        return digest
     
-    skill_dir = GLOBAL_SKILLS_DIR / skill_name
-    skill_file = skill_dir / "SKILL.md"
+    stored = zlib.compress(b"full\n" + data)
+    if base and base != digest and _object_path(base).exists():
+        _, _, depth, _ = _read_object(base)
+        if depth < MAX_DELTA_CHAIN:
+            header = f"delta {base} {depth + 1}\n".encode()
+            delta = zlib.compress(header + _make_delta(read_blob(base), data))
+            if len(delta) < len(stored) // 2:
+                stored = delta
     
-    if not skill_file.exists():
-        print(f"❌ Skill 不存在: {skill_name}")
+    _write_atomic(path, stored)
+    return digest
+
+
+# ---------- 版本日志 ----------
+
+def _log_file(skill_name: str) -> Path:
+    return get_skill_version_dir(skill_name) / "log.jsonl"
+
+
+def _legacy_version_files(skill_name: str) -> list:
+    """旧格式版本文件 <timestamp>.md（带 VERSION INFO 头），按时间升序"""
+    version_dir = get_skill_version_dir(skill_name)
+    if not version_dir.is_dir():
+        return []
+    return sorted(p for p in version_dir.glob("*.md") if p.is_file())
+
+
+def _import_legacy_versions(skill_name: str):
+    """把旧格式版本文件一次性导入对象存储
+
+    读路径（history / show 等）也会触发导入，所以旧文件原样保留（已有 log.jsonl 时不会再次导入），
+    只在显式 gc / prune 时删除。
+    """
+    legacy = _legacy_version_files(skill_name)
+    if not legacy or _log_file(skill_name).exists():
         return
     
-    # 创建版本目录
-    version_dir = get_skill_version_dir(skill_name)
-    version_dir.mkdir(parents=True, exist_ok=True)
+    lines, prev = [], None
+    for path in legacy:
+        content = path.read_text(encoding="utf-8")
+        message = ""
+        if content.startswith("<!-- VERSION INFO"):
+            header, content = content.split("-->", 1)
+            content = content[1:] if content.startswith("\n") else content
+            for line in header.split("\n"):
+                if line.startswith("message:"):
+                    message = line.split(":", 1)[1].strip()
+        data = content.encode("utf-8")
+        prev = store_blob(data, prev)
+        lines.append(json.dumps(_log_entry(path.stem, message, prev, len(data)), ensure_ascii=False) + "\n")
     
-    # 版本名：时间戳
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    version_file = version_dir / f"{timestamp}.md"
+    _write_atomic(_log_file(skill_name), "".join(lines).encode("utf-8"))
+    _write_head(skill_name, len(lines), json.loads(lines[-1]))
+
+
+def _log_entry(version_id: str, message: str, digest: str, size: int, tree: Optional[str] = None) -> dict:
+    """日志条目：hash/size 对应 SKILL.md，tree 对应整个目录快照（旧版本没有 tree）"""
+    try:
+        time_str = datetime.strptime(version_id[:15], "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        time_str = version_id
+    entry = {"id": version_id, "time": time_str, "message": message, "hash": digest, "size": size}
+    if tree:
+        entry["tree"] = tree
+    return entry
+
+
+def load_log(skill_name: str) -> list:
+    """读取版本日志（时间升序），必要时先导入旧格式版本"""
+    _import_legacy_versions(skill_name)
+    return _read_log(_log_file(skill_name))
+
+
+def _read_log(log_file: Path) -> list:
+    if not log_file.exists():
+        return []
+    with open(log_file, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def iter_log_reverse(skill_name: str):
+    """从日志末尾向前逐条读取（最新在前），只读取实际用到的尾部"""
+    _import_legacy_versions(skill_name)
+    log_file = _log_file(skill_name)
+    if not log_file.exists():
+        return
+    with open(log_file, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b""
+        while pos > 0:
+            step = min(8192, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield json.loads(line)
+        if rest.strip():
+            yield json.loads(rest)
+
+
+def _head_file(skill_name: str) -> Path:
+    return get_skill_version_dir(skill_name) / "HEAD.json"
+
+
+def _write_head(skill_name: str, count: int, last: Optional[dict]):
+    size = _log_file(skill_name).stat().st_size
+    head = {"count": count, "last": last, "log_size": size}
+    _write_atomic(_head_file(skill_name), json.dumps(head, ensure_ascii=False).encode("utf-8"))
+    return head
+
+
+def read_head(skill_name: str) -> dict:
+    """版本数 + 最新版本；HEAD.json 与日志大小不一致时从日志重建"""
+    _import_legacy_versions(skill_name)
+    try:
+        size = _log_file(skill_name).stat().st_size
+    except OSError:
+        return {"count": 0, "last": None}
+    try:
+        head = json.loads(_head_file(skill_name).read_text(encoding="utf-8"))
+        if head.get("log_size") == size:
+            return head
+    except (OSError, ValueError):
+        pass
+    entries = load_log(skill_name)
+    return _write_head(skill_name, len(entries), entries[-1] if entries else None)
+
+
+def append_log(skill_name: str, entry: dict):
+    """追加一条版本记录并更新 HEAD"""
+    log_file = _log_file(skill_name)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    count = read_head(skill_name)["count"]
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _write_head(skill_name, count + 1, entry)
+
+
+def replace_last_log(skill_name: str, entry: dict):
+    """用新记录替换日志最后一条（只截断尾部，不重写整个日志），版本数不变"""
+    count = read_head(skill_name)["count"]
+    with open(_log_file(skill_name), "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+        cut = tail.rstrip(b"\n").rfind(b"\n")
+        start = size - len(tail) + cut + 1
+        f.truncate(start)
+        f.seek(start)
+        f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+    _write_head(skill_name, count, entry)
+
+
+def _rewrite_log(skill_name: str, entries: list):
+    data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+    _write_atomic(_log_file(skill_name), data.encode("utf-8"))
+    _write_head(skill_name, len(entries), entries[-1] if entries else None)
+
+
+def _parse_since(value: str) -> str:
+    """--since 参数（2025-12-08 / 2025-12-08 14:30 / 20251208）→ 可与版本 ID 比较的前缀"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y%m%d_%H%M%S", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y%m%d_%H%M%S")
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"无法解析时间: {value}")
+
+
+def iter_history(skill_name: str, limit: Optional[int] = None, since: Optional[str] = None):
+    """最新在前的版本记录，可按条数 / 起始时间截断"""
+    entries = iter_log_reverse(skill_name)
+    if since:
+        entries = itertools.takewhile(lambda e: e["id"][:15] >= since, entries)
+    return itertools.islice(entries, limit)
+
+
+def _new_version_id(last: Optional[dict]) -> str:
+    """版本 ID：时间戳，同一秒内多次保存追加序号"""
+    version_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if last and last["id"][:15] == version_id:
+        seq = int(last["id"][16:] or 1) + 1 if len(last["id"]) > 15 else 2
+        version_id = f"{version_id}_{seq}"
+    return version_id
+
+
+def get_version(skill_name: str, index: int) -> Optional[dict]:
+    """版本号（1 = 最近）→ 日志条目，只从日志尾部读到该版本为止"""
+    if index < 1:
+        return None
+    return next(itertools.islice(iter_log_reverse(skill_name), index - 1, None), None)
+
+
+# ---------- 目录快照 ----------
+
+def read_tree(digest: str) -> dict:
+    """读取 tree 对象：{相对路径: {"hash", "size", "mode"}}"""
+    return json.loads(read_blob(digest))
+
+
+def entry_files(entry: dict) -> dict:
+    """版本包含的文件；旧版本只有 SKILL.md"""
+    if entry.get("tree"):
+        return read_tree(entry["tree"])
+    return {"SKILL.md": {"hash": entry["hash"], "size": entry["size"], "mode": 0o644}}
+
+
+def _iter_skill_files(skill_dir: Path):
+    """遍历 Skill 目录下的文件，产出 (相对路径, os.stat_result)"""
+    for root, dirs, files in os.walk(skill_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SNAPSHOT_IGNORE)
+        for name in sorted(files):
+            if name in SNAPSHOT_IGNORE or name.endswith(".pyc"):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, skill_dir).replace(os.sep, "/"), os.stat(path)
+
+
+def snapshot_tree(skill_name: str, prev_files: dict, prev_tree: Optional[str] = None) -> tuple:
+    """为整个 Skill 目录做快照，返回 (tree hash, files)
+
+    用 <skill>/stat.json 缓存每个文件的 (mtime_ns, size, hash)，只读取和存储发生变化的文件，
+    变化的文件以上一版本同路径内容为 base 存 delta。
+    """
+    skill_dir = skill_dir_of(skill_name)
+    cache_file = get_skill_version_dir(skill_name) / "stat.json"
+    try:
+        cache = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
     
-    # 复制当前内容
-    content = skill_file.read_text()
+    files, new_cache = {}, {}
+    for rel, st in _iter_skill_files(skill_dir):
+        cached = cache.get(rel)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size and _object_path(cached[2]).exists():
+            digest = cached[2]
+        else:
+            base = prev_files.get(rel, {}).get("hash")
+            digest = store_blob((skill_dir / rel).read_bytes(), base)
+        files[rel] = {"hash": digest, "size": st.st_size, "mode": st.st_mode & 0o777}
+        new_cache[rel] = [st.st_mtime_ns, st.st_size, digest]
+    
+    if new_cache != cache:
+        _write_atomic(cache_file, json.dumps(new_cache).encode("utf-8"))
+    tree_data = json.dumps(files, sort_keys=True, indent=0).encode("utf-8")
+    return store_blob(tree_data, prev_tree), files
+
+
+def restore_tree(skill_name: str, current: dict, target: dict):
+    """把 Skill 目录恢复到 target 快照，只改动与 current 不同的文件
+
+    先把所有需要写入的文件写成同目录临时文件，全部成功后再逐个 rename 替换、删除多余文件；
+    暂存阶段出错时清理临时文件，原目录保持不变。
+    """
+    skill_dir = skill_dir_of(skill_name)
+    changed = [rel for rel, info in target.items() if current.get(rel, {}).get("hash") != info["hash"]]
+    removed = [rel for rel in current if rel not in target]
     
-    # 添加版本元信息
-    version_content = f"""<!-- VERSION INFO
-timestamp: {timestamp}
-message: {message}
--->
-{content}"""
+    staged = []
+    try:
+        for rel in changed:
+            dest = skill_dir / rel
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f".{dest.name}.rollback-tmp")
+            tmp.write_bytes(read_blob(target[rel]["hash"]))
+            os.chmod(tmp, target[rel].get("mode", 0o644))
+            staged.append((tmp, dest))
+    except Exception:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+        raise
     
-    version_file.write_text(version_content)
-    print(f"✅ 版本已保存: {version_file.name}")
-    print(f"   消息: {message or '无'}")
+    for tmp, dest in staged:
+        os.replace(tmp, dest)
+    for rel in removed:
+        (skill_dir / rel).unlink(missing_ok=True)
+        parent = (skill_dir / rel).parent
+        while parent.parent != skill_dir and parent != skill_dir and not any(parent.iterdir()):  # 保留 scripts/ 等顶层目录
+            parent.rmdir()
+            parent = parent.parent
+    
+    # 恢复出来的文件内容已知，直接更新 stat 缓存，下次保存无需重新读取
+    cache = {rel: [os.stat(skill_dir / rel).st_mtime_ns, info["size"], info["hash"]] for rel, info in target.items()}
+    _write_atomic(get_skill_version_dir(skill_name) / "stat.json", json.dumps(cache).encode("utf-8"))
+    return len(changed), len(removed)
 
 
-def list_history(skill_name: str):
-    """查看版本历史"""
-    version_dir = get_skill_version_dir(skill_name)
+def save_version(skill_name: str, message: str = "", amend: bool = False) -> dict:
+    """保存当前版本（整个 Skill 目录，内容与上一版本相同时跳过）；amend=True 时替换最新版本而不是追加
+
+    替换时 since 记录被合并的第一个版本 ID，连续多次替换也保持不变。
+    """
+    ensure_version_dir()
     
-    if not version_dir.exists():
-        print(f"❌ 无版本历史: {skill_name}")
-        return
+    skill_dir_of(skill_name)
     
-    versions = sorted(version_dir.iterdir(), reverse=True)
+    last = read_head(skill_name)["last"]
+    tree, files = snapshot_tree(skill_name, entry_files(last) if last else {}, last.get("tree") if last else None)
     
-    print(f"\n📚 {skill_name} 版本历史")
-    print("-" * 50)
+    if last and last.get("tree") == tree:
+        say(f"ℹ️  {skill_name} 内容未变化，沿用版本: {last['id']}")
+        return dict(last, unchanged=True)
     
-    for i, v in enumerate(versions):
-        # 读取版本信息
-        content = v.read_text()
-        message = ""
-        if "message:" in content:
-            for line in content.split("\n"):
-                if line.startswith("message:"):
-                    message = line.split(":", 1)[1].strip()
-                    break
-        
-        # 格式化时间
-        ts = v.stem  # 20241208_141234
-        try:
-            dt = datetime.strptime(ts, "%Y%m%d_%H%M%S")
-            time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            time_str = ts
-        
+    skill_md = files["SKILL.md"]
+    entry = _log_entry(_new_version_id(last), message, skill_md["hash"], skill_md["size"], tree)
+    if amend and last:
+        entry["since"] = last.get("since", last["id"])
+        replace_last_log(skill_name, entry)
+        say(f"✅ {skill_name} 版本已保存: {entry['id']}（替换 {last['id']}）")
+    else:
+        append_log(skill_name, entry)
+        say(f"✅ {skill_name} 版本已保存: {entry['id']}")
+    say(f"   消息: {message or '无'}")
+    return entry
+
+
+def list_history(skill_name: str, limit: Optional[int] = None, since: Optional[str] = None):
+    """查看版本历史（只读版本日志，不读取版本内容）"""
+    count = read_head(skill_name)["count"]
+    
+    if not count:
+        raise SkillError(f"无版本历史: {skill_name}")
+    
+    say(f"\n📚 {skill_name} 版本历史")
+    say("-" * 50)
+    
+    versions = list(iter_history(skill_name, limit, since))
+    for i, entry in enumerate(versions):
         marker = "👉 " if i == 0 else "   "
-        print(f"{marker}{i+1}. {time_str}")
-        if message:
-            print(f"      💬 {message}")
+        say(f"{marker}{i+1}. {entry['time']}  ({entry['size']} B, {entry['hash'][:8]})")
+        if entry["message"]:
+            say(f"      💬 {entry['message']}")
+    if not versions:
+        say("   （没有符合条件的版本）")
+    elif len(versions) < count:
+        say(f"   ... 共 {count} 个版本，已显示 {len(versions)} 个")
+    return {"name": skill_name, "count": count, "versions": versions}
 
 
 def rollback(skill_name: str, version_index: int = 1):
     """回滚到指定版本（1 = 最近一个版本）"""
-    version_dir = get_skill_version_dir(skill_name)
+    count = read_head(skill_name)["count"]
     
-    if not version_dir.exists():
-        print(f"❌ 无版本历史: {skill_name}")
-        return
+    if not count:
+        raise SkillError(f"无版本历史: {skill_name}")
     
-    versions = sorted(version_dir.iterdir(), reverse=True)
+    target = get_version(skill_name, version_index)
+    if target is None:
+        raise SkillError(f"无效版本号: {version_index}（共 {count} 个版本）")
     
-    if version_index < 1 or version_index > len(versions):
-        print(f"❌ 无效版本号: {version_index}（共 {len(versions)} 个版本）")
-        return
+    # 先保存当前版本（与已有版本相同则不会产生新对象）
+    current = save_version(skill_name, f"回滚前自动保存")
     
-    target_version = versions[version_index - 1]
+    if target.get("tree"):
+        changed, removed = restore_tree(skill_name, entry_files(current), read_tree(target["tree"]))
+    else:
+        # 旧版本只记录了 SKILL.md
+        _write_atomic(skill_dir_of(skill_name) / "SKILL.md", read_blob(target["hash"]))
+        changed, removed = 1, 0
     
-    # 先保存当前版本
-    save_version(skill_name, f"回滚前自动保存")
+    say(f"✅ 已回滚到: {target['id']}（更新 {changed} 个文件，删除 {removed} 个文件）")
+    return {"name": skill_name, "target": target["id"], "saved": current["id"], "changed": changed, "removed": removed}
+
+
+def _diff_lines(data: bytes) -> Optional[list]:
+    """按行切分用于 diff；含 NUL 字节或非 UTF-8 的内容视为二进制返回 None"""
+    if b"\0" in data[:8192]:
+        return None
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return [line if line.endswith("\n") else line + "\n" for line in text.splitlines(keepends=True)]
+
+
+def _word_diff(a: list, b: list) -> list:
+    """单词级 diff：行级定位改动块，块内按单词标出 [-删除-]{+新增+}"""
+    out = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for group in matcher.get_grouped_opcodes(DIFF_CONTEXT):
+        i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
+        out.append(f"@@ -{i1 + 1},{i2 - i1} +{j1 + 1},{j2 - j1} @@\n")
+        for tag, a0, a1, b0, b1 in group:
+            if tag == "equal":
+                out.extend(" " + line for line in a[a0:a1])
+                continue
+            if tag != "replace":
+                out.extend("-" + line for line in a[a0:a1])
+                out.extend("+" + line for line in b[b0:b1])
+                continue
+            old = re.split(r"(\s+)", "".join(a[a0:a1]))
+            new = re.split(r"(\s+)", "".join(b[b0:b1]))
+            words = difflib.SequenceMatcher(None, old, new, autojunk=False)
+            text = []
+            for wtag, x0, x1, y0, y1 in words.get_opcodes():
+                if wtag == "equal":
+                    text.extend(old[x0:x1])
+                    continue
+                if x1 > x0:
+                    text.append("[-" + "".join(old[x0:x1]) + "-]")
+                if y1 > y0:
+                    text.append("{+" + "".join(new[y0:y1]) + "+}")
+            text = "".join(text)
+            out.extend("~" + line for line in (text if text.endswith("\n") else text + "\n").splitlines(keepends=True))
+    return out
+
+
+def _diff_cache_path(old_hash: Optional[str], new_hash: Optional[str], mode: str) -> Path:
+    old_hash, new_hash = old_hash or "0", new_hash or "0"
+    return DIFFS_DIR / (old_hash[:2] if old_hash != "0" else new_hash[:2]) / f"{old_hash}-{new_hash}.{mode}.body"
+
+
+_BINARY_DIFF = "\0binary"  # 缓存中表示二进制文件的标记
+
+
+def file_diff(path: str, old_hash: Optional[str], new_hash: Optional[str], mode: str = "full") -> str:
+    """两个内容 hash 之间的文件 diff（full = unified diff，word = 单词级），结果缓存在版本库中
+
+    hash 为 None 表示新增 / 删除的文件。缓存按内容 hash 命名，与 Skill 和版本号无关，可跨版本复用；
+    缓存里只存 hunk 正文，带路径的 ---/+++ 头每次调用时生成。
+    """
+    cache = _diff_cache_path(old_hash, new_hash, mode)
+    try:
+        body = zlib.decompress(cache.read_bytes()).decode("utf-8")
+    except (OSError, zlib.error):
+        a = _diff_lines(read_blob(old_hash)) if old_hash else []
+        b = _diff_lines(read_blob(new_hash)) if new_hash else []
+        if a is None or b is None:
+            body = _BINARY_DIFF
+        elif mode == "word":
+            body = "".join(_word_diff(a, b))
+        else:
+            body = "".join(list(difflib.unified_diff(a, b, n=DIFF_CONTEXT))[2:])
+        _write_atomic(cache, zlib.compress(body.encode("utf-8")))
+    
+    if body == _BINARY_DIFF:
+        return f"Binary files {path} differ\n"
+    return f"--- {'a/' + path if old_hash else '/dev/null'}\n+++ {'b/' + path if new_hash else '/dev/null'}\n" + body
+
+
+def _diff_stat(diff_text: str) -> tuple:
+    """统计 unified diff 的 (新增行, 删除行)；二进制文件返回 (None, None)"""
+    if diff_text.startswith("Binary files"):
+        return None, None
+    added = removed = 0
+    for line in diff_text.splitlines()[2:]:
+        if line.startswith("+"):
+            added += 1
+        elif line.startswith("-"):
+            removed += 1
+    return added, removed
+
+
+def diff_entries(old: dict, new: dict, mode: str = "full") -> str:
+    """对比两个版本的整个目录快照，返回渲染好的 diff 文本"""
+    old_files, new_files = entry_files(old), entry_files(new)
+    changed = []
+    for path in sorted(old_files.keys() | new_files.keys()):
+        a, b = old_files.get(path), new_files.get(path)
+        if a and b and a["hash"] == b["hash"]:
+            if a.get("mode") != b.get("mode"):
+                changed.append((path, None, None, f"mode {a.get('mode', 0):o} → {b.get('mode', 0):o}"))
+            continue
+        changed.append((path, a and a["hash"], b and b["hash"], None))
     
-    # 读取目标版本内容（去掉版本元信息）
-    content = target_version.read_text()
-    if "<!-- VERSION INFO" in content:
-        content = content.split("-->", 1)[1].strip()
+    if not changed:
+        return "（无差异）\n"
     
-    # 覆盖当前文件
-    skill_file = GLOBAL_SKILLS_DIR / skill_name / "SKILL.md"
-    skill_file.write_text(content)
+    if mode != "stat":
+        return "".join(
+            f"diff {path}: {note}\n" if note else file_diff(path, a, b, mode)
+            for path, a, b, note in changed
+        )
     
-    print(f"✅ 已回滚到: {target_version.name}")
+    stats = [(path, *(_diff_stat(file_diff(path, a, b)) if not note else (0, 0))) for path, a, b, note in changed]
+    text_stats = [(add, rem) for _, add, rem in stats if add is not None]
+    width = max(len(path) for path, _, _ in stats)
+    scale = max(1, max((add + rem for add, rem in text_stats), default=0) / 40)
+    out = []
+    for path, add, rem in stats:
+        if add is None:
+            out.append(f" {path.ljust(width)} |  Bin\n")
+            continue
+        bar = "+" * round(add / scale) + "-" * round(rem / scale)
+        out.append(f" {path.ljust(width)} | {add + rem:4} {bar}\n")
+    out.append(f" {len(stats)} 个文件变更，+{sum(a for a, _ in text_stats)} / -{sum(r for _, r in text_stats)} 行\n")
+    return "".join(out)
 
 
-def diff_versions(skill_name: str, v1: int = 1, v2: int = 2):
-    """对比两个版本"""
-    version_dir = get_skill_version_dir(skill_name)
+def diff_versions(skill_name: str, v1: int = 1, v2: int = 2, mode: str = "full", span: bool = False):
+    """对比两个版本；span=True 时依次对比区间内每两个相邻版本（一次读取日志）"""
+    count = read_head(skill_name)["count"]
     
-    if not version_dir.exists():
-        print(f"❌ 无版本历史: {skill_name}")
-        return
+    if not count:
+        raise SkillError(f"无版本历史: {skill_name}")
+    
+    newer, older = min(v1, v2), max(v1, v2)
+    if newer < 1 or older > count:
+        raise SkillError(f"无效版本号（共 {count} 个版本）")
+    
+    entries = list(itertools.islice(iter_log_reverse(skill_name), newer - 1, older))
+    if span:
+        pairs = [(entries[i + 1], entries[i]) for i in reversed(range(len(entries) - 1))]
+    else:
+        # 与以前一致：v2 作为旧版本、v1 作为新版本
+        e1, e2 = entries[v1 - newer], entries[v2 - newer]
+        pairs = [(e2, e1)]
+    
+    diffs = []
+    for old, new in pairs:
+        text = diff_entries(old, new, mode)
+        say(f"\n📊 对比: {new['id']} vs {old['id']}")
+        say("-" * 50)
+        say(text, end="")
+        diffs.append({"new": new["id"], "old": old["id"], "mode": mode, "diff": text})
+    return {"name": skill_name, "diffs": diffs}
+
+
+def prune_versions(skill_name: str, keep: int = DEFAULT_KEEP, days: Optional[int] = None) -> int:
+    """按保留策略裁剪版本日志：保留最近 keep 个、且不早于 days 天的版本（最新版本始终保留）"""
+    entries = load_log(skill_name)
+    if not entries:
+        return 0
     
-    versions = sorted(version_dir.iterdir(), reverse=True)
+    kept = entries[-keep:] if keep > 0 else list(entries)
+    if days is not None:
+        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d_%H%M%S")
+        kept = [e for e in kept[:-1] if e["id"][:15] >= cutoff] + kept[-1:]
     
-    if v1 < 1 or v1 > len(versions) or v2 < 1 or v2 > len(versions):
-        print(f"❌ 无效版本号（共 {len(versions)} 个版本）")
+    removed = len(entries) - len(kept)
+    if removed:
+        _rewrite_log(skill_name, kept)
+    return removed
+
+
+def _all_version_dirs() -> list:
+    """所有根目录下的 Skill 版本目录"""
+    _migrate_name_keyed_versions()
+    return sorted(p for p in (VERSION_DIR / ".roots").glob("*/*") if p.is_dir())
+
+
+def _all_version_skills() -> list:
+    return sorted({p.name for p in _all_version_dirs()})
+
+
+def gc_objects() -> tuple:
+    """回收所有版本日志都不再引用的对象，返回 (删除数, 释放字节)
+
+    base 已不被任何版本引用的 delta 先展开为完整对象，确保裁剪掉的旧版本能真正释放空间。
+    已导入版本日志的旧格式版本文件也在这里删除。
+    """
+    if not OBJECTS_DIR.exists():
+        return 0, 0
+    
+    live = set()
+    for version_dir in _all_version_dirs():  # 包括被同名 Skill 遮住的根目录下的历史
+        for entry in _read_log(version_dir / "log.jsonl"):
+            live.add(entry["hash"])
+            if entry.get("tree") and _object_path(entry["tree"]).exists():
+                live.add(entry["tree"])
+                live.update(info["hash"] for info in read_tree(entry["tree"]).values())
+    live = {d for d in live if _object_path(d).exists()}
+    for digest in live:
+        kind, base, _, _ = _read_object(digest)
+        if kind == "delta" and base not in live:
+            _write_atomic(_object_path(digest), zlib.compress(b"full\n" + read_blob(digest)))
+    
+    removed, freed = 0, 0
+    for obj in OBJECTS_DIR.glob("*/*"):
+        if obj.parent.name + obj.name not in live and not obj.name.startswith("."):
+            freed += obj.stat().st_size
+            obj.unlink()
+            removed += 1
+    # diff 缓存：任一端内容已被回收、或是旧格式（含路径头）的条目则删除
+    for cached in DIFFS_DIR.glob("*/*"):
+        hashes = cached.name.split(".", 1)[0].split("-")
+        if not cached.name.endswith(".body") or any(h != "0" and h not in live for h in hashes):
+            freed += cached.stat().st_size
+            cached.unlink()
+    for version_dir in _all_version_dirs():
+        if (version_dir / "log.jsonl").exists():
+            for path in version_dir.glob("*.md"):
+                freed += path.stat().st_size
+                path.unlink()
+    return removed, freed
+
+
+def prune(skill_names: list, keep: int = DEFAULT_KEEP, days: Optional[int] = None):
+    """prune 命令：裁剪版本日志后回收对象"""
+    pruned = {}
+    for name in skill_names:
+        removed = prune_versions(name, keep, days)
+        if removed:
+            say(f"✂️  {name}: 删除 {removed} 个旧版本")
+            pruned[name] = removed
+    removed, freed = gc_objects()
+    say(f"✅ 裁剪 {sum(pruned.values())} 个版本，回收 {removed} 个对象（{freed / 1024:.1f} KB）")
+    return {"pruned": pruned, "objects": removed, "bytes": freed}
+
+
+_SEARCH_DDL = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL,
+    skill TEXT NOT NULL,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    version TEXT,
+    hash TEXT,
+    title TEXT,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS docs_source ON docs (source_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    skill, path, title, body, content='docs', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts (rowid, skill, path, title, body) VALUES (new.id, new.skill, new.path, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts (docs_fts, rowid, skill, path, title, body) VALUES ('delete', old.id, old.skill, old.path, old.title, old.body);
+END;
+"""
+
+
+def open_search_index() -> sqlite3.Connection:
+    """打开（必要时创建）全文索引库。trigram 分词可直接匹配中文子串"""
+    SEARCH_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(SEARCH_DB))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SEARCH_DDL)
+    return conn
+
+
+def _decode_text(data: bytes) -> Optional[str]:
+    if b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+def _split_frontmatter(text: str) -> tuple:
+    """SKILL.md → (frontmatter, 正文)"""
+    if text.startswith("---"):
+        end = text.find("\n---", 3)
+        if end != -1:
+            return text[3:end].strip("\n"), text[end + 4:].lstrip("\n")
+    return "", text
+
+
+def _skill_file_docs(rel: str, data: bytes) -> list:
+    """当前文件 → [(kind, hash, title, body)]；SKILL.md 拆成 frontmatter 和正文两条"""
+    text = _decode_text(data)
+    if text is None:
+        return []
+    if rel != "SKILL.md":
+        return [("file", None, rel, text)]
+    meta, body = _split_frontmatter(text)
+    digest = hashlib.sha256(data).hexdigest()
+    return [("meta", None, "frontmatter", meta), ("body", digest, "SKILL.md", body)]
+
+
+def _replace_source(conn, known: dict, key: str, st) -> int:
+    """新建或重置一个索引来源，返回 source_id"""
+    if key in known:
+        source_id = known[key][0]
+        conn.execute("DELETE FROM docs WHERE source_id = ?", (source_id,))
+        conn.execute("UPDATE sources SET mtime = ?, size = ? WHERE id = ?", (st.st_mtime, st.st_size, source_id))
+        return source_id
+    return conn.execute("INSERT INTO sources (key, mtime, size) VALUES (?, ?, ?)",
+                        (key, st.st_mtime, st.st_size)).lastrowid
+
+
+def _index_history(conn, source_id: int, skill_name: str):
+    """版本日志 → 每个不同的 SKILL.md 内容一条记录（同一内容只读一次，已索引的内容不再读取）"""
+    versions = {}
+    for entry in load_log(skill_name):
+        v = versions.setdefault(entry["hash"], {"ids": [], "messages": []})
+        v["ids"].append(entry["id"])
+        if entry["message"]:
+            v["messages"].append(entry["message"])
+    
+    existing = {h: (doc_id, version) for doc_id, h, version in conn.execute(
+        "SELECT id, hash, version FROM docs WHERE source_id = ?", (source_id,))}
+    for digest, (doc_id, version) in existing.items():
+        if digest not in versions or versions[digest]["ids"][-1] != version:
+            conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+    for digest, v in versions.items():
+        if digest in existing and existing[digest][1] == v["ids"][-1]:
+            continue
+        try:
+            text = _decode_text(read_blob(digest))
+        except (OSError, zlib.error):
+            continue
+        if text is None:
+            continue
+        title = " / ".join(dict.fromkeys(v["messages"]))
+        conn.execute(
+            "INSERT INTO docs (source_id, skill, path, kind, version, hash, title, body) VALUES (?, ?, ?, 'version', ?, ?, ?, ?)",
+            (source_id, skill_name, "SKILL.md", v["ids"][-1], digest, title, text))
+
+
+def refresh_search_index(conn: sqlite3.Connection, rebuild: bool = False) -> dict:
+    """增量刷新全文索引：只重新读取 mtime/size 变化的文件和版本日志"""
+    if rebuild:
+        conn.execute("DELETE FROM docs")
+        conn.execute("DELETE FROM sources")
+    known = {key: (sid, mtime, size) for sid, key, mtime, size in conn.execute("SELECT id, key, mtime, size FROM sources")}
+    seen = set()
+    stats = {"files": 0, "histories": 0}
+    
+    with conn:
+        for name, info in refresh_index().items():
+            skill_dir = Path(info["dir"])
+            for rel, st in _iter_skill_files(skill_dir):
+                if st.st_size > SEARCH_MAX_FILE_BYTES:
+                    continue
+                key = f"{skill_dir}/{rel}"
+                seen.add(key)
+                if key in known and known[key][1:] == (st.st_mtime, st.st_size):
+                    continue
+                source_id = _replace_source(conn, known, key, st)
+                for kind, digest, title, body in _skill_file_docs(rel, (skill_dir / rel).read_bytes()):
+                    conn.execute(
+                        "INSERT INTO docs (source_id, skill, path, kind, hash, title, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (source_id, name, rel, kind, digest, title, body))
+                stats["files"] += 1
+        
+        for skill_name in _all_version_skills():
+            _import_legacy_versions(skill_name)
+            try:
+                st = _log_file(skill_name).stat()
+            except OSError:
+                continue
+            key = f"{skill_name}@log"
+            seen.add(key)
+            if key in known and known[key][1:] == (st.st_mtime, st.st_size):
+                continue
+            if key in known:
+                source_id = known[key][0]
+                conn.execute("UPDATE sources SET mtime = ?, size = ? WHERE id = ?", (st.st_mtime, st.st_size, source_id))
+            else:
+                source_id = conn.execute("INSERT INTO sources (key, mtime, size) VALUES (?, ?, ?)",
+                                         (key, st.st_mtime, st.st_size)).lastrowid
+            _index_history(conn, source_id, skill_name)
+            stats["histories"] += 1
+        
+        for key in known.keys() - seen:
+            conn.execute("DELETE FROM docs WHERE source_id = ?", (known[key][0],))
+            conn.execute("DELETE FROM sources WHERE id = ?", (known[key][0],))
+    return stats
+
+
+def _like_snippet(text: str, terms: list, width: int = 40) -> str:
+    lower = text.lower()
+    pos = min((lower.find(t.lower()) for t in terms if t.lower() in lower), default=0)
+    start = max(0, pos - width // 2)
+    snippet = text[start:start + width].replace("\n", " ")
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
+
+
+def search_skills(conn: sqlite3.Connection, query: str, limit: int = 20,
+                  history: bool = True, skill: Optional[str] = None) -> list:
+    """全文搜索，按 bm25 排序（列权重：标题 2.0 > Skill 名 = 正文 1.0 > 路径 0.5）
+
+    trigram 索引至少需要 3 个字符，更短的词用 LIKE 过滤。与当前 SKILL.md 内容相同的历史版本不重复返回。
+    """
+    terms = [t for t in query.split() if t]
+    fts_terms = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+    
+    where, params = [], []
+    if fts_terms:
+        sql = ("SELECT d.skill, d.path, d.kind, d.version, d.title, "
+               "snippet(docs_fts, 3, '【', '】', '…', 64), bm25(docs_fts, 1.0, 0.5, 2.0, 1.0) AS rank "
+               "FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid")
+        where.append("docs_fts MATCH ?")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+    else:
+        sql = "SELECT d.skill, d.path, d.kind, d.version, d.title, d.body, 0 AS rank FROM docs d"
+    for term in short_terms:
+        where.append("(d.body LIKE ? OR d.title LIKE ? OR d.skill LIKE ?)")
+        params.extend([f"%{term}%"] * 3)
+    if not history:
+        where.append("d.kind != 'version'")
+    else:
+        where.append("NOT (d.kind = 'version' AND d.hash IN "
+                     "(SELECT c.hash FROM docs c WHERE c.skill = d.skill AND c.kind = 'body'))")
+    if skill:
+        where.append("d.skill = ?")
+        params.append(skill)
+    sql += " WHERE " + " AND ".join(where) + " ORDER BY rank, d.version IS NOT NULL, d.version DESC LIMIT ?"
+    params.append(limit)
+    
+    rows = conn.execute(sql, params).fetchall()
+    if not fts_terms:
+        rows = [row[:5] + (_like_snippet(row[5] or row[4] or "", short_terms),) + row[6:] for row in rows]
+    return rows
+
+
+def search(query: str, limit: int = 20, history: bool = True, skill: Optional[str] = None, rebuild: bool = False):
+    """search 命令"""
+    start = time.perf_counter()
+    conn = open_search_index()
+    stats = refresh_search_index(conn, rebuild)
+    refreshed = time.perf_counter()
+    rows = search_skills(conn, query, limit, history, skill)
+    conn.close()
+    elapsed = (time.perf_counter() - refreshed) * 1000
+    
+    say(f"\n🔍 {query}  —  {len(rows)} 条结果（查询 {elapsed:.1f} ms", end="")
+    if stats["files"] or stats["histories"]:
+        say(f"，刷新 {stats['files']} 个文件 / {stats['histories']} 个版本日志 {(refreshed - start) * 1000:.0f} ms", end="")
+    say("）")
+    say("-" * 50)
+    for i, (skill_name, path, kind, version, title, snippet, _) in enumerate(rows, 1):
+        if kind == "version":
+            where = f"{path} @ {version}" + (f"  💬 {title}" if title else "")
+        elif kind == "meta":
+            where = "SKILL.md (frontmatter)"
+        else:
+            where = path
+        say(f"  {i}. {skill_name}  {where}")
+        say(f"     {' '.join((snippet or '').split())}")
+    return [{"skill": skill_name, "path": path, "kind": kind, "version": version, "title": title,
+             "snippet": " ".join((snippet or "").split())} for skill_name, path, kind, version, title, snippet, _ in rows]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token / 字，其余约 4 字节 / token"""
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿" or "가" <= ch <= "힯" or "＀" <= ch <= "￯")
+    rest = len(text.encode("utf-8")) - cjk * 3
+    return cjk + (rest + 3) // 4
+
+
+def _split_sections(text: str) -> list:
+    """按 Markdown 标题切分段落（忽略代码块里的 #），返回 [(标题, 内容)]"""
+    sections, heading, lines, fence = [], "", [], False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            fence = not fence
+        if line.startswith("#") and not fence:
+            if "".join(lines).strip():
+                sections.append((heading, "".join(lines)))
+            heading, lines = line.strip("# \n"), []
+        lines.append(line)
+    if "".join(lines).strip():
+        sections.append((heading, "".join(lines)))
+    return sections
+
+
+def _analyze_text(text: str) -> dict:
+    sections = []
+    for heading, content in _split_sections(text):
+        normalized = " ".join(content.split())
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest() if len(normalized) >= DUPLICATE_MIN_BYTES else None
+        sections.append([heading, estimate_tokens(content), digest])
+    return {"bytes": len(text.encode("utf-8")), "tokens": estimate_tokens(text), "sections": sections}
+
+
+def _analyze_file(path: Path, rel: str) -> Optional[dict]:
+    """单个文件的统计；SKILL.md 分 frontmatter / 正文两部分"""
+    text = _decode_text(path.read_bytes())
+    if text is None:
+        return None
+    if rel != "SKILL.md":
+        return _analyze_text(text)
+    meta, body = _split_frontmatter(text)
+    result = _analyze_text(body)
+    result["frontmatter"] = {"bytes": len(meta.encode("utf-8")), "tokens": estimate_tokens(meta)}
+    return result
+
+
+def _is_reference(rel: str) -> bool:
+    return rel.startswith("references/") or (rel.endswith(".md") and "/" not in rel and rel != "SKILL.md")
+
+
+def analyze_skills(skill_names: Optional[list] = None) -> dict:
+    """统计 Skills 的上下文开销；按文件 mtime/size 缓存单文件结果，只重新读取变化的文件"""
+    try:
+        cache = json.loads(ANALYZE_CACHE.read_text(encoding="utf-8"))
+        if cache.get("format") != ANALYZE_FORMAT:
+            raise ValueError
+    except (OSError, ValueError):
+        cache = {"format": ANALYZE_FORMAT, "files": {}}
+    old_files, files = cache["files"], {}
+    
+    metadata = refresh_index()
+    missing = [name for name in skill_names or [] if name not in metadata]
+    if missing:
+        raise SkillError(f"Skill 不存在: {', '.join(missing)}")
+    reports = []
+    for name in skill_names or list(metadata):
+        skill_dir = Path(metadata[name]["dir"])
+        description = parse_skill_metadata(skill_dir / "SKILL.md").get("description", "")
+        report = {
+            "name": name,
+            "description": {"chars": len(description), "tokens": estimate_tokens(description)},
+            "frontmatter": {"bytes": 0, "tokens": 0},
+            "body": {"bytes": 0, "tokens": 0},
+            "references": {"bytes": 0, "tokens": 0, "files": 0},
+            "sections": [],
+            "warnings": [],
+        }
+        for rel, st in _iter_skill_files(skill_dir):
+            if rel != "SKILL.md" and not _is_reference(rel):
+                continue
+            key = f"{skill_dir}/{rel}"
+            cached = old_files.get(key)
+            if cached and cached["mtime"] == st.st_mtime and cached["size"] == st.st_size:
+                info = cached
+            else:
+                info = _analyze_file(skill_dir / rel, rel) if st.st_size <= SEARCH_MAX_FILE_BYTES else None
+                info = dict(info or {"bytes": st.st_size, "tokens": 0, "sections": [], "binary": True},
+                            mtime=st.st_mtime, size=st.st_size)
+            files[key] = info
+            if info.get("binary"):
+                continue
+            
+            if rel == "SKILL.md":
+                report["frontmatter"] = info["frontmatter"]
+                report["body"] = {"bytes": info["bytes"], "tokens": info["tokens"]}
+                if info["tokens"] > BODY_MAX_TOKENS:
+                    report["warnings"].append(f"SKILL.md 正文约 {info['tokens']} tokens（> {BODY_MAX_TOKENS}），考虑拆到 references/")
+            else:
+                report["references"]["bytes"] += info["bytes"]
+                report["references"]["tokens"] += info["tokens"]
+                report["references"]["files"] += 1
+                if info["tokens"] > REFERENCE_MAX_TOKENS:
+                    report["warnings"].append(f"{rel} 约 {info['tokens']} tokens（> {REFERENCE_MAX_TOKENS}）")
+            for heading, tokens, digest in info["sections"]:
+                report["sections"].append((rel, heading, digest))
+                if tokens > SECTION_MAX_TOKENS:
+                    report["warnings"].append(f"{rel} 段落「{heading or '(开头)'}」约 {tokens} tokens（> {SECTION_MAX_TOKENS}）")
+        if report["description"]["chars"] > DESCRIPTION_MAX_CHARS:
+            report["warnings"].insert(0, f"description {report['description']['chars']} 字符（> {DESCRIPTION_MAX_CHARS}），每次会话都会加载")
+        reports.append(report)
+    
+    # 只有完整扫描时才丢弃已删除文件的缓存，按名字分析时保留其余条目
+    if skill_names:
+        files = {**old_files, **files}
+    if files != old_files:
+        cache["files"] = files
+        ANALYZE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ANALYZE_CACHE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, ANALYZE_CACHE)
+    
+    locations = {}
+    for report in reports:
+        for rel, heading, digest in report.pop("sections"):
+            if digest:
+                locations.setdefault(digest, []).append((report["name"], rel, heading))
+    duplicates = [locs for locs in locations.values() if len(locs) > 1]
+    return {"skills": reports, "duplicates": duplicates}
+
+
+def analyze(skill_names: Optional[list] = None, sort: str = "total", top: Optional[int] = None):
+    """analyze 命令：打印每个 Skill 和合计的上下文开销"""
+    result = analyze_skills(skill_names)
+    reports = result["skills"]
+    if not reports:
+        say("  (空)")
+        return result
+    
+    def total(r):
+        return r["frontmatter"]["tokens"] + r["body"]["tokens"] + r["references"]["tokens"]
+    
+    key = {"total": total, "body": lambda r: r["body"]["tokens"],
+           "description": lambda r: r["description"]["tokens"], "name": None}[sort]
+    if key:
+        reports = sorted(reports, key=key, reverse=True)
+    
+    width = max(len("Skill"), *(len(r["name"]) for r in reports[:top]))
+    say(f"\n📊 Skill 上下文开销（估算 tokens）")
+    say("-" * (width + 58))
+    say(f"  {'Skill'.ljust(width)}  {'description':>11}  {'frontmatter':>11}  {'正文':>6}  {'references':>12}  {'合计':>6}")
+    for r in reports[:top]:
+        refs = f"{r['references']['tokens']}/{r['references']['files']}" if r["references"]["files"] else "-"
+        say(f"  {r['name'].ljust(width)}  {r['description']['tokens']:>11}  {r['frontmatter']['tokens']:>11}"
+              f"  {r['body']['tokens']:>8}  {refs:>12}  {total(r):>8}")
+    if top and len(reports) > top:
+        say(f"  ... 还有 {len(reports) - top} 个 Skills")
+    
+    sums = {part: sum(r[part]["tokens"] for r in reports) for part in ("description", "frontmatter", "body", "references")}
+    size = sum(r[part]["bytes"] for r in reports for part in ("frontmatter", "body", "references"))
+    say("-" * (width + 58))
+    say(f"  {'合计'.ljust(width - 2)}  {sums['description']:>11}  {sums['frontmatter']:>11}  {sums['body']:>8}"
+          f"  {sums['references']:>12}  {sums['frontmatter'] + sums['body'] + sums['references']:>8}")
+    say(f"\n  {len(reports)} 个 Skills，共 {size / 1024:.1f} KB；常驻上下文（所有 description）约 {sums['description']} tokens")
+    
+    warnings = [(r["name"], w) for r in reports for w in r["warnings"]]
+    if warnings:
+        say(f"\n⚠️  过大（{len(warnings)}）")
+        for name, warning in warnings:
+            say(f"  - {name}: {warning}")
+    if result["duplicates"]:
+        say(f"\n♻️  重复段落（{len(result['duplicates'])}）")
+        for locs in result["duplicates"]:
+            say("  - " + "  ==  ".join(f"{name}/{rel}「{heading or '(开头)'}」" for name, rel, heading in locs))
+    return dict(result, skills=reports)
+
+
+# ---------- watch ----------
+
+_IN_ATTRIB, _IN_CLOSE_WRITE, _IN_MOVED_FROM, _IN_MOVED_TO = 0x4, 0x8, 0x40, 0x80
+_IN_CREATE, _IN_DELETE, _IN_DELETE_SELF, _IN_MOVE_SELF = 0x100, 0x200, 0x400, 0x800
+_IN_Q_OVERFLOW, _IN_IGNORED, _IN_ISDIR = 0x4000, 0x8000, 0x40000000
+_IN_MASK = (_IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE
+            | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _watch_ignored(name: str) -> bool:
+    return name in SNAPSHOT_IGNORE or name.startswith(".#") or name.endswith(WATCH_IGNORE_SUFFIXES)
+
+
+class InotifyWatcher:
+    """基于 inotify（ctypes 调用 libc）的目录监听，只在有事件时唤醒；changes() 返回有改动的 Skill 名"""
+
+    def __init__(self, roots: list):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify 不可用")
+        self.libc, self.roots = libc, roots
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.dirs = {}  # wd → 目录路径
+        for root in roots:
+            self._add_tree(root)
+
+    def _add(self, path: str):
+        if len(self.dirs) >= WATCH_MAX_DIRS:
+            raise OSError(f"目录数超过 {WATCH_MAX_DIRS}")
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def _add_tree(self, path: Path):
+        for root, dirs, _ in os.walk(path):
+            dirs[:] = [d for d in dirs if not _watch_ignored(d)]
+            self._add(root)
+
+    def _skill_of(self, path: str) -> Optional[str]:
+        for root in self.roots:
+            rel = os.path.relpath(path, root)
+            if not rel.startswith(".."):
+                return None if rel == "." else rel.split(os.sep, 1)[0]
+        return None
+
+    def changes(self, timeout: float) -> set:
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & _IN_Q_OVERFLOW:
+                # 事件队列溢出：无法知道改了什么，全部检查一遍（内容未变的 Skill 不会产生新版本）
+                changed.update(p.name for root in self.roots for p in root.iterdir() if p.is_dir())
+                continue
+            if mask & _IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            base = self.dirs.get(wd)
+            if base is None:
+                continue
+            name = os.fsdecode(name)
+            if name and _watch_ignored(name):
+                continue
+            path = os.path.join(base, name) if name else base
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._add_tree(Path(path))
+            skill = self._skill_of(path)
+            if skill and not skill.startswith("."):
+                changed.add(skill)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """轮询兜底：每个 Skill 只保留一个 (文件数, 总大小, 最大 mtime) 签名，内存与文件数无关"""
+
+    def __init__(self, roots: list, interval: float = WATCH_POLL_INTERVAL):
+        self.roots, self.interval = roots, interval
+        self.signatures = self._scan()
+
+    def _scan(self) -> dict:
+        signatures = {}
+        for root in self.roots:
+            if not root.exists():
+                continue
+            for skill_dir in root.iterdir():
+                if not skill_dir.is_dir() or skill_dir.name.startswith("."):
+                    continue
+                count = size = latest = 0
+                for rel, st in _iter_skill_files(skill_dir):
+                    if _watch_ignored(rel.rsplit("/", 1)[-1]):
+                        continue
+                    count, size, latest = count + 1, size + st.st_size, max(latest, st.st_mtime_ns)
+                signatures[str(skill_dir)] = (skill_dir.name, count, size, latest)
+        return signatures
+
+    def changes(self, timeout: float) -> set:
+        time.sleep(min(timeout, self.interval))
+        start = time.monotonic()
+        signatures = self._scan()
+        # 扫描耗时超过间隔的 10% 时放宽间隔，大目录下 CPU 占用有上限
+        self.interval = max(self.interval, (time.monotonic() - start) * 10)
+        changed = {(signatures.get(path) or self.signatures[path])[0]
+                   for path in signatures.keys() | self.signatures.keys()
+                   if signatures.get(path) != self.signatures.get(path)}
+        self.signatures = signatures
+        return changed
+
+    def close(self):
+        pass
+
+
+def _auto_snapshot(skill_name: str, coalesce: float):
+    """自动保存一个版本；上一个版本也是 watch 自动保存、且这一串合并从第一次保存起不到 coalesce 秒时合并"""
+    if resolve_skill(skill_name) is None:
         return
+    last = read_head(skill_name)["last"]
+    amend = False
+    if last and last["message"] == WATCH_MESSAGE:
+        try:
+            first = last.get("since", last["id"])
+            age = (datetime.now() - datetime.strptime(first[:15], "%Y%m%d_%H%M%S")).total_seconds()
+            amend = age < coalesce
+        except ValueError:
+            pass
+    save_version(skill_name, WATCH_MESSAGE, amend=amend)
+
+
+def watch(debounce: float = WATCH_DEBOUNCE, coalesce: float = WATCH_COALESCE,
+          interval: float = WATCH_POLL_INTERVAL, poll: bool = False):
+    """watch 命令：监听所有 Skill 根目录，改动静默 debounce 秒后自动保存生效版本，直到 Ctrl-C / SIGTERM"""
+    GLOBAL_SKILLS_DIR.mkdir(parents=True, exist_ok=True)
+    _ROOTS.clear()
+    roots = [root for _, root in skill_roots()]
+    watcher = None
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(roots)
+        except OSError as e:
+            say(f"⚠️  inotify 不可用（{e}），改用轮询")
+    if watcher is None:
+        watcher = PollingWatcher(roots, interval)
+    say(f"👀 监听 {', '.join(map(str, roots))}（{'inotify' if isinstance(watcher, InotifyWatcher) else '轮询'}，"
+        f"静默 {debounce:g}s 后保存，{coalesce:g}s 内的自动版本合并）")
+    
+    stopping = []
+    # 显式接管 SIGINT：从脚本后台启动时 SIGINT 默认被忽略，KeyboardInterrupt 不会触发
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    pending = {}  # Skill 名 → (第一次改动时间, 最后一次改动时间)
+    try:
+        while not stopping:
+            now = time.monotonic()
+            due = [name for name, (first, last) in pending.items()
+                   if now - last >= debounce or now - first >= WATCH_MAX_DELAY]
+            for name in due:
+                del pending[name]
+                try:
+                    _auto_snapshot(name, coalesce)
+                except (OSError, SkillError) as e:
+                    say(f"❌ {name}: {e}")
+            timeout = min((max(0.0, debounce - (now - last)) for _, last in pending.values()), default=1.0)
+            for name in watcher.changes(min(timeout, 1.0)):
+                now = time.monotonic()
+                pending[name] = (pending.get(name, (now, now))[0], now)
+    finally:
+        # 退出前保存尚未落盘的改动
+        for name in pending:
+            try:
+                _auto_snapshot(name, coalesce)
+            except (OSError, SkillError) as e:
+                say(f"❌ {name}: {e}")
+        watcher.close()
+    say("👋 已停止监听")
+
+
+# ---------- pack / unpack ----------
+#
+# 包结构（tar.gz）：
+#   MANIFEST.json                 {"format", "created", "skills": {名字: {"tree", "files", "history"}}}
+#   objects/<sha256>              文件内容，按 hash 去重（多个 Skill / 版本共用）
+#   history/<名字>/log.jsonl      可选：版本日志，引用的对象同样在 objects/ 里
+
+def _hash_skill_dir(skill_dir: Path) -> dict:
+    """{相对路径: {"hash", "size", "mode"}}，格式与版本快照的 tree 相同"""
+    files = {}
+    for rel, st in _iter_skill_files(skill_dir):
+        digest = hashlib.sha256((skill_dir / rel).read_bytes()).hexdigest()
+        files[rel] = {"hash": digest, "size": st.st_size, "mode": st.st_mode & 0o777}
+    return files
+
+
+def _tree_hash(files: dict) -> str:
+    return hashlib.sha256(json.dumps(files, sort_keys=True, indent=0).encode("utf-8")).hexdigest()
+
+
+def _tar_add(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size, info.mtime, info.mode = len(data), int(time.time()), 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def pack(skill_names: list, output: Path, history: bool = False) -> dict:
+    """pack 命令：把 Skills 打成一个压缩包，相同内容只存一份"""
+    manifest = {"format": PACK_FORMAT, "created": datetime.now().isoformat(timespec="seconds"), "skills": {}}
+    sources = {}  # hash → 读取内容的函数
+    logs = {}
+    for name in skill_names:
+        skill_dir = skill_dir_of(name)
+        files = _hash_skill_dir(skill_dir)
+        for rel, info in files.items():
+            sources.setdefault(info["hash"], lambda path=skill_dir / rel: path.read_bytes())
+        entries = load_log(name) if history else []
+        for entry in entries:
+            digests = [entry["hash"]] + ([entry["tree"]] + [f["hash"] for f in read_tree(entry["tree"]).values()]
+                                         if entry.get("tree") else [])
+            for digest in digests:
+                sources.setdefault(digest, lambda digest=digest: read_blob(digest))
+        if entries:
+            logs[name] = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        manifest["skills"][name] = {"tree": _tree_hash(files), "files": files, "history": bool(entries)}
+    
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(f".{output.name}.tmp")
+    with tarfile.open(tmp, "w:gz", compresslevel=9) as tar:
+        # 清单放在最前面，unpack 读到它就能决定后面哪些对象需要
+        _tar_add(tar, "MANIFEST.json", json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+        for name, data in logs.items():
+            _tar_add(tar, f"history/{name}/log.jsonl", data)
+        for digest, read in sorted(sources.items()):
+            data = read()
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise SkillError(f"打包过程中文件被修改，请重试（{digest[:12]}）")
+            _tar_add(tar, f"objects/{digest}", data)
+    os.replace(tmp, output)
     
-    file1 = versions[v1 - 1]
-    file2 = versions[v2 - 1]
+    size = output.stat().st_size
+    say(f"📦 已打包 {len(skill_names)} 个 Skills（{len(sources)} 个对象{'，含版本历史' if logs else ''}）→ {output}（{size / 1024:.1f} KB）")
+    return {"path": str(output), "bytes": size, "skills": list(manifest["skills"]), "objects": len(sources)}
+
+
+def _safe_rel(rel: str) -> bool:
+    parts = rel.split("/")
+    return bool(rel) and not rel.startswith("/") and ".." not in parts and "" not in parts
+
+
+def _install_files(skill_dir: Path, current: dict, target: dict, objects: dict, executor) -> tuple:
+    """把 skill_dir 更新为 target，只写内容不同的文件；先并行写临时文件，全部成功后再替换"""
+    changed = [rel for rel, info in target.items()
+               if current.get(rel, {}).get("hash") != info["hash"] or current[rel].get("mode") != info.get("mode")]
+    removed = [rel for rel in current if rel not in target]
     
-    print(f"\n📊 对比: {file1.name} vs {file2.name}")
-    print("-" * 50)
+    def stage(rel):
+        dest = skill_dir / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.unpack-tmp")
+        tmp.write_bytes(objects[target[rel]["hash"]])
+        os.chmod(tmp, target[rel].get("mode", 0o644))
+        return tmp, dest
     
-    # 使用 diff 命令
-    os.system(f"diff -u '{file2}' '{file1}' | head -50")
+    staged = []
+    try:
+        for result in executor.map(stage, changed):
+            staged.append(result)
+    except Exception:
+        for rel in changed:
+            (skill_dir / rel).with_name(f".{Path(rel).name}.unpack-tmp").unlink(missing_ok=True)
+        raise
+    for tmp, dest in staged:
+        os.replace(tmp, dest)
+    for rel in removed:
+        (skill_dir / rel).unlink(missing_ok=True)
+    return len(changed), len(removed)
+
+
+def _merge_history(skill_name: str, entries: list) -> int:
+    """把包里的版本日志合并进本地（对象已写入版本库），按版本 ID 去重排序，返回新增版本数"""
+    local = load_log(skill_name)
+    known = {e["id"] for e in local}
+    new = [e for e in entries if e["id"] not in known]
+    if new:
+        _rewrite_log(skill_name, sorted(local + new, key=lambda e: e["id"]))
+    return len(new)
+
+
+def unpack(archive: Path, dest: Optional[Path] = None, only: Optional[list] = None,
+           history: bool = True, jobs: int = PACK_JOBS) -> list:
+    """unpack 命令：校验每个对象的 hash，跳过与本地内容一致的 Skill，其余并行写入
+
+    默认解到 ~/.claude/skills；已有同名 Skill 时只改动有差异的文件，并删除包里没有的文件。
+    """
+    dest = dest or GLOBAL_SKILLS_DIR
+    with tarfile.open(archive, "r:gz") as tar:
+        first = tar.next()
+        if first is None or first.name != "MANIFEST.json":
+            raise SkillError(f"不是 skill 包（缺少 MANIFEST.json）: {archive}")
+        manifest = json.loads(tar.extractfile(first).read())
+        if manifest.get("format") != PACK_FORMAT:
+            raise SkillError(f"不支持的包格式: {manifest.get('format')}")
+        
+        # 先比对本地内容，只有需要写入的 Skill 才读取其对象
+        plan, results = {}, []
+        for name, spec in manifest["skills"].items():
+            if only and name not in only:
+                continue
+            if "/" in name or name.startswith(".") or not all(_safe_rel(rel) for rel in spec["files"]):
+                raise SkillError(f"包内路径不安全: {name}")
+            skill_dir = dest / name
+            current = _hash_skill_dir(skill_dir) if skill_dir.exists() else {}
+            wanted = spec["history"] and history
+            if current and _tree_hash(current) == spec["tree"] and not wanted:
+                say(f"⏭️  {name}: 与本地一致，跳过")
+                results.append({"name": name, "skipped": True})
+                continue
+            plan[name] = (skill_dir, current)
+        needed = {info["hash"] for name in plan for info in manifest["skills"][name]["files"].values()}
+        
+        objects, logs = {}, {}
+        for member in tar:
+            if member.name.startswith("history/") and member.name.endswith("/log.jsonl"):
+                name = member.name.split("/")[1]
+                if name in plan and history:
+                    logs[name] = [json.loads(line) for line in tar.extractfile(member).read().splitlines() if line.strip()]
+                continue
+            if not member.name.startswith("objects/"):
+                continue
+            digest = member.name[len("objects/"):]
+            if digest not in needed and not logs:  # 日志排在对象之前；要导入历史时保留全部对象
+                continue
+            data = tar.extractfile(member).read()
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise SkillError(f"校验失败，包已损坏: {member.name}")
+            objects[digest] = data
+    
+    missing = needed - objects.keys()
+    if missing:
+        raise SkillError(f"包不完整，缺少 {len(missing)} 个对象")
+    if logs:
+        for digest, data in objects.items():
+            if not _object_path(digest).exists():
+                store_blob(data)
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for name, (skill_dir, current) in plan.items():
+            target = manifest["skills"][name]["files"]
+            if _tree_hash(current) == manifest["skills"][name]["tree"]:
+                changed = removed = 0
+            else:
+                changed, removed = _install_files(skill_dir, current, target, objects, executor)
+            merged = _merge_history(name, logs[name]) if name in logs else 0
+            say(f"✅ {name}: 写入 {changed} 个文件，删除 {removed} 个文件" + (f"，导入 {merged} 个版本" if merged else ""))
+            results.append({"name": name, "dir": str(skill_dir), "written": changed, "removed": removed, "versions": merged})
+    return results
 
 
 def update_skill(skill_name: str, message: str = ""):
     """更新 Skill（保存版本后打开编辑）"""
-    skill_file = GLOBAL_SKILLS_DIR / skill_name / "SKILL.md"
-    
-    if not skill_file.exists():
-        print(f"❌ Skill 不存在: {skill_name}")
-        return
+    skill_file = skill_dir_of(skill_name) / "SKILL.md"
     
     # 先保存当前版本
-    save_version(skill_name, message or "更新前保存")
+    entry = save_version(skill_name, message or "更新前保存")
     
-    print(f"✅ 版本已保存，可以安全编辑: {skill_file}")
+    say(f"✅ 版本已保存，可以安全编辑: {skill_file}")
+    return entry
 
 
-def main():
+def _batch(func, names: list, *args) -> list:
+    """对多个 Skill 执行同一命令；单个失败不影响其余，错误记录在结果里"""
+    results = []
+    for name in names:
+        try:
+            results.append(dict(func(name, *args), name=name))
+        except SkillError as e:
+            say(f"❌ {name}: {e}")
+            results.append({"name": name, "error": str(e)})
+    return results
+
+
+def _installed_skills() -> list:
+    return list(refresh_index())
+
+
+def _save_targets(args) -> tuple:
+    """save 的目标和消息；兼容旧写法 `save <name> "消息"`（第二个参数不是已安装的 Skill 时视为消息）"""
+    names, message = list(args.names), args.message
+    if args.all:
+        return _installed_skills(), message or ""
+    if message is None and len(names) == 2 and resolve_skill(names[1]) is None:
+        message = names.pop()
+    return names, message or ""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    # --json 既可放在子命令前也可放在子命令后
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", action="store_true", default=argparse.SUPPRESS, help="输出 JSON")
+    
     parser = argparse.ArgumentParser(
         description="Skill Manager - 管理 Claude Code Skills",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -318,13 +1934,29 @@ def main():
   skill-manager show my-skill         # 查看 Skill 详情
   skill-manager create my-skill       # 创建新 Skill
   skill-manager history my-skill      # 查看版本历史
+  skill-manager history my-skill -n 10 --since 2025-12-01  # 分页查看
   skill-manager save my-skill "描述"  # 保存当前版本
+  skill-manager save --all -m "批量保存"  # 保存所有 Skills
+  skill-manager history --all -n 1 --json  # 所有 Skills 的最新版本（JSON）
+  echo 'save a -m x' | skill-manager serve  # 一个进程里执行多条命令
   skill-manager rollback my-skill 2   # 回滚到第 2 个版本
   skill-manager diff my-skill 1 2     # 对比版本 1 和 2
+  skill-manager diff my-skill 1 5 --range --stat  # 逐个版本查看变更统计
+  skill-manager prune my-skill --keep 10 --days 90  # 按保留策略清理旧版本
+  skill-manager prune --all           # 对所有 Skills 应用默认保留策略
+  skill-manager gc                    # 回收无引用的版本对象
+  skill-manager search "触发词"        # 全文搜索 Skills 及历史版本
+  skill-manager analyze               # 统计各 Skill 的 token 开销，标出过大 / 重复的段落
+  skill-manager watch                 # 监听改动并自动保存版本
+  skill-manager pack --all --history -o team.skillpack.tgz  # 打包分发
+  skill-manager unpack team.skillpack.tgz  # 校验并增量解包
         """
     )
     
+    parser.add_argument("--json", action="store_true", default=False, help="输出 JSON")
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
+    _add_parser = subparsers.add_parser
+    subparsers.add_parser = lambda *a, **kw: _add_parser(*a, parents=[common], **kw)
     
     # list
     list_parser = subparsers.add_parser("list", help="列出所有 Skills")
@@ -341,12 +1973,16 @@ def main():
     
     # history
     history_parser = subparsers.add_parser("history", help="查看版本历史")
-    history_parser.add_argument("name", help="Skill 名称")
+    history_parser.add_argument("names", nargs="*", metavar="name", help="Skill 名称（可多个）")
+    history_parser.add_argument("--all", action="store_true", help="所有有版本历史的 Skills")
+    history_parser.add_argument("-n", "--limit", type=int, help="最多显示 N 个版本（最新在前）")
+    history_parser.add_argument("--since", type=_parse_since, help="只显示该时间之后的版本，如 2025-12-08")
     
     # save
     save_parser = subparsers.add_parser("save", help="保存当前版本")
-    save_parser.add_argument("name", help="Skill 名称")
-    save_parser.add_argument("message", nargs="?", default="", help="版本消息")
+    save_parser.add_argument("names", nargs="*", metavar="name", help="Skill 名称（可多个；兼容 `save <name> \"消息\"`）")
+    save_parser.add_argument("-m", "--message", help="版本消息")
+    save_parser.add_argument("--all", action="store_true", help="所有已安装的 Skills")
     
     # rollback
     rollback_parser = subparsers.add_parser("rollback", help="回滚到指定版本")
@@ -358,32 +1994,178 @@ def main():
     diff_parser.add_argument("name", help="Skill 名称")
     diff_parser.add_argument("v1", type=int, nargs="?", default=1, help="版本1")
     diff_parser.add_argument("v2", type=int, nargs="?", default=2, help="版本2")
+    diff_parser.add_argument("--mode", choices=DIFF_MODES, default="full", help="full: 完整 diff，stat: 变更统计，word: 单词级")
+    diff_parser.add_argument("--stat", dest="mode", action="store_const", const="stat", help="等同 --mode stat")
+    diff_parser.add_argument("--word", dest="mode", action="store_const", const="word", help="等同 --mode word")
+    diff_parser.add_argument("--range", dest="span", action="store_true", help="依次对比 v1..v2 区间内每两个相邻版本")
     
     # update
     update_parser = subparsers.add_parser("update", help="更新前保存版本")
     update_parser.add_argument("name", help="Skill 名称")
     update_parser.add_argument("message", nargs="?", default="", help="版本消息")
     
-    args = parser.parse_args()
+    # prune
+    prune_parser = subparsers.add_parser("prune", help="按保留策略清理旧版本")
+    prune_parser.add_argument("name", nargs="?", help="Skill 名称")
+    prune_parser.add_argument("--all", action="store_true", help="所有 Skills")
+    prune_parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help=f"保留最近 N 个版本（默认 {DEFAULT_KEEP}，0=不限）")
+    prune_parser.add_argument("--days", type=int, help="只保留最近 N 天内的版本（最新版本始终保留）")
+    
+    # gc
+    subparsers.add_parser("gc", help="回收无引用的版本对象")
+    
+    # search
+    search_parser = subparsers.add_parser("search", help="全文搜索 Skills 及历史版本（标题命中优先，路径命中靠后）")
+    search_parser.add_argument("query", help="搜索词（多个词之间为 AND）")
+    search_parser.add_argument("-n", "--limit", type=int, default=20, help="最多返回条数")
+    search_parser.add_argument("--skill", help="只搜索指定 Skill")
+    search_parser.add_argument("--current", action="store_true", help="只搜索当前文件，不含历史版本")
+    search_parser.add_argument("--rebuild", action="store_true", help="丢弃索引重新建立")
     
+    # analyze
+    analyze_parser = subparsers.add_parser("analyze", help="统计 Skills 的上下文开销")
+    analyze_parser.add_argument("names", nargs="*", help="Skill 名称（默认全部）")
+    analyze_parser.add_argument("--sort", choices=["total", "body", "description", "name"], default="total", help="排序方式")
+    analyze_parser.add_argument("--top", type=int, help="只显示前 N 个")
+    
+    # watch
+    watch_parser = subparsers.add_parser("watch", help="监听 Skills 目录，改动后自动保存版本")
+    watch_parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, help=f"改动静默多少秒后保存（默认 {WATCH_DEBOUNCE:g}）")
+    watch_parser.add_argument("--coalesce", type=float, default=WATCH_COALESCE, help=f"多少秒内的自动版本合并为一个（默认 {WATCH_COALESCE}，0=不合并）")
+    watch_parser.add_argument("--interval", type=float, default=WATCH_POLL_INTERVAL, help="轮询间隔（秒）")
+    watch_parser.add_argument("--poll", action="store_true", help="强制使用轮询（不用 inotify）")
+    
+    # pack / unpack
+    pack_parser = subparsers.add_parser("pack", help="把 Skills 打成一个压缩包")
+    pack_parser.add_argument("names", nargs="*", metavar="name", help="Skill 名称（可多个）")
+    pack_parser.add_argument("--all", action="store_true", help="所有 Skills")
+    pack_parser.add_argument("-o", "--output", type=Path, help="输出文件（默认 skills-<时间>.skillpack.tgz）")
+    pack_parser.add_argument("--history", action="store_true", help="同时打包版本历史")
+    unpack_parser = subparsers.add_parser("unpack", help="校验并解开 Skill 包")
+    unpack_parser.add_argument("archive", type=Path, help="pack 生成的文件")
+    unpack_parser.add_argument("names", nargs="*", metavar="name", help="只解开这些 Skill（默认全部）")
+    unpack_parser.add_argument("--dest", type=Path, help="解到哪个目录（默认 ~/.claude/skills）")
+    unpack_parser.add_argument("--no-history", action="store_true", help="不导入包里的版本历史")
+    unpack_parser.add_argument("-j", "--jobs", type=int, default=PACK_JOBS, help=f"并行写入线程数（默认 {PACK_JOBS}）")
+    
+    # serve
+    subparsers.add_parser("serve", help="从 stdin 逐行读取命令并执行，每条输出一行 JSON")
+    
+    return parser
+
+
+def run_command(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """执行一条已解析的命令，返回结果数据（--json 模式下由调用方序列化）"""
     if args.command == "list":
-        list_skills(args.verbose)
+        return list_skills(args.verbose)
     elif args.command == "show":
-        show_skill(args.name)
+        return show_skill(args.name)
     elif args.command == "create":
-        create_skill(args.name, args.description)
+        return create_skill(args.name, args.description)
     elif args.command == "history":
-        list_history(args.name)
+        if not args.all and not args.names:
+            raise SkillError("需要 Skill 名称或 --all")
+        names = _all_version_skills() if args.all else args.names
+        if len(names) == 1 and not args.all:
+            return list_history(names[0], args.limit, args.since)
+        return _batch(list_history, names, args.limit, args.since)
     elif args.command == "save":
-        save_version(args.name, args.message)
+        names, message = _save_targets(args)
+        if not names:
+            raise SkillError("需要 Skill 名称或 --all")
+        if len(names) == 1 and not args.all:
+            return save_version(names[0], message)
+        return _batch(save_version, names, message)
     elif args.command == "rollback":
-        rollback(args.name, args.version)
+        return rollback(args.name, args.version)
     elif args.command == "diff":
-        diff_versions(args.name, args.v1, args.v2)
+        return diff_versions(args.name, args.v1, args.v2, args.mode, args.span)
     elif args.command == "update":
-        update_skill(args.name, args.message)
-    else:
-        parser.print_help()
+        return update_skill(args.name, args.message)
+    elif args.command == "prune":
+        if not args.all and not args.name:
+            raise SkillError("需要 Skill 名称或 --all")
+        return prune(_all_version_skills() if args.all else [args.name], args.keep, args.days)
+    elif args.command == "gc":
+        removed, freed = gc_objects()
+        say(f"✅ 回收 {removed} 个对象（{freed / 1024:.1f} KB）")
+        return {"objects": removed, "bytes": freed}
+    elif args.command == "search":
+        return search(args.query, args.limit, not args.current, args.skill, args.rebuild)
+    elif args.command == "analyze":
+        return analyze(args.names, args.sort, args.top)
+    elif args.command == "pack":
+        if not args.all and not args.names:
+            raise SkillError("需要 Skill 名称或 --all")
+        output = args.output or Path(f"skills-{datetime.now():%Y%m%d_%H%M%S}.skillpack.tgz")
+        return pack(_installed_skills() if args.all else args.names, output, args.history)
+    elif args.command == "unpack":
+        return unpack(args.archive, args.dest, args.names, not args.no_history, args.jobs)
+    elif args.command == "watch":
+        return watch(args.debounce, args.coalesce, args.interval, args.poll)
+    parser.print_help()
+    return None
+
+
+def _failed(result) -> bool:
+    return isinstance(result, list) and any(isinstance(r, dict) and "error" in r for r in result)
+
+
+def serve(parser: argparse.ArgumentParser):
+    """serve 命令：每行一条命令（shell 写法或 JSON 数组），每条输出一行 JSON：
+
+        {"id": 行号, "ok": true, "result": ...} / {"id": 行号, "ok": false, "error": "..."}
+    """
+    OUTPUT["json"] = True
+    for lineno, line in enumerate(sys.stdin, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        response = {"id": lineno}
+        try:
+            argv = json.loads(line) if line.startswith("[") else shlex.split(line)
+            if argv and argv[0] == "skill-manager":
+                argv = argv[1:]
+            stderr = io.StringIO()
+            try:
+                with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(stderr):
+                    args = parser.parse_args(argv)
+            except SystemExit:
+                raise SkillError(stderr.getvalue().strip().splitlines()[-1] if stderr.getvalue().strip() else "参数错误")
+            if args.command in (None, "serve", "watch"):
+                raise SkillError(f"不支持的命令: {line}")
+            result = run_command(parser, args)
+            response.update(ok=not _failed(result), result=result)
+        except SkillError as e:
+            response.update(ok=False, error=str(e))
+        except Exception as e:  # 单条命令出错不影响后续命令
+            response.update(ok=False, error=f"{type(e).__name__}: {e}")
+        except SystemExit as e:
+            response.update(ok=False, error=f"命令退出: {e.code}")
+        print(json.dumps(response, ensure_ascii=False), flush=True)
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if args.command == "serve":
+        serve(parser)
+        return
+    
+    OUTPUT["json"] = args.json
+    try:
+        result = run_command(parser, args)
+    except SkillError as e:
+        if args.json:
+            print(json.dumps({"error": str(e)}, ensure_ascii=False))
+        else:
+            print(f"❌ {e}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    if _failed(result):
+        sys.exit(1)
 
 
 if __name__ == "__main__":